@@ -883,8 +883,8 @@ def get_new_id(prefix, folder, check_list=None):
     raise IOError
 
 
-def save_data(data, _id, path, do_pickle=True, silent=False):
-    """ Save data to a diskfile """
+def save_data(data, _id, path, do_pickle=True, silent=False) -> bool:
+    """ Save data to a diskfile, returns if it was saved """
     if not silent:
         logging.debug("[%s] Saving data for %s in %s", misc.caller_name(), _id, path)
     path = os.path.join(path, _id)
@@ -897,7 +897,7 @@ def save_data(data, _id, path, do_pickle=True, silent=False):
                     pickle.dump(data, data_file, protocol=pickle.HIGHEST_PROTOCOL)
                 else:
                     data_file.write(data)
-            break
+            return True
         except:
             if silent:
                 # This can happen, probably a removed folder
@@ -908,6 +908,7 @@ def save_data(data, _id, path, do_pickle=True, silent=False):
             else:
                 # Wait a tiny bit before trying again
                 time.sleep(0.1)
+    return False
 
 
 def load_data(data_id, path, remove=True, do_pickle=True, silent=False):
@@ -29,7 +29,7 @@ import json
 import cherrypy
 import locale
 from threading import Thread
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Optional
 
 import sabnzbd
 from sabnzbd.constants import (
@@ -83,6 +83,11 @@ _MSG_NO_SUCH_CONFIG = "Config item does not exist"
 _MSG_CONFIG_LOCKED = "Configuration locked"
 _MSG_BAD_SERVER_PARMS = "Incorrect server settings"
 
+# The network checks of the dashboard are slow, so the results are reused for a while
+DASHBOARD_CHECKS_TTL = 60
+_DASHBOARD_CHECKS: Dict[str, Optional[str]] = {}
+_DASHBOARD_CHECKS_TIME = 0.0
+
 
 def api_handler(kwargs):
     """ API Dispatcher """
@@ -476,9 +481,10 @@ def _api_fullstatus(name, output, kwargs):
 
 
 def _api_history(name, output, kwargs):
-    """ API: accepts output, value(=nzo_id), start, limit, search, nzo_ids """
+    """ API: accepts output, value(=nzo_id), start, limit, search, nzo_ids, last_nzo_id """
     value = kwargs.get("value", "")
     start = int_conv(kwargs.get("start"))
+    last_nzo_id = kwargs.get("last_nzo_id")
     limit = int_conv(kwargs.get("limit"))
     last_history_update = int_conv(kwargs.get("last_history_update", 0))
     search = kwargs.get("search")
@@ -527,7 +533,13 @@ def _api_history(name, output, kwargs):
             to_units(day),
         )
         history["slots"], fetched_items, history["noofslots"] = build_history(
-            start=start, limit=limit, search=search, failed_only=failed_only, categories=categories, nzo_ids=nzo_ids
+            start=start,
+            limit=limit,
+            search=search,
+            failed_only=failed_only,
+            categories=categories,
+            nzo_ids=nzo_ids,
+            last_nzo_id=last_nzo_id,
         )
         history["last_history_update"] = sabnzbd.LAST_HISTORY_UPDATE
         history["version"] = sabnzbd.__version__
@@ -1178,6 +1190,22 @@ def handle_cat_api(output, kwargs):
     return name
 
 
+def dashboard_checks() -> Dict[str, Optional[str]]:
+    """ Connection information for the dashboard, checked at most once every DASHBOARD_CHECKS_TTL seconds """
+    global _DASHBOARD_CHECKS, _DASHBOARD_CHECKS_TIME
+    if time.time() - _DASHBOARD_CHECKS_TIME > DASHBOARD_CHECKS_TTL:
+        checks = {"localipv4": localipv4(), "publicipv4": publicipv4(), "ipv6": ipv6()}
+        # Dashboard: DNS-check
+        try:
+            addresslookup(cfg.selftest_host())
+            checks["dnslookup"] = "OK"
+        except:
+            checks["dnslookup"] = None
+        _DASHBOARD_CHECKS = checks
+        _DASHBOARD_CHECKS_TIME = time.time()
+    return _DASHBOARD_CHECKS
+
+
 def build_status(skip_dashboard=False, output=None):
     # build up header full of basic information
     info = build_header(trans_functions=not output)
@@ -1203,17 +1231,18 @@ def build_status(skip_dashboard=False, output=None):
     # Dashboard: Measured download-speed
     info["internetbandwidth"] = sabnzbd.INTERNET_BANDWIDTH
 
+    # Load of the download pipeline
+    info["decoderqueue"] = sabnzbd.Decoder.decoder_queue.qsize()
+    info["assemblerqueue"] = sabnzbd.Assembler.queue_size()
+    info["inspectorqueue"] = sabnzbd.Assembler.inspector.queue.qsize()
+    stall_count, stall_time = sabnzbd.Downloader.stall_info()
+    info["downloaderstalls"] = stall_count
+    info["downloaderstalltime"] = round(stall_time, 1)
+    info["postprocstages"] = sabnzbd.PostProcessor.stage_info()
+
     # Dashboard: Connection information
     if not int_conv(skip_dashboard):
-        info["localipv4"] = localipv4()
-        info["publicipv4"] = publicipv4()
-        info["ipv6"] = ipv6()
-        # Dashboard: DNS-check
-        try:
-            addresslookup(cfg.selftest_host())
-            info["dnslookup"] = "OK"
-        except:
-            info["dnslookup"] = None
+        info.update(dashboard_checks())
 
     info["servers"] = []
     servers = sorted(sabnzbd.Downloader.servers[:], key=lambda svr: "%02d%s" % (svr.priority, svr.displayname.lower()))
@@ -1273,6 +1302,8 @@ def build_status(skip_dashboard=False, output=None):
                 "serverpriority": server.priority,
                 "serveroptional": server.optional,
                 "serverbps": to_units(sabnzbd.BPSMeter.server_bps.get(server.id, 0)),
+                "serverconnectlatency": int(server.connect_latency * 1000),
+                "serverloginlatency": int(server.login_latency * 1000),
             }
             info["servers"].append(server_info)
         else:
@@ -1641,6 +1672,9 @@ def build_header(webdir="", output=None, trans_functions=True):
     header["cache_art"] = str(anfo.article_sum)
     header["cache_size"] = to_units(anfo.cache_size, "B")
     header["cache_max"] = str(anfo.cache_limit)
+    header["cache_hits"] = str(anfo.hits)
+    header["cache_misses"] = str(anfo.misses)
+    header["cache_spills"] = str(anfo.spills)
 
     return header
 
@@ -1683,8 +1717,10 @@ def build_queue_header(search=None, nzo_ids=None, start=0, limit=0, output=None)
     return header, qnfo.list, bytespersec, qnfo.q_fullsize, qnfo.bytes_left_previous_page
 
 
-def build_history(start=0, limit=0, search=None, failed_only=0, categories=None, nzo_ids=None):
-    """Combine the jobs still in post-processing and the database history"""
+def build_history(start=0, limit=0, search=None, failed_only=0, categories=None, nzo_ids=None, last_nzo_id=None):
+    """Combine the jobs still in post-processing and the database history.
+    With `last_nzo_id` the page starts after that job and only contains database history.
+    """
     if not limit:
         limit = 1000000
 
@@ -1708,7 +1744,11 @@ def build_history(start=0, limit=0, search=None, failed_only=0, categories=None,
 
     # Multi-page support for postproc items
     postproc_queue_size = len(postproc_queue)
-    if start > postproc_queue_size:
+    if last_nzo_id:
+        # Postproc items are always on the first page
+        postproc_queue = []
+        database_history_limit = limit
+    elif start > postproc_queue_size:
         # On a page where we shouldn't show postproc items
         postproc_queue = []
         database_history_limit = limit
@@ -1741,7 +1781,7 @@ def build_history(start=0, limit=0, search=None, failed_only=0, categories=None,
         items = []
     else:
         items, fetched_items, total_items = history_db.fetch_history(
-            database_history_start, database_history_limit, search, failed_only, categories, nzo_ids
+            database_history_start, database_history_limit, search, failed_only, categories, nzo_ids, last_nzo_id
         )
 
     # Reverse the queue to add items to the top (faster than insert)
@@ -19,20 +19,137 @@
 sabnzbd.articlecache - Article cache handling
 """
 
+import os
 import logging
 import threading
 import struct
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import sabnzbd
 from sabnzbd.decorators import synchronized
-from sabnzbd.constants import GIGI, ANFO, MEBI, LIMIT_DECODE_QUEUE, MIN_DECODE_QUEUE
-from sabnzbd.nzbstuff import Article
+from sabnzbd.constants import (
+    GIGI,
+    ANFO,
+    MEBI,
+    LIMIT_DECODE_QUEUE,
+    MIN_DECODE_QUEUE,
+    SPILL_SEGMENT_SIZE,
+)
+from sabnzbd.filesystem import remove_file
+from sabnzbd.nzbstuff import Article, NzbFile, NZO_LOCK
 
-# Operations on the article table are handled via try/except.
 # The counters need to be made atomic to ensure consistency.
 ARTICLE_COUNTER_LOCK = threading.RLock()
 
+# The article table and the index per file have to stay the same
+ARTICLE_TABLE_LOCK = threading.RLock()
+
+
+class ArticleSpill:
+    """Append-only storage of the articles of a job that didn't fit in the cache.
+    Articles are appended to a few large segment files instead of a file per article,
+    a segment is removed as soon as all its articles are loaded or purged.
+    The index is saved together with the job, so the data survives a restart.
+    """
+
+    def __init__(self):
+        self.index: Dict[Article, Tuple[int, int, int]] = {}  # Segment, offset and size of each article
+        self.segments: Dict[int, int] = {}  # Number of stored articles in each segment
+        self.segment = 0
+        self.segment_size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def segment_path(folder: str, segment: int) -> str:
+        return os.path.join(folder, "SABnzbd_spill_%d" % segment)
+
+    def save(self, article: Article, data: bytes, folder: str) -> Tuple[int, int, int]:
+        with self.lock:
+            if self.segment_size >= SPILL_SEGMENT_SIZE:
+                self.segment += 1
+                self.segment_size = 0
+
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(self.segment_path(folder, self.segment), "ab") as segment_file:
+                segment_file.write(data)
+
+            location = self.index[article] = (self.segment, self.segment_size, len(data))
+            self.segments[self.segment] = self.segments.get(self.segment, 0) + 1
+            self.segment_size += len(data)
+        return location
+
+    def restore(self, article: Article, location: Tuple[int, int, int]):
+        """ Add an article that was saved after the index was saved """
+        with self.lock:
+            if article in self.index:
+                return
+            segment, offset, size = location
+            self.index[article] = location
+            self.segments[segment] = self.segments.get(segment, 0) + 1
+            if segment > self.segment or (segment == self.segment and offset + size > self.segment_size):
+                self.segment = segment
+                self.segment_size = offset + size
+
+    def load(self, article: Article, folder: str) -> Optional[bytes]:
+        with self.lock:
+            try:
+                segment, offset, size = self.index[article]
+            except KeyError:
+                return None
+            try:
+                with open(self.segment_path(folder, segment), "rb") as segment_file:
+                    segment_file.seek(offset)
+                    data = segment_file.read(size)
+            except OSError:
+                logging.info("Failed to load %s from %s", article, self.segment_path(folder, segment), exc_info=True)
+                data = None
+            self.__release(article, folder)
+        return data
+
+    def purge(self, articles: List[Article], folder: str):
+        with self.lock:
+            for article in articles:
+                if article in self.index:
+                    self.__release(article, folder)
+
+    def __release(self, article: Article, folder: str):
+        """ Remove the article from the index and reclaim the segment when it is no longer used """
+        segment = self.index.pop(article)[0]
+        self.segments[segment] -= 1
+        if not self.segments[segment]:
+            del self.segments[segment]
+            try:
+                remove_file(self.segment_path(folder, segment))
+            except OSError:
+                # The job folder could already be removed
+                pass
+            if segment == self.segment:
+                # Start over in an empty file
+                self.segment_size = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        """ Save to pickle file, the lock can't be saved """
+        return self.index, self.segments, self.segment, self.segment_size
+
+    def __setstate__(self, state):
+        self.index, self.segments, self.segment, self.segment_size = state
+        self.lock = threading.Lock()
+
+
+def assembly_distance(nzf: NzbFile) -> int:
+    """Number of articles of the file that still have to be downloaded,
+    the more are left the later the cached articles will be assembled
+    """
+    articles_left = len(nzf.articles)
+    if nzf.table:
+        articles_left += len(nzf.table)
+    return articles_left
+
 
 class ArticleCache:
     def __init__(self):
@@ -40,6 +157,12 @@ class ArticleCache:
         self.__cache_limit = 0
         self.__cache_size = 0
         self.__article_table: Dict[Article, bytes] = {}  # Dict of buffered articles
+        self.__file_table: Dict[NzbFile, OrderedDict] = {}  # Buffered articles per file, in order of arrival
+
+        # Statistics to tune the cache size
+        self.__hits = 0  # Articles loaded from memory
+        self.__misses = 0  # Articles loaded from disk
+        self.__spills = 0  # Articles that didn't fit in memory
 
         # Limit for the decoder is based on the total available cache
         # so it can be larger on memory-rich systems
@@ -52,7 +175,14 @@ class ArticleCache:
             self.__cache_upper_limit = 4 * GIGI
 
     def cache_info(self):
-        return ANFO(len(self.__article_table), abs(self.__cache_size), self.__cache_limit_org)
+        return ANFO(
+            len(self.__article_table),
+            abs(self.__cache_size),
+            self.__cache_limit_org,
+            self.__hits,
+            self.__misses,
+            self.__spills,
+        )
 
     def new_limit(self, limit: int):
         """ Called when cache limit changes """
@@ -105,11 +235,22 @@ class ArticleCache:
             self.reserve_space(data_size)
             if self.space_left():
                 # Add new article to the cache
-                self.__article_table[article] = data
-            else:
-                # Return the space and save to disk
-                self.free_reserved_space(data_size)
-                self.__flush_article_to_disk(article, data)
+                self.__add_to_table(article, data)
+                return
+
+            # Rather save an article that will be assembled later than this one
+            victim = self.__eviction_candidate(article.nzf, data_size)
+            if victim:
+                victim_data = self.__pop_from_table(victim)
+                if victim_data:
+                    self.free_reserved_space(len(victim_data))
+                    self.__add_to_table(article, data)
+                    self.__flush_article_to_disk(victim, victim_data)
+                    return
+
+            # Return the space and save to disk
+            self.free_reserved_space(data_size)
+            self.__flush_article_to_disk(article, data)
         else:
             # No data saved in memory, direct to disk
             self.__flush_article_to_disk(article, data)
@@ -120,16 +261,22 @@ class ArticleCache:
         nzo = article.nzf.nzo
 
         if article in self.__article_table:
-            try:
-                data = self.__article_table.pop(article)
-                self.free_reserved_space(len(data))
-            except KeyError:
+            data = self.__pop_from_table(article)
+            if data is None:
                 # Could fail due the article already being deleted by purge_articles, for example
                 # when post-processing deletes the job while delayed articles still come in
                 logging.debug("Failed to load %s from cache, probably already deleted", article)
                 return data
+            self.free_reserved_space(len(data))
+            self.__hits += 1
+        elif nzo.spill and article in nzo.spill.index:
+            data = nzo.spill.load(article, nzo.admin_path)
+            nzo.journal.add(nzo.journal.UNSPILL, article.nzf.nzf_id, article.article)
+            self.__misses += 1
         elif article.art_id:
+            # Stored by an older version, in a file per article
             data = sabnzbd.load_data(article.art_id, nzo.admin_path, remove=True, do_pickle=False, silent=True)
+            self.__misses += 1
         nzo.remove_saved_article(article)
         return data
 
@@ -137,29 +284,78 @@ class ArticleCache:
         logging.debug("Saving %s cached articles to disk", len(self.__article_table))
         self.__cache_size = 0
         while self.__article_table:
-            try:
-                article, data = self.__article_table.popitem()
-                self.__flush_article_to_disk(article, data)
-            except KeyError:
-                # Could fail if already deleted by purge_articles or load_data
-                logging.debug("Failed to flush item from cache, probably already deleted or written to disk")
+            with ARTICLE_TABLE_LOCK:
+                try:
+                    article, data = self.__article_table.popitem()
+                    self.__remove_from_file_table(article)
+                except KeyError:
+                    # Could fail if already deleted by purge_articles or load_data
+                    logging.debug("Failed to flush item from cache, probably already deleted or written to disk")
+                    continue
+            self.__flush_article_to_disk(article, data)
 
     def purge_articles(self, articles: List[Article]):
         """ Remove all saved articles, from memory and disk """
         logging.debug("Purging %s articles from the cache/disk", len(articles))
+        if articles and articles[0].nzf.nzo.spill:
+            nzo = articles[0].nzf.nzo
+            nzo.spill.purge(articles, nzo.admin_path)
         for article in articles:
             if article in self.__article_table:
-                try:
-                    data = self.__article_table.pop(article)
-                    self.free_reserved_space(len(data))
-                except KeyError:
+                data = self.__pop_from_table(article)
+                if data is None:
                     # Could fail if already deleted by flush_articles or load_data
                     logging.debug("Failed to flush %s from cache, probably already deleted or written to disk", article)
+                else:
+                    self.free_reserved_space(len(data))
             elif article.art_id:
                 sabnzbd.remove_data(article.art_id, article.nzf.nzo.admin_path)
 
-    @staticmethod
-    def __flush_article_to_disk(article: Article, data):
+    def __add_to_table(self, article: Article, data: bytes):
+        with ARTICLE_TABLE_LOCK:
+            self.__article_table[article] = data
+            if article.nzf not in self.__file_table:
+                self.__file_table[article.nzf] = OrderedDict()
+            self.__file_table[article.nzf][article] = None
+
+    def __pop_from_table(self, article: Article) -> Optional[bytes]:
+        with ARTICLE_TABLE_LOCK:
+            data = self.__article_table.pop(article, None)
+            if data is not None:
+                self.__remove_from_file_table(article)
+            return data
+
+    def __remove_from_file_table(self, article: Article):
+        articles = self.__file_table.get(article.nzf)
+        if articles is not None:
+            articles.pop(article, None)
+            if not articles:
+                del self.__file_table[article.nzf]
+
+    def __eviction_candidate(self, nzf: NzbFile, data_size: int) -> Optional[Article]:
+        """Return the article at the highest offset of the file that still needs the most
+        articles, if that is more than the specified file and it frees at least data_size.
+        Articles without offset are only chosen when there is no other, the last received first.
+        """
+        furthest = None
+        distance = assembly_distance(nzf)
+        with ARTICLE_TABLE_LOCK:
+            for cached_nzf, articles in self.__file_table.items():
+                cached_distance = assembly_distance(cached_nzf)
+                if cached_distance > distance:
+                    furthest = cached_nzf
+                    distance = cached_distance
+            if furthest:
+                # Articles at the end of the file are written last
+                victim = max(
+                    reversed(self.__file_table[furthest]),
+                    key=lambda article: (article.data_begin is not None, article.data_begin or 0),
+                )
+                if len(self.__article_table[victim]) >= data_size:
+                    return victim
+        return None
+
+    def __flush_article_to_disk(self, article: Article, data):
         nzo = article.nzf.nzo
         if nzo.is_gone():
             # Don't store deleted jobs
@@ -167,4 +363,12 @@ class ArticleCache:
 
         # Save data, but don't complain when destination folder is missing
         # because this flush may come after completion of the NZO.
-        sabnzbd.save_data(data, article.get_art_id(), nzo.admin_path, do_pickle=False, silent=True)
+        with NZO_LOCK:
+            if not nzo.spill:
+                nzo.spill = ArticleSpill()
+        try:
+            location = nzo.spill.save(article, data, nzo.admin_path)
+            self.__spills += 1
+            nzo.journal.add(nzo.journal.SPILL, article.nzf.nzf_id, article.article, location, article.data_begin)
+        except OSError:
+            logging.debug("Failed to save %s to disk, probably folder is removed", article)
@@ -20,13 +20,14 @@ sabnzbd.assembler - threaded assembly/decoding of files
 """
 
 import os
+import errno
 import queue
 import logging
 import re
+import threading
 from threading import Thread
 from time import sleep
-import hashlib
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Dict
 
 import sabnzbd
 from sabnzbd.misc import get_all_passwords, match_str
@@ -36,22 +37,231 @@ import sabnzbd.cfg as cfg
 from sabnzbd.nzbstuff import NzbObject, NzbFile
 import sabnzbd.downloader
 import sabnzbd.par2file as par2file
+from sabnzbd.par2file import FileHasher
 import sabnzbd.utils.rarfile as rarfile
 
+# Size of the blocks that are read back to complete the hash of a file
+MD5_READ_SIZE = 1024 * 1024
+
+
+class Assembler:
+    """Implement thread-like coordinator for the assembler workers.
+    All writes to a file are done by the same worker, so they stay in order.
+    The slower checks of the finished files are done by a separate inspector.
+    """
 
-class Assembler(Thread):
     def __init__(self):
-        super().__init__()
-        self.queue: queue.Queue[Tuple[Optional[NzbObject], Optional[NzbFile], Optional[bool]]] = queue.Queue()
+        logging.debug("Initializing assemblers")
+        self.inspector = FileInspector()
+        self.assembler_workers: List[AssemblerWorker] = []
+        for _ in range(max(1, cfg.num_assemblers())):
+            self.assembler_workers.append(AssemblerWorker(self))
+
+        # Files are divided over the workers in turn, the first time they are queued
+        self.next_worker = 0
+        self.worker_lock = threading.Lock()
+
+        # Number of workers that still have to finish writing the files of an ended job
+        self.ending_jobs: Dict[str, int] = {}
+        self.ending_lock = threading.Lock()
+
+    def start(self):
+        for assembler_worker in self.assembler_workers:
+            assembler_worker.start()
+        self.inspector.start()
+
+    def is_alive(self) -> bool:
+        # Check all workers
+        for assembler_worker in self.assembler_workers:
+            if not assembler_worker.is_alive():
+                return False
+        return self.inspector.is_alive()
 
     def stop(self):
-        self.queue.put((None, None, None))
+        for assembler_worker in self.assembler_workers:
+            assembler_worker.queue.put((None, None, None))
+
+    def join(self):
+        # The inspector is only stopped after all the files are written
+        for assembler_worker in self.assembler_workers:
+            assembler_worker.join()
+        self.inspector.queue.put((None, None))
+        self.inspector.join()
 
     def process(self, nzo: NzbObject, nzf: Optional[NzbFile] = None, file_done: Optional[bool] = None):
-        self.queue.put((nzo, nzf, file_done))
+        if nzf:
+            if nzf.assembler_worker is None:
+                with self.worker_lock:
+                    # Another decoder could have queued the file in the meantime
+                    if nzf.assembler_worker is None:
+                        nzf.assembler_worker = self.next_worker
+                        self.next_worker = (self.next_worker + 1) % len(self.assembler_workers)
+            self.assembler_workers[nzf.assembler_worker].queue.put((nzo, nzf, file_done))
+        else:
+            # The job is ended, the workers have to finish its files first
+            with self.ending_lock:
+                self.ending_jobs[nzo.nzo_id] = self.ending_jobs.get(nzo.nzo_id, 0) + len(self.assembler_workers)
+            for assembler_worker in self.assembler_workers:
+                assembler_worker.queue.put((nzo, None, None))
+
+    def worker_done(self, nzo: NzbObject):
+        """ Called by each worker when it wrote all files of the ended job """
+        with self.ending_lock:
+            self.ending_jobs[nzo.nzo_id] -= 1
+            if self.ending_jobs[nzo.nzo_id]:
+                return
+            del self.ending_jobs[nzo.nzo_id]
+        self.inspector.process(nzo)
+
+    def queue_size(self) -> int:
+        return sum(assembler_worker.queue.qsize() for assembler_worker in self.assembler_workers)
+
+    def queue_full(self) -> bool:
+        # A single busy worker is enough to delay the downloader
+        for assembler_worker in self.assembler_workers:
+            if assembler_worker.queue.qsize() >= MAX_ASSEMBLER_QUEUE:
+                return True
+        return False
+
+    @staticmethod
+    def assemble(nzf: NzbFile, file_done: bool):
+        """Assemble a NZF from its table of articles
+        1) Partial write: write what we have
+        2) Nothing written before: write all
+        Articles are written at their own offset, so articles after a slow
+        or missing article don't have to wait in the cache.
+        """
+        # Files that were partly written by an older version can only be appended to
+        for article in nzf.decodetable:
+            if article.on_disk and article.data_size is None:
+                Assembler.assemble_in_order(nzf, file_done)
+                return
+
+        # New hash-object needed?
+        if not nzf.hasher:
+            nzf.hasher = FileHasher(get_slice_size(nzf))
+
+        fd = os.open(nzf.filepath, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            # Nothing written yet?
+            if not os.fstat(fd).st_size:
+                preallocate(fd, nzf.bytes)
+
+            previous = None
+            data_end = 0  # End of the data of the last written article
+            for article in nzf.decodetable:
+                # Break if deleted during writing
+                if nzf.nzo.status is Status.DELETED:
+                    break
+
+                # Without a (valid) yEnc part header, the data follows that of the previous article
+                if article.decoded and article.data_begin is None:
+                    if previous is None:
+                        article.data_begin = 0
+                    elif previous.data_begin is not None and previous.data_size is not None:
+                        article.data_begin = previous.data_begin + previous.data_size
+                    elif file_done:
+                        # The previous article is missing, so its size is unknown
+                        # Like when appending, the data is put after the last written article
+                        article.data_begin = data_end
+                previous = article
+
+                # Skip already written articles and articles that are not there (yet)
+                if article.on_disk:
+                    data_end = article.data_begin + article.data_size
+                    continue
+                if not article.decoded or article.data_begin is None:
+                    continue
+
+                data = sabnzbd.ArticleCache.load_article(article)
+                # Could be empty in case nzo was deleted
+                if data:
+                    write_at(fd, data, article.data_begin)
+                    article.data_size = len(data)
+                    article.on_disk = True
+                    data_end = article.data_begin + article.data_size
+
+                    # Most articles arrive in order, so they can be hashed right away
+                    if article.data_begin == nzf.hasher.offset:
+                        nzf.hasher.update(data)
+                else:
+                    logging.info("No data found when trying to write %s", article)
+
+            # Final steps
+            if file_done:
+                # Remove the part of the preallocated space that was not used
+                file_size = 0
+                for article in nzf.decodetable:
+                    if article.on_disk:
+                        file_size = max(file_size, article.data_begin + article.data_size)
+                os.ftruncate(fd, file_size)
+
+                # Hash the data that was written out of order
+                finish_hashes(fd, nzf.hasher, file_size)
+                save_hashes(nzf)
+        finally:
+            os.close(fd)
+
+        if file_done:
+            set_permissions(nzf.filepath)
+
+            # The articles are not needed anymore, the first is kept to compare files
+            nzf.decodetable = nzf.decodetable[:1]
+
+    @staticmethod
+    def assemble_in_order(nzf: NzbFile, file_done: bool):
+        """ Append the articles to the file, stopping at the first article that was not decoded """
+        # New hash-object needed?
+        if not nzf.hasher:
+            nzf.hasher = FileHasher(get_slice_size(nzf))
+
+        with open(nzf.filepath, "ab") as fout:
+            for article in nzf.decodetable:
+                # Break if deleted during writing
+                if nzf.nzo.status is Status.DELETED:
+                    break
+
+                # Skip already written articles
+                if article.on_disk:
+                    continue
+
+                # Write all decoded articles
+                if article.decoded:
+                    data = sabnzbd.ArticleCache.load_article(article)
+                    # Could be empty in case nzo was deleted
+                    if data:
+                        fout.write(data)
+                        nzf.hasher.update(data)
+                        article.on_disk = True
+                    else:
+                        logging.info("No data found when trying to write %s", article)
+                else:
+                    # If the article was not decoded but the file
+                    # is done, it is just a missing piece, so keep writing
+                    if file_done:
+                        continue
+                    else:
+                        # We reach an article that was not decoded
+                        break
+
+        # Final steps
+        if file_done:
+            set_permissions(nzf.filepath)
+            nzf.hasher.finish()
+            save_hashes(nzf)
+
+            # The articles are not needed anymore, the first is kept to compare files
+            nzf.decodetable = nzf.decodetable[:1]
+
 
-    def queue_full(self):
-        return self.queue.qsize() >= MAX_ASSEMBLER_QUEUE
+class AssemblerWorker(Thread):
+    """ Writes the articles of the files that are assigned to this worker """
+
+    def __init__(self, assembler: Assembler):
+        super().__init__()
+        logging.debug("Initializing assembler %s", self.name)
+        self.assembler = assembler
+        self.queue: queue.Queue[Tuple[Optional[NzbObject], Optional[NzbFile], Optional[bool]]] = queue.Queue()
 
     def run(self):
         while 1:
@@ -60,9 +270,12 @@ class Assembler(Thread):
             nzo = nzf = None
             nzo, nzf, file_done = self.queue.get()
             if not nzo:
-                logging.info("Shutting down")
+                logging.info("Shutting down assembler %s", self.name)
                 break
 
+            # The downloader might be waiting for room in the queue
+            sabnzbd.Downloader.capacity_available()
+
             if nzf:
                 # Check if enough disk space is free after each file is done
                 # If not enough space left, pause downloader and send email
@@ -101,7 +314,7 @@ class Assembler(Thread):
                 if filepath:
                     logging.debug("Decoding part of %s", filepath)
                     try:
-                        self.assemble(nzf, file_done)
+                        Assembler.assemble(nzf, file_done)
                     except IOError as err:
                         # If job was deleted or in active post-processing, ignore error
                         if not nzo.deleted and not nzo.is_gone() and not nzo.pp_active:
@@ -127,118 +340,177 @@ class Assembler(Thread):
                     logging.info("Decoding finished %s", filepath)
                     nzf.remove_admin()
 
-                    # Do rar-related processing
-                    if rarfile.is_rarfile(filepath):
-                        # Encryption and unwanted extension detection
-                        rar_encrypted, unwanted_file = check_encrypted_and_unwanted_files(nzo, filepath)
-                        if rar_encrypted:
-                            if cfg.pause_on_pwrar() == 1:
-                                logging.warning(
-                                    T(
-                                        'Paused job "%s" because of encrypted RAR file (if supplied, all passwords were tried)'
-                                    ),
-                                    nzo.final_name,
-                                )
-                                nzo.pause()
-                            else:
-                                logging.warning(
-                                    T(
-                                        'Aborted job "%s" because of encrypted RAR file (if supplied, all passwords were tried)'
-                                    ),
-                                    nzo.final_name,
-                                )
-                                nzo.fail_msg = T("Aborted, encryption detected")
-                                sabnzbd.NzbQueue.end_job(nzo)
-
-                        if unwanted_file:
-                            # Don't repeat the warning after a user override of an unwanted extension pause
-                            if nzo.unwanted_ext == 0:
-                                logging.warning(
-                                    T('In "%s" unwanted extension in RAR file. Unwanted file is %s '),
-                                    nzo.final_name,
-                                    unwanted_file,
-                                )
-                            logging.debug(T("Unwanted extension is in rar file %s"), filepath)
-                            if cfg.action_on_unwanted_extensions() == 1 and nzo.unwanted_ext == 0:
-                                logging.debug("Unwanted extension ... pausing")
-                                nzo.unwanted_ext = 1
-                                nzo.pause()
-                            if cfg.action_on_unwanted_extensions() == 2:
-                                logging.debug("Unwanted extension ... aborting")
-                                nzo.fail_msg = T("Aborted, unwanted extension detected")
-                                sabnzbd.NzbQueue.end_job(nzo)
-
-                        # Add to direct unpack
-                        nzo.add_to_direct_unpacker(nzf)
-
-                    elif par2file.is_parfile(filepath):
-                        # Parse par2 files, cloaked or not
-                        nzo.handle_par2(nzf, filepath)
-
-                    filter_output, reason = nzo_filtered_by_rating(nzo)
-                    if filter_output == 1:
-                        logging.warning(
-                            T('Paused job "%s" because of rating (%s)'),
-                            nzo.final_name,
-                            reason,
-                        )
-                        nzo.pause()
-                    elif filter_output == 2:
-                        logging.warning(
-                            T('Aborted job "%s" because of rating (%s)'),
-                            nzo.final_name,
-                            reason,
-                        )
-                        nzo.fail_msg = T("Aborted, rating filter matched (%s)") % reason
-                        sabnzbd.NzbQueue.end_job(nzo)
+                    # Slower checks are done separately, so they don't delay the writing
+                    self.assembler.inspector.process(nzo, nzf)
 
             else:
-                sabnzbd.NzbQueue.remove(nzo.nzo_id, cleanup=False)
-                sabnzbd.PostProcessor.process(nzo)
+                self.assembler.worker_done(nzo)
 
-    @staticmethod
-    def assemble(nzf: NzbFile, file_done: bool):
-        """Assemble a NZF from its table of articles
-        1) Partial write: write what we have
-        2) Nothing written before: write all
-        """
-        # New hash-object needed?
-        if not nzf.md5:
-            nzf.md5 = hashlib.md5()
 
-        with open(nzf.filepath, "ab") as fout:
-            for article in nzf.decodetable:
-                # Break if deleted during writing
-                if nzf.nzo.status is Status.DELETED:
-                    break
+class FileInspector(Thread):
+    """Checks the finished files for encryption, unwanted extensions and par2 information.
+    Files are handled in the order in which they were finished.
+    """
 
-                # Skip already written articles
-                if article.on_disk:
-                    continue
+    def __init__(self):
+        super().__init__()
+        self.queue: queue.Queue[Tuple[Optional[NzbObject], Optional[NzbFile]]] = queue.Queue()
 
-                # Write all decoded articles
-                if article.decoded:
-                    data = sabnzbd.ArticleCache.load_article(article)
-                    # Could be empty in case nzo was deleted
-                    if data:
-                        fout.write(data)
-                        nzf.md5.update(data)
-                        article.on_disk = True
-                    else:
-                        logging.info("No data found when trying to write %s", article)
-                else:
-                    # If the article was not decoded but the file
-                    # is done, it is just a missing piece, so keep writing
-                    if file_done:
-                        continue
-                    else:
-                        # We reach an article that was not decoded
-                        break
+    def process(self, nzo: NzbObject, nzf: Optional[NzbFile] = None):
+        self.queue.put((nzo, nzf))
 
-        # Final steps
-        if file_done:
-            set_permissions(nzf.filepath)
-            nzf.md5sum = nzf.md5.digest()
+    def run(self):
+        while 1:
+            # Set NzbObject and NzbFile objects to None so references
+            # from this thread do not keep the objects alive (see #1628)
+            nzo = nzf = None
+            nzo, nzf = self.queue.get()
+            if not nzo:
+                logging.info("Shutting down file inspector")
+                break
+
+            if nzf:
+                try:
+                    self.inspect(nzo, nzf)
+                except:
+                    logging.error(T("Fatal error in Assembler"), exc_info=True)
+                    break
+            else:
+                sabnzbd.NzbQueue.remove(nzo.nzo_id, cleanup=False)
+                sabnzbd.PostProcessor.process(nzo)
+
+    @staticmethod
+    def inspect(nzo: NzbObject, nzf: NzbFile):
+        """ Check a finished file, which can pause or abort the job """
+        filepath = nzf.filepath
+        # Do rar-related processing
+        if rarfile.is_rarfile(filepath):
+            # Encryption and unwanted extension detection
+            rar_encrypted, unwanted_file = check_encrypted_and_unwanted_files(nzo, filepath)
+            if rar_encrypted:
+                if cfg.pause_on_pwrar() == 1:
+                    logging.warning(
+                        T('Paused job "%s" because of encrypted RAR file (if supplied, all passwords were tried)'),
+                        nzo.final_name,
+                    )
+                    nzo.pause()
+                else:
+                    logging.warning(
+                        T('Aborted job "%s" because of encrypted RAR file (if supplied, all passwords were tried)'),
+                        nzo.final_name,
+                    )
+                    nzo.fail_msg = T("Aborted, encryption detected")
+                    sabnzbd.NzbQueue.end_job(nzo)
+
+            if unwanted_file:
+                # Don't repeat the warning after a user override of an unwanted extension pause
+                if nzo.unwanted_ext == 0:
+                    logging.warning(
+                        T('In "%s" unwanted extension in RAR file. Unwanted file is %s '),
+                        nzo.final_name,
+                        unwanted_file,
+                    )
+                logging.debug(T("Unwanted extension is in rar file %s"), filepath)
+                if cfg.action_on_unwanted_extensions() == 1 and nzo.unwanted_ext == 0:
+                    logging.debug("Unwanted extension ... pausing")
+                    nzo.unwanted_ext = 1
+                    nzo.pause()
+                if cfg.action_on_unwanted_extensions() == 2:
+                    logging.debug("Unwanted extension ... aborting")
+                    nzo.fail_msg = T("Aborted, unwanted extension detected")
+                    sabnzbd.NzbQueue.end_job(nzo)
+
+            # Add to direct unpack
+            nzo.add_to_direct_unpacker(nzf)
+
+        elif par2file.is_parfile(filepath):
+            # Parse par2 files, cloaked or not
+            nzo.handle_par2(nzf, filepath)
+
+        filter_output, reason = nzo_filtered_by_rating(nzo)
+        if filter_output == 1:
+            logging.warning(
+                T('Paused job "%s" because of rating (%s)'),
+                nzo.final_name,
+                reason,
+            )
+            nzo.pause()
+        elif filter_output == 2:
+            logging.warning(
+                T('Aborted job "%s" because of rating (%s)'),
+                nzo.final_name,
+                reason,
+            )
+            nzo.fail_msg = T("Aborted, rating filter matched (%s)") % reason
+            sabnzbd.NzbQueue.end_job(nzo)
+
+
+def preallocate(fd: int, size: int):
+    """Reserve the space for the file, so it doesn't get fragmented when
+    the articles are written out of order. Not all systems support this.
+    """
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError as err:
+            # Disk full should be handled like any other write error
+            if err.errno == errno.ENOSPC:
+                raise
+            logging.debug("Could not preallocate %s bytes: %s", size, err)
+
+
+def write_at(fd: int, data: bytes, offset: int):
+    """ Write the data at the offset, without moving the file position when possible """
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def get_slice_size(nzf: NzbFile) -> int:
+    """ Return the size of the par2 slices of the file, if the par2 file was already parsed """
+    slices = nzf.nzo.par2slices.get(nzf.filename)
+    if slices:
+        return slices[0]
+
+    # The name could still be obfuscated, but most jobs have only one par2 set
+    slice_sizes = set(slice_size for slice_size, _ in list(nzf.nzo.par2slices.values()))
+    if len(slice_sizes) == 1:
+        return slice_sizes.pop()
+    return 0
+
+
+def finish_hashes(fd: int, hasher: FileHasher, file_size: int):
+    """ Add the data that was not hashed yet, by reading it back from the file """
+    offset = hasher.offset
+    os.lseek(fd, offset, os.SEEK_SET)
+    while offset < file_size:
+        data = os.read(fd, min(MD5_READ_SIZE, file_size - offset))
+        if not data:
+            break
+        hasher.update(data)
+        offset += len(data)
+    hasher.finish()
+
+
+def save_hashes(nzf: NzbFile):
+    """ Store the results, so the file doesn't have to be read again during verification """
+    nzf.md5sum = nzf.hasher.md5.digest()
+    nzf.crc32 = nzf.hasher.crc32 & 0xFFFFFFFF
+    nzf.slice_checksums = nzf.hasher.slices
+    nzf.hasher = None
+
+    # The file could still be changed after this, for example by the user
+    try:
+        stat_result = os.stat(nzf.filepath)
+        nzf.hashed_stat = (stat_result.st_size, stat_result.st_mtime_ns)
+    except OSError:
+        nzf.hashed_stat = None
 
 
 def file_has_articles(nzf: NzbFile):
@@ -32,6 +32,7 @@ DAY = float(24 * 60 * 60)
 WEEK = DAY * 7
 DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
 BPS_LIST_MAX = 275
+BPS_UPDATE_INTERVAL = 0.1
 
 RE_DAY = re.compile(r"^\s*(\d+)[^:]*")
 RE_HHMM = re.compile(r"(\d+):(\d+)\s*$")
@@ -100,6 +101,7 @@ class BPSMeter:
         self.bps_list: List[int] = []
 
         self.server_bps: Dict[str, float] = {}
+        self.bytes_pending: Dict[str, int] = {}  # Received, but not yet added to the totals
         self.day_total: Dict[str, int] = {}
         self.week_total: Dict[str, int] = {}
         self.month_total: Dict[str, int] = {}
@@ -204,9 +206,35 @@ class BPSMeter:
             self.update()
         return res
 
+    def add_bytes(self, server: str, amount: int):
+        """Register "amount" bytes received from "server". They are added to the
+        totals and speeds on the next update, but the quota is checked directly.
+        """
+        try:
+            self.bytes_pending[server] += amount
+        except KeyError:
+            self.bytes_pending[server] = amount
+
+        # Quota check
+        if self.have_quota and self.quota_enabled:
+            self.left -= amount
+            if self.left <= 0.0:
+                if not sabnzbd.Downloader.paused:
+                    sabnzbd.Downloader.pause()
+                    logging.warning(T("Quota spent, pausing downloading"))
+
     def update(self, server: Optional[str] = None, amount: int = 0):
-        """ Update counters for "server" with "amount" bytes """
+        """Update counters for "server" with "amount" bytes and all bytes
+        registered by add_bytes. Without "server" this is only done
+        every BPS_UPDATE_INTERVAL seconds, so it can be called for every read.
+        """
+        if server:
+            self.add_bytes(server, amount)
+
         t = time.time()
+        if not server and t - self.last_update < BPS_UPDATE_INTERVAL:
+            return
+
         if t > self.end_of_day:
             # current day passed. get new end of day
             self.day_label = time.strftime("%Y-%m-%d")
@@ -221,53 +249,37 @@ class BPSMeter:
                 self.month_total = {}
                 self.end_of_month = next_month(t) - 1.0
 
-        if server:
-            if server not in self.day_total:
-                self.day_total[server] = 0
-            self.day_total[server] += amount
-
-            if server not in self.week_total:
-                self.week_total[server] = 0
-            self.week_total[server] += amount
-
-            if server not in self.month_total:
-                self.month_total[server] = 0
-            self.month_total[server] += amount
-
-            if server not in self.grand_total:
-                self.grand_total[server] = 0
-            self.grand_total[server] += amount
+        bytes_pending = self.bytes_pending
+        self.bytes_pending = {}
+        for server, amount in bytes_pending.items():
+            self.day_total[server] = self.day_total.get(server, 0) + amount
+            self.week_total[server] = self.week_total.get(server, 0) + amount
+            self.month_total[server] = self.month_total.get(server, 0) + amount
+            self.grand_total[server] = self.grand_total.get(server, 0) + amount
 
             if server not in self.timeline_total:
                 self.timeline_total[server] = {}
-            if self.day_label not in self.timeline_total[server]:
-                self.timeline_total[server][self.day_label] = 0
-            self.timeline_total[server][self.day_label] += amount
-
-            # Quota check
-            if self.have_quota and self.quota_enabled:
-                self.left -= amount
-                if self.left <= 0.0:
-                    if not sabnzbd.Downloader.paused:
-                        sabnzbd.Downloader.pause()
-                        logging.warning(T("Quota spent, pausing downloading"))
+            timeline = self.timeline_total[server]
+            timeline[self.day_label] = timeline.get(self.day_label, 0) + amount
+
+            if server not in self.server_bps:
+                self.server_bps[server] = 0.0
 
         # Speedometer
         try:
-            self.bps = (self.bps * (self.last_update - self.start_time) + amount) / (t - self.start_time)
+            self.bps = (self.bps * (self.last_update - self.start_time) + sum(bytes_pending.values())) / (
+                t - self.start_time
+            )
         except:
             self.bps = 0.0
             self.server_bps = {}
 
-        if server and server not in self.server_bps:
-            self.server_bps[server] = 0.0
-
         for server_to_update in self.server_bps:
             try:
-                # Only add data to the current server, update the rest to get correct average speed
+                # Only add data to the servers that received data, update the rest to get correct average speed
                 self.server_bps[server_to_update] = (
                     self.server_bps[server_to_update] * (self.last_update - self.start_time)
-                    + amount * (server_to_update == server)
+                    + bytes_pending.get(server_to_update, 0)
                 ) / (t - self.start_time)
             except:
                 self.server_bps[server_to_update] = 0.0
@@ -291,7 +291,14 @@ disable_key = OptionBool("misc", "disable_api_key", False, protect=True)
 no_penalties = OptionBool("misc", "no_penalties", False)
 x_frame_options = OptionBool("misc", "x_frame_options", True)
 require_modern_tls = OptionBool("misc", "require_modern_tls", False)
+native_par2_verify = OptionBool("misc", "native_par2_verify", True)
 num_decoders = OptionNumber("misc", "num_decoders", 3)
+num_assemblers = OptionNumber("misc", "num_assemblers", 2, 1, 32)
+pp_verify_workers = OptionNumber("misc", "pp_verify_workers", 2, 1, 16)
+pp_unpack_workers = OptionNumber("misc", "pp_unpack_workers", 1, 1, 16)
+pp_move_workers = OptionNumber("misc", "pp_move_workers", 1, 1, 16)
+pp_script_workers = OptionNumber("misc", "pp_script_workers", 1, 1, 16)
+num_dirscan_importers = OptionNumber("misc", "num_dirscan_importers", 4, 1, 32)
 
 # Text values
 rss_odd_titles = OptionList("misc", "rss_odd_titles", ["nzbindex.nl/", "nzbindex.com/", "nzbclub.com/"])
@@ -309,6 +316,8 @@ url_base = OptionStr("misc", "url_base", "/sabnzbd", validation=validate_strip_r
 host_whitelist = OptionList("misc", "host_whitelist", validation=all_lowercase)
 max_url_retries = OptionNumber("misc", "max_url_retries", 10, 1)
 downloader_sleep_time = OptionNumber("misc", "downloader_sleep_time", 10, 0)
+max_connecting = OptionNumber("misc", "max_connecting", 8, 0)
+warm_connections = OptionNumber("misc", "warm_connections", 0, 0)
 ssdp_broadcast_interval = OptionNumber("misc", "ssdp_broadcast_interval", 15, 1, 600)
 
 
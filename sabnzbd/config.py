@@ -415,6 +415,7 @@ class ConfigServer:
         self.quota = OptionStr(name, "quota", add=False)
         self.usage_at_start = OptionNumber(name, "usage_at_start", add=False)
         self.send_group = OptionBool(name, "send_group", False, add=False)
+        self.pipelining_requests = OptionNumber(name, "pipelining_requests", 1, 1, 20, add=False)
         self.priority = OptionNumber(name, "priority", 0, 0, 99, add=False)
         self.notes = OptionStr(name, "notes", add=False)
 
@@ -448,6 +449,7 @@ class ConfigServer:
             "quota",
             "usage_at_start",
             "priority",
+            "pipelining_requests",
             "notes",
         ):
             try:
@@ -483,6 +485,7 @@ class ConfigServer:
         output_dict["usage_at_start"] = self.usage_at_start()
         output_dict["send_group"] = self.send_group()
         output_dict["priority"] = self.priority()
+        output_dict["pipelining_requests"] = self.pipelining_requests()
         output_dict["notes"] = self.notes()
         return output_dict
 
@@ -35,7 +35,7 @@ PNFO = namedtuple(
 
 QNFO = namedtuple("QNFO", "bytes bytes_left bytes_left_previous_page list q_size_list q_fullsize")
 
-ANFO = namedtuple("ANFO", "article_sum cache_size cache_limit")
+ANFO = namedtuple("ANFO", "article_sum cache_size cache_limit hits misses spills")
 
 # Leave some space for "_UNPACK_" which we append during post-proc
 # Or, when extra ".1", ".2" etc. are added for identically named jobs
@@ -96,6 +96,10 @@ MIN_DECODE_QUEUE = 10
 LIMIT_DECODE_QUEUE = 100
 DIRECT_WRITE_TRIGGER = 35
 MAX_ASSEMBLER_QUEUE = 5
+SPILL_SEGMENT_SIZE = 64 * MEBI
+ARTICLE_BATCH = 100
+JOURNAL_FILE = "SABnzbd_journal"
+JOURNAL_COMPACT_SIZE = 10000
 
 REPAIR_PRIORITY = 3
 FORCE_PRIORITY = 2
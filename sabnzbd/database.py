@@ -26,7 +26,7 @@ import logging
 import sys
 import threading
 import sqlite3
-from typing import Union, Dict
+from typing import Union, Dict, List
 
 import sabnzbd
 import sabnzbd.cfg
@@ -39,6 +39,16 @@ from sabnzbd.filesystem import remove_file, clip_path
 
 DB_LOCK = threading.RLock()
 
+# Columns for lists of jobs, the script log is only loaded when it is requested
+HISTORY_LIST_COLUMNS = (
+    "id, completed, name, nzb_name, category, pp, script, report, url, status, nzo_id, storage, path, "
+    "script_line, download_time, postproc_time, stage_log, downloaded, completeness, fail_message, "
+    "url_info, bytes, meta, series, md5sum, password"
+)
+
+# Indexes for the history page, the duplicate checks and the history purge
+HISTORY_INDEXES = ("completed", "status", "category", "nzo_id", "md5sum", "series", "lower_name")
+
 
 def convert_search(search):
     """ Convert classic wildcard to SQL wildcard """
@@ -115,6 +125,16 @@ class HistoryDB:
             _ = self.execute("PRAGMA user_version = 2;") and self.execute(
                 'ALTER TABLE "history" ADD COLUMN password TEXT;'
             )
+        if version < 3:
+            # Add the lowercase name for the duplicate check, and the indexes
+            # Use "and" to stop when database has been reset due to corruption
+            _ = (
+                self.execute("PRAGMA user_version = 3;")
+                and self.execute('ALTER TABLE "history" ADD COLUMN lower_name TEXT;')
+                and self.execute('UPDATE "history" SET lower_name = LOWER(name);', save=True)
+                and self.create_indexes()
+                and self.enable_wal()
+            )
 
     def execute(self, command, args=(), save=False):
         """ Wrapper for executing SQL commands """
@@ -191,11 +211,35 @@ class HistoryDB:
             "meta" TEXT,
             "series" TEXT,
             "md5sum" TEXT,
-            "password" TEXT
+            "password" TEXT,
+            "lower_name" TEXT
         )
         """
         )
-        self.execute("PRAGMA user_version = 2;")
+        self.create_indexes()
+        self.enable_wal()
+        self.execute("PRAGMA user_version = 3;")
+
+    def create_indexes(self):
+        """ Create the indexes, if they don't exist yet """
+        for column in HISTORY_INDEXES:
+            if not self.execute('CREATE INDEX IF NOT EXISTS "history_%s" ON "history" ("%s");' % (column, column)):
+                return False
+        return True
+
+    def enable_wal(self):
+        """Readers don't block the writer and the other way around.
+        The mode is stored in the database, so it only has to be set once.
+        It's not supported for example on network shares, then the old mode is kept.
+        """
+        try:
+            self.c.execute("PRAGMA journal_mode = WAL;")
+            journal_mode = self.c.fetchone()["journal_mode"]
+        except sqlite3.Error:
+            journal_mode = None
+        if journal_mode != "wal":
+            logging.info("History database cannot use WAL journal mode, keeping %s", journal_mode)
+        return True
 
     def close(self):
         """ Close database connection """
@@ -285,37 +329,38 @@ class HistoryDB:
         self.execute(
             """INSERT INTO history (completed, name, nzb_name, category, pp, script, report,
             url, status, nzo_id, storage, path, script_log, script_line, download_time, postproc_time, stage_log,
-            downloaded, fail_message, url_info, bytes, series, md5sum, password)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            t,
+            downloaded, fail_message, url_info, bytes, series, md5sum, password, lower_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, LOWER(?))""",
+            t + (nzo.final_name,),
             save=True,
         )
         logging.info("Added job %s to history", nzo.final_name)
 
-    def fetch_history(self, start=None, limit=None, search=None, failed_only=0, categories=None, nzo_ids=None):
-        """ Return records for specified jobs """
-        command_args = [convert_search(search)]
-
-        post = ""
+    def fetch_history(
+        self, start=None, limit=None, search=None, failed_only=0, categories=None, nzo_ids=None, last_nzo_id=None
+    ):
+        """Return records for specified jobs.
+        Instead of an offset, the page can also start after job `last_nzo_id` of the previous page.
+        """
+        where = []
+        command_args = []
+        if search:
+            where.append("name LIKE ?")
+            command_args.append(convert_search(search))
         if categories:
             categories = ["*" if c == "Default" else c for c in categories]
-            post = " AND (CATEGORY = ?"
-            post += " OR CATEGORY = ? " * (len(categories) - 1)
-            post += ")"
+            where.append("category IN (%s)" % ", ".join("?" * len(categories)))
             command_args.extend(categories)
         if nzo_ids:
             nzo_ids = nzo_ids.split(",")
-            post += " AND (NZO_ID = ?"
-            post += " OR NZO_ID = ? " * (len(nzo_ids) - 1)
-            post += ")"
+            where.append("nzo_id IN (%s)" % ", ".join("?" * len(nzo_ids)))
             command_args.extend(nzo_ids)
         if failed_only:
-            post += " AND STATUS = ?"
+            where.append("status = ?")
             command_args.append(Status.FAILED)
 
-        cmd = "SELECT COUNT(*) FROM history WHERE name LIKE ?"
         total_items = -1
-        if self.execute(cmd + post, tuple(command_args)):
+        if self.execute("SELECT COUNT(*) FROM history" + build_where(where), tuple(command_args)):
             total_items = self.c.fetchone()["COUNT(*)"]
 
         if not start:
@@ -323,9 +368,21 @@ class HistoryDB:
         if not limit:
             limit = total_items
 
+        # Continue after the last job, which doesn't require the database to skip all previous pages
+        if last_nzo_id and self.execute("SELECT completed, id FROM history WHERE nzo_id = ?", (last_nzo_id,)):
+            last_item = self.c.fetchone()
+            if last_item:
+                # Written so the index on completed is used for the range
+                where.append("completed <= ? AND (completed < ? OR id < ?)")
+                command_args.extend([last_item["completed"], last_item["completed"], last_item["id"]])
+                start = 0
+
         command_args.extend([start, limit])
-        cmd = "SELECT * FROM history WHERE name LIKE ?"
-        if self.execute(cmd + post + " ORDER BY completed desc LIMIT ?, ?", tuple(command_args)):
+        cmd = "SELECT %s FROM history%s ORDER BY completed DESC, id DESC LIMIT ?, ?" % (
+            HISTORY_LIST_COLUMNS,
+            build_where(where),
+        )
+        if self.execute(cmd, tuple(command_args)):
             items = self.c.fetchall()
         else:
             items = []
@@ -354,7 +411,7 @@ class HistoryDB:
         """ Check whether this name or md5sum is already in History """
         total = 0
         if self.execute(
-            """SELECT COUNT(*) FROM History WHERE ( LOWER(name) = LOWER(?) OR md5sum = ? ) AND STATUS != ?""",
+            """SELECT COUNT(*) FROM History WHERE ( lower_name = LOWER(?) OR md5sum = ? ) AND STATUS != ?""",
             (name, md5sum, Status.FAILED),
         ):
             total = self.c.fetchone()["COUNT(*)"]
@@ -396,6 +453,12 @@ class HistoryDB:
                 pass
         return data
 
+    def get_active_paths(self):
+        """ Return the `incomplete` paths of the jobs that can be retried or are still queued """
+        if self.execute("""SELECT path FROM history WHERE status IN (?, ?)""", (Status.FAILED, Status.QUEUED)):
+            return [item["path"] for item in self.c.fetchall()]
+        return []
+
     def get_name(self, nzo_id):
         """ Return name of the job `nzo_id` """
         t = (nzo_id,)
@@ -425,7 +488,7 @@ class HistoryDB:
     def get_other(self, nzo_id):
         """ Return additional data for job `nzo_id` """
         t = (nzo_id,)
-        if self.execute("""SELECT * FROM history WHERE nzo_id = ?""", t):
+        if self.execute("""SELECT report, url, pp, script, category FROM history WHERE nzo_id = ?""", t):
             try:
                 item = self.c.fetchone()
                 return item["report"], item["url"], item["pp"], item["script"], item["category"]
@@ -504,6 +567,13 @@ def build_history_info(nzo, workdir_complete="", postproc_time=0, script_output=
     )
 
 
+def build_where(conditions: List[str]) -> str:
+    """ Combine the conditions for a query """
+    if conditions:
+        return " WHERE " + " AND ".join(conditions)
+    return ""
+
+
 def unpack_history_info(item: Union[Dict, sqlite3.Row]):
     """Expands the single line stage_log from the DB
     into a python dictionary for use in the history display
@@ -541,8 +611,8 @@ def unpack_history_info(item: Union[Dict, sqlite3.Row]):
         parsed_stage_log.sort(key=lambda stage_log: STAGES.get(stage_log["name"], 100))
         item["stage_log"] = parsed_stage_log
 
-    if item["script_log"]:
-        item["script_log"] = ""
+    # The script log is loaded separately, when it is requested
+    item["script_log"] = ""
     # The action line is only available for items in the postproc queue
     if "action_line" not in item:
         item["action_line"] = ""
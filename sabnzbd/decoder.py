@@ -22,6 +22,7 @@ sabnzbd.decoder - article decoder
 import logging
 import hashlib
 import queue
+import re
 from threading import Thread
 from typing import Tuple, List, Optional
 
@@ -44,6 +45,11 @@ try:
 except ImportError:
     SABYENC_ENABLED = False
 
+# The yEnc part header is at the start of the body, after the status line
+RE_YENC_PART_BEGIN = re.compile(rb"^=ypart.*?\bbegin=(\d+)", re.M)
+RE_YENC_SIZE = re.compile(rb"^=ybegin.*?\bsize=(\d+)", re.M)
+YENC_HEADER_SEARCH = 4096
+
 
 class CrcError(Exception):
     def __init__(self, needcrc, gotcrc, data):
@@ -124,6 +130,9 @@ class DecoderWorker(Thread):
                 logging.info("Shutting down decoder %s", self.name)
                 break
 
+            # The downloader might be waiting for room in the queue
+            sabnzbd.Downloader.capacity_available()
+
             nzo = article.nzf.nzo
             art_id = article.article
 
@@ -146,7 +155,7 @@ class DecoderWorker(Thread):
             except MemoryError:
                 logging.warning(T("Decoder failure: Out of memory"))
                 logging.info("Decoder-Queue: %d", self.decoder_queue.qsize())
-                logging.info("Cache: %d, %d, %d", *sabnzbd.ArticleCache.cache_info())
+                logging.info("Cache: %d, %d, %d, %d, %d, %d", *sabnzbd.ArticleCache.cache_info())
                 logging.info("Traceback: ", exc_info=True)
                 sabnzbd.Downloader.pause()
 
@@ -222,6 +231,9 @@ def decode(article: Article, raw_data: List[bytes]) -> bytes:
     # Mark as decoded
     article.decoded = True
 
+    # Where the data belongs in the file, so it can be written without waiting for the previous articles
+    article.data_begin = get_data_begin(raw_data, len(decoded_data), article.nzf.bytes)
+
     # Assume it is yenc
     article.nzf.type = "yenc"
 
@@ -242,6 +254,26 @@ def decode(article: Article, raw_data: List[bytes]) -> bytes:
     return decoded_data
 
 
+def get_data_begin(raw_data: List[bytes], data_size: int, file_size: int) -> Optional[int]:
+    """Return the offset of the data in the file, from the "=ypart begin=" header.
+    Single-part posts don't have this header, the offset is then unknown.
+    Offsets that put the data past the end of the file are not trusted either,
+    the size from the "=ybegin" header is used when available.
+    """
+    if raw_data:
+        match = RE_YENC_PART_BEGIN.search(raw_data[0], 0, YENC_HEADER_SEARCH)
+        if match:
+            # The yEnc offsets start at 1
+            data_begin = max(0, int(match.group(1)) - 1)
+            size_match = RE_YENC_SIZE.search(raw_data[0], 0, YENC_HEADER_SEARCH)
+            if size_match:
+                file_size = int(size_match.group(1))
+            if data_begin + data_size <= file_size:
+                return data_begin
+            logging.info("Ignoring yEnc offset %d, the file is only %d bytes", data_begin, file_size)
+    return None
+
+
 def search_new_server(article: Article) -> bool:
     """ Shorthand for searching new server or else increasing bad_articles """
     # Continue to the next one if we found new server
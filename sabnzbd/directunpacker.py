@@ -25,6 +25,7 @@ import subprocess
 import time
 import threading
 import logging
+import selectors
 from typing import Optional
 
 import sabnzbd
@@ -47,6 +48,18 @@ ACTIVE_UNPACKERS = []
 
 RAR_NR = re.compile(r"(.*?)(\.part(\d*).rar|\.r(\d*))$", re.IGNORECASE)
 
+# Output of unrar that means the job has to be handled by the regular post-processing
+UNRAR_ERROR_RE = re.compile(
+    r"ERROR: |Cannot create|in the encrypted file|CRC failed|checksum failed|checksum error|password is incorrect|"
+    r"Incorrect password|Write error|Cannot open|start extraction from a previous volume|Unexpected end of archive"
+)
+
+# Unrar waits for this prompt, without a newline, when it needs the next volume
+UNRAR_PROMPT = b"[C]ontinue, [Q]uit "
+
+# Maximum size of the output that is read at once
+UNRAR_READ_SIZE = 4096
+
 
 class DirectUnpacker(threading.Thread):
     def __init__(self, nzo: NzbObject):
@@ -171,54 +184,29 @@ class DirectUnpacker(threading.Thread):
         rarfiles = []
         extracted = []
         start_time = time.time()
+        done = False
 
-        # Need to read char-by-char because there's no newline after new-disk message
-        while 1:
-            # We need to lock, so we don't crash if unpacker is deleted while we read
-            with START_STOP_LOCK:
-                if not self.active_instance or not self.active_instance.stdout:
-                    break
-                char = self.active_instance.stdout.read(1)
-
-            if not char:
+        while not done:
+            # Read whatever is available, there's no newline after the new-disk message
+            data = self.read_output()
+            if not data:
                 # End of program
                 break
-            linebuf += char
-
-            # Continue if it's not a space or end of line
-            if char not in (b" ", b"\n"):
-                continue
+            linebuf += data
 
             # Handle whole lines
-            if char == b"\n":
+            while b"\n" in linebuf:
                 # When reaching end-of-line, we can safely convert and add to the log
-                linebuf_encoded = platform_btou(linebuf.strip())
-                unrar_log.append(linebuf_encoded)
-                linebuf = b""
+                line, linebuf = linebuf.split(b"\n", 1)
+                line = platform_btou(line.strip())
+                unrar_log.append(line)
 
                 # Error? Let PP-handle this job
-                if any(
-                    error_text in linebuf_encoded
-                    for error_text in (
-                        "ERROR: ",
-                        "Cannot create",
-                        "in the encrypted file",
-                        "CRC failed",
-                        "checksum failed",
-                        "You need to start extraction from a previous volume",
-                        "password is incorrect",
-                        "Incorrect password",
-                        "Write error",
-                        "checksum error",
-                        "Cannot open",
-                        "start extraction from a previous volume",
-                        "Unexpected end of archive",
-                    )
-                ):
-                    logging.info("Error in DirectUnpack of %s: %s", self.cur_setname, platform_btou(linebuf.strip()))
+                if UNRAR_ERROR_RE.search(line):
+                    logging.info("Error in DirectUnpack of %s: %s", self.cur_setname, line)
                     self.abort()
 
-                elif linebuf_encoded.startswith("All OK"):
+                elif line.startswith("All OK"):
                     # Did we reach the end?
                     # Stop timer and finish
                     self.unpack_time += time.time() - start_time
@@ -259,18 +247,21 @@ class DirectUnpacker(threading.Thread):
                         self.wait_for_next_volume()
                         self.create_unrar_instance()
                         start_time = time.time()
+                        # Anything left was from the previous instance
+                        linebuf = b""
                     else:
                         self.killed = True
-                        break
+                        done = True
+                    break
 
-                elif linebuf_encoded.startswith("Extracting from"):
+                elif line.startswith("Extracting from"):
                     # List files we used
-                    filename = re.search(EXTRACTFROM_RE, linebuf_encoded).group(1)
+                    filename = re.search(EXTRACTFROM_RE, line).group(1)
                     if filename not in rarfiles:
                         rarfiles.append(filename)
                 else:
                     # List files we extracted
-                    m = re.search(EXTRACTED_RE, linebuf_encoded)
+                    m = re.search(EXTRACTED_RE, line)
                     if m:
                         # In case of flat-unpack, UnRar still prints the whole path (?!)
                         unpacked_file = m.group(2)
@@ -278,7 +269,7 @@ class DirectUnpacker(threading.Thread):
                             unpacked_file = os.path.basename(unpacked_file)
                         extracted.append(real_path(self.unpack_dir_info[0], unpacked_file))
 
-            if linebuf.endswith(b"[C]ontinue, [Q]uit "):
+            if not done and linebuf.endswith(UNRAR_PROMPT):
                 # Stop timer
                 self.unpack_time += time.time() - start_time
 
@@ -330,6 +321,31 @@ class DirectUnpacker(threading.Thread):
         # Set the thread to killed so it never gets restarted by accident
         self.killed = True
 
+    def read_output(self) -> bytes:
+        """Read the output of unrar that is available. The lock is only held for
+        the read itself, so the unpacker can be aborted while unrar is busy.
+        """
+        with START_STOP_LOCK:
+            if not self.active_instance or not self.active_instance.stdout:
+                return b""
+            stdout = self.active_instance.stdout
+
+        # Wait for output, selectors don't support pipes on Windows
+        if not sabnzbd.WIN32:
+            try:
+                with selectors.DefaultSelector() as selector:
+                    selector.register(stdout, selectors.EVENT_READ)
+                    selector.select()
+            except (OSError, ValueError):
+                # Closed by abort
+                return b""
+
+        with START_STOP_LOCK:
+            if not self.active_instance or self.active_instance.stdout is not stdout or stdout.closed:
+                return b""
+            # Without buffering, this returns as soon as there is any output
+            return stdout.read(UNRAR_READ_SIZE)
+
     def have_next_volume(self):
         """Check if next volume of set is available, start
         from the end of the list where latest completed files are
@@ -23,12 +23,20 @@ import os
 import time
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 
 import sabnzbd
 from sabnzbd.constants import SCAN_FILE_NAME, VALID_ARCHIVES, VALID_NZB_FILES
 import sabnzbd.filesystem as filesystem
 import sabnzbd.config as config
 import sabnzbd.cfg as cfg
+from sabnzbd.utils.inotify import Inotify, inotify_available, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO
+
+# Attributes of a candidate must be unchanged for this long before it is imported
+DIRSCAN_STABLE_TIME = 1.0
+DIRSCAN_MIN_WAIT = 0.1
+DIRSCAN_INOTIFY_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
 
 
 def compare_stat_tuple(tup1, tup2):
@@ -63,6 +71,8 @@ class DirScanner(threading.Thread):
     valid NZB, NZB.GZ ZIP-with-only-NZB and even NZB.GZ named as .NZB
     Candidates which turned out wrong, will be remembered and skipped in
     subsequent scans, unless changed.
+    When available, inotify is used to be notified of new files directly,
+    the periodic scan remains as fallback for example for network shares.
     """
 
     def __init__(self):
@@ -79,12 +89,18 @@ class DirScanner(threading.Thread):
             # successfully processed ones that cannot be deleted
             self.suspected = {}  # Will hold name/attributes of suspected candidates
 
+        self.pending: Dict[str, Tuple[os.stat_result, float]] = {}  # Candidates waiting to become stable
+        self.importing: Set[str] = set()  # Candidates handed to the import workers
+        self.lock = threading.RLock()
+        self.import_pool = ThreadPoolExecutor(max_workers=cfg.num_dirscan_importers())
+        self.inotify: Optional[Inotify] = None
+
         self.loop_condition = threading.Condition(threading.Lock())
         self.shutdown = False
         self.error_reported = False  # Prevents multiple reporting of missing watched folder
         self.dirscan_dir = cfg.dirscan_dir.get_path()
         self.dirscan_speed = cfg.dirscan_speed() or None  # If set to 0, use None so the wait() is forever
-        self.busy = False
+        self.scan_requested = False
         cfg.dirscan_dir.callback(self.newdir)
         cfg.dirscan_speed.callback(self.newspeed)
 
@@ -99,32 +115,139 @@ class DirScanner(threading.Thread):
         """ We're notified of a scan speed change """
         # If set to 0, use None so the wait() is forever
         self.dirscan_speed = cfg.dirscan_speed() or None
+        self.wakeup()
+
+    def wakeup(self):
+        """ Interrupt the wait of the scanner loop """
         with self.loop_condition:
             self.loop_condition.notify()
+        if self.inotify:
+            self.inotify.wakeup()
 
     def stop(self):
         """ Stop the dir scanner """
         self.shutdown = True
-        with self.loop_condition:
-            self.loop_condition.notify()
+        self.wakeup()
 
     def save(self):
         """ Save dir scanner bookkeeping """
-        sabnzbd.save_admin((self.dirscan_dir, self.ignored, self.suspected), SCAN_FILE_NAME)
+        with self.lock:
+            sabnzbd.save_admin((self.dirscan_dir, self.ignored, self.suspected), SCAN_FILE_NAME)
 
     def run(self):
         """ Start the scanner """
         logging.info("Dirscanner starting up")
         self.shutdown = False
 
+        if inotify_available():
+            try:
+                self.inotify = Inotify()
+                logging.debug("Using inotify to monitor the Watched Folder")
+                # The folders are only watched after they were scanned
+                if self.dirscan_speed:
+                    self.scan_folders()
+            except OSError:
+                logging.info("Cannot use inotify, falling back to scanning the Watched Folder")
+                logging.debug("Traceback: ", exc_info=True)
+
         while not self.shutdown:
             # Wait to be woken up or triggered
+            self.wait(self.next_timeout())
+            if (self.dirscan_speed or self.pending or self.scan_requested) and not self.shutdown:
+                self.scan_requested = False
+                self.scan_folders()
+
+        if self.inotify:
+            inotify, self.inotify = self.inotify, None
+            inotify.close()
+        self.import_pool.shutdown(wait=True)
+
+    def wait(self, timeout: Optional[float]):
+        """ Wait for the timeout, a wakeup or changes in the watched folders """
+        if self.scan_requested or self.shutdown:
+            return
+        if self.inotify and self.dirscan_speed:
+            events = self.inotify.read_events(timeout)
+            if events:
+                logging.debug("Received %d inotify events for the Watched Folder", len(events))
+        else:
             with self.loop_condition:
-                self.loop_condition.wait(self.dirscan_speed)
-            if self.dirscan_speed and not self.shutdown:
-                self.scan()
+                # A request could have been made after the loop checked for it
+                if not self.scan_requested and not self.shutdown:
+                    self.loop_condition.wait(timeout)
+
+    def next_timeout(self) -> Optional[float]:
+        """ Time until the next scan, or the next stability check of a candidate """
+        timeout = self.dirscan_speed
+        if self.pending:
+            next_check = min(check_time for _, check_time in self.pending.values())
+            next_check = max(DIRSCAN_MIN_WAIT, next_check - time.time())
+            if timeout is None or next_check < timeout:
+                timeout = next_check
+        return timeout
+
+    def update_watches(self, folders: List[str]):
+        """ Watch the scanned folders for new files, stop watching removed ones """
+        if not self.inotify or not self.dirscan_speed:
+            return
+        watched = self.inotify.watched()
+        for folder in folders:
+            if folder not in watched:
+                self.inotify.add_watch(folder, DIRSCAN_INOTIFY_MASK)
+        for folder in watched:
+            if folder not in folders:
+                self.inotify.remove_watch(folder)
+
+    def check_stable(self, path: str, stat_tuple: os.stat_result, catdir: Optional[str]):
+        """Only when the attributes of the file did not change for a while,
+        the file is fully written to disk and can be imported.
+        Files are not waited for, instead their next check is scheduled.
+        """
+        now = time.time()
+        pending = self.pending.get(path)
+        if not pending:
+            logging.info("Trying to import %s", path)
+            self.pending[path] = (stat_tuple, now + DIRSCAN_STABLE_TIME)
+        elif now >= pending[1]:
+            if compare_stat_tuple(pending[0], stat_tuple):
+                del self.pending[path]
+                with self.lock:
+                    self.importing.add(path)
+                self.import_pool.submit(self.import_nzb, path, catdir, stat_tuple)
+            else:
+                # Still being written, check again later
+                self.pending[path] = (stat_tuple, now + DIRSCAN_STABLE_TIME)
+
+    def import_nzb(self, path: str, catdir: Optional[str], stat_tuple: os.stat_result):
+        """ Add the NZB's, runs in one of the import workers """
+        try:
+            res, _ = sabnzbd.add_nzbfile(path, catdir=catdir, keep=False)
+        except:
+            logging.info("Failed to import %s", path, exc_info=True)
+            res = -1
+
+        with self.lock:
+            self.importing.discard(path)
+            if res < 0:
+                # Retry later, for example when we can't read the file
+                self.suspected[path] = stat_tuple
+            elif res == 0:
+                self.error_reported = False
+            else:
+                self.ignored[path] = 1
 
     def scan(self):
+        """Scan the watched folder now. When called from another thread, like the API,
+        only a request is made, because the bookkeeping is only changed by the scanner.
+        """
+        if self.is_alive() and threading.current_thread() is not self:
+            with self.loop_condition:
+                self.scan_requested = True
+            self.wakeup()
+        else:
+            self.scan_folders()
+
+    def scan_folders(self):
         """ Do one scan of the watched folder """
 
         def run_dir(folder, catdir):
@@ -140,7 +263,7 @@ class DirScanner(threading.Thread):
                 if self.shutdown:
                     break
                 path = os.path.join(folder, filename)
-                if os.path.isdir(path) or path in self.ignored or filename[0] == ".":
+                if os.path.isdir(path) or path in self.ignored or path in self.importing or filename[0] == ".":
                     continue
 
                 if filesystem.get_ext(path) in VALID_NZB_FILES + VALID_ARCHIVES:
@@ -157,57 +280,41 @@ class DirScanner(threading.Thread):
                         # Suspected file still has the same attributes
                         continue
                     else:
-                        del self.suspected[path]
+                        with self.lock:
+                            self.suspected.pop(path, None)
 
                 if stat_tuple.st_size > 0:
-                    logging.info("Trying to import %s", path)
-
-                    # Wait until the attributes are stable for 1 second, but give up after 3 sec
-                    # This indicates that the file is fully written to disk
-                    for n in range(3):
-                        time.sleep(1.0)
-                        try:
-                            stat_tuple_tmp = os.stat(path)
-                        except OSError:
-                            continue
-                        if compare_stat_tuple(stat_tuple, stat_tuple_tmp):
-                            break
-                        stat_tuple = stat_tuple_tmp
-                    else:
-                        # Not stable
-                        continue
-
-                    # Add the NZB's
-                    res, _ = sabnzbd.add_nzbfile(path, catdir=catdir, keep=False)
-                    if res < 0:
-                        # Retry later, for example when we can't read the file
-                        self.suspected[path] = stat_tuple
-                    elif res == 0:
-                        self.error_reported = False
-                    else:
-                        self.ignored[path] = 1
+                    seen.add(path)
+                    self.check_stable(path, stat_tuple, catdir)
 
             # Remove files from the bookkeeping that are no longer on the disk
-            clean_file_list(self.ignored, folder, files)
-            clean_file_list(self.suspected, folder, files)
-
-        if not self.busy:
-            self.busy = True
-            dirscan_dir = self.dirscan_dir
-            if dirscan_dir and not sabnzbd.PAUSED_ALL:
-                run_dir(dirscan_dir, None)
-
-                try:
-                    dirscan_list = os.listdir(dirscan_dir)
-                except OSError:
-                    if not self.error_reported:
-                        logging.error(T("Cannot read Watched Folder %s"), filesystem.clip_path(dirscan_dir))
-                        self.error_reported = True
-                    dirscan_list = []
-
-                cats = config.get_categories()
-                for dd in dirscan_list:
-                    dpath = os.path.join(dirscan_dir, dd)
-                    if os.path.isdir(dpath) and dd.lower() in cats:
-                        run_dir(dpath, dd.lower())
-            self.busy = False
+            with self.lock:
+                clean_file_list(self.ignored, folder, files)
+                clean_file_list(self.suspected, folder, files)
+
+        seen = set()
+        dirscan_dir = self.dirscan_dir
+        if dirscan_dir and not sabnzbd.PAUSED_ALL:
+            folders = [dirscan_dir]
+            run_dir(dirscan_dir, None)
+
+            try:
+                dirscan_list = os.listdir(dirscan_dir)
+            except OSError:
+                if not self.error_reported:
+                    logging.error(T("Cannot read Watched Folder %s"), filesystem.clip_path(dirscan_dir))
+                    self.error_reported = True
+                dirscan_list = []
+
+            cats = config.get_categories()
+            for dd in dirscan_list:
+                dpath = os.path.join(dirscan_dir, dd)
+                if os.path.isdir(dpath) and dd.lower() in cats:
+                    folders.append(dpath)
+                    run_dir(dpath, dd.lower())
+            self.update_watches(folders)
+
+        # Forget candidates that disappeared or can no longer be scanned
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
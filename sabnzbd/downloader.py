@@ -20,22 +20,25 @@ sabnzbd.downloader - download engine
 """
 
 import time
-import select
+import selectors
 import logging
 from math import ceil
-from threading import Thread, RLock
+from threading import Thread, RLock, Event
 from nntplib import NNTPPermanentError
 import socket
+import ssl
 import random
 import sys
-from typing import List, Dict, Optional, Union
+from collections import deque
+from typing import List, Dict, Optional, Union, Tuple, Deque
 
 import sabnzbd
 from sabnzbd.decorators import synchronized, NzbQueueLocker, DOWNLOADER_CV
-from sabnzbd.newswrapper import NewsWrapper
+from sabnzbd.newswrapper import NewsWrapper, average_latency
 import sabnzbd.notifier
 import sabnzbd.config as config
 import sabnzbd.cfg as cfg
+from sabnzbd.constants import Status, FORCE_PRIORITY
 from sabnzbd.misc import from_units, nntp_to_msg, int_conv, get_server_addrinfo
 from sabnzbd.utils.happyeyeballs import happyeyeballs
 
@@ -51,9 +54,59 @@ _PENALTY_SHORT = 1  # Minimal penalty when no_penalties is set
 _PENALTY_VERYSHORT = 0.1  # Error 400 without cause clues
 
 
+# Seconds of data at the speed limit that can be downloaded at once
+_BANDWIDTH_BURST = 0.25
+
+# Part of the requests a server can handle at once that is selected from the queue in one go
+_ARTICLE_FETCH_PART = 4
+
 TIMER_LOCK = RLock()
 
 
+class TokenBucket:
+    """Rate limiter for the speed limit. Tokens are bytes that refill at the
+    set rate. Data is only read while tokens are available, the bucket can
+    go into debt because the size of a read is only known afterwards.
+    Reads are limited to the capacity, so the debt never takes longer than
+    the burst time to repay and throttled connections don't time out.
+    SSL connections always read a complete TLS record of at most 16KB."""
+
+    def __init__(self, rate: float = 0):
+        self.rate: float = 0
+        self.capacity: float = 0
+        self.tokens: float = 0
+        self.last_refill: float = time.time()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: float):
+        self.refill()
+        self.rate = rate
+        self.capacity = rate * _BANDWIDTH_BURST
+        self.tokens = min(self.tokens, self.capacity)
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def consume(self, amount: int):
+        self.tokens -= amount
+
+    def available(self) -> bool:
+        return self.tokens > 0
+
+    def read_size(self) -> int:
+        """ Maximum number of bytes to read at once """
+        return max(1, int(self.capacity))
+
+    def delay(self) -> float:
+        """ Seconds until data can be read again, 0 if that's possible now """
+        self.refill()
+        if self.tokens > 0 or not self.rate:
+            return 0
+        return -self.tokens / self.rate
+
+
 class Server:
     def __init__(
         self,
@@ -72,6 +125,7 @@ class Server:
         password=None,
         optional=False,
         retention=0,
+        pipelining_requests=1,
     ):
 
         self.id: str = server_id
@@ -89,6 +143,7 @@ class Server:
         self.optional: bool = optional
         self.retention: int = retention
         self.send_group: bool = send_group
+        self.pipelining_requests: int = pipelining_requests
 
         self.username: Optional[str] = username
         self.password: Optional[str] = password
@@ -102,9 +157,17 @@ class Server:
         self.warning: str = ""
         self.info: Optional[List] = None  # Will hold getaddrinfo() list
         self.ssl_info: str = ""  # Will hold the type and cipher of SSL connection
+        self.ssl_context: Optional[ssl.SSLContext] = None  # Shared by all connections, see get_ssl_context
+        self.ssl_context_settings: Optional[Tuple] = None
+        self.ssl_session: Optional[ssl.SSLSession] = None  # To resume the TLS session of previous connections
         self.request: bool = False  # True if a getaddrinfo() request is pending
         self.have_body: bool = True  # Assume server has "BODY", until proven otherwise
         self.have_stat: bool = True  # Assume server has "STAT", until proven otherwise
+        self.connect_latency: float = 0.0  # Average seconds to connect, including SSL handshake
+        self.login_latency: float = 0.0  # Average seconds until a connection is ready for requests
+
+        # Articles selected for this server, so the queue doesn't have to be searched for every request
+        self.article_queue: Deque[sabnzbd.nzbstuff.Article] = deque()
 
         for i in range(threads):
             self.idle_threads.append(NewsWrapper(self, i + 1))
@@ -146,12 +209,60 @@ class Server:
                     logging.debug("%s: No successful IP connection was possible", self.host)
         return ip
 
+    @property
+    def connecting(self) -> int:
+        """ Number of connections that are being set up, including the login """
+        return len([nw for nw in self.busy_threads if not nw.connected])
+
+    def get_ssl_context(self) -> ssl.SSLContext:
+        """Return the SSL context for connections to this server.
+        Only created again when the settings changed, which also
+        means the TLS session can no longer be resumed."""
+        settings = (self.ssl_verify, self.ssl_ciphers, cfg.require_modern_tls())
+        if not self.ssl_context or settings != self.ssl_context_settings:
+            ctx = ssl.create_default_context()
+
+            if cfg.require_modern_tls():
+                # We want a modern TLS (1.2 or higher), so we disallow older protocol versions (<= TLS 1.1)
+                ctx.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1
+
+            # Only verify hostname when we're strict
+            if self.ssl_verify < 2:
+                ctx.check_hostname = False
+            # Certificates optional
+            if self.ssl_verify == 0:
+                ctx.verify_mode = ssl.CERT_NONE
+
+            # Did the user set a custom cipher-string?
+            if self.ssl_ciphers:
+                # At their own risk, socket will error out in case it was invalid
+                ctx.set_ciphers(self.ssl_ciphers)
+
+            self.ssl_context = ctx
+            self.ssl_context_settings = settings
+            self.ssl_session = None
+        return self.ssl_context
+
+    @property
+    def fetch_limit(self) -> int:
+        """ Number of articles to select from the queue at once """
+        return max(1, self.threads * self.pipelining_requests // _ARTICLE_FETCH_PART)
+
+    def reset_article_queue(self):
+        """ Give the selected articles back, so other servers can get them """
+        while self.article_queue:
+            article = self.article_queue.popleft()
+            if article.fetcher is self:
+                article.fetcher = None
+                article.tries -= 1
+
     def stop(self):
         """Remove all connections from server"""
         for nw in self.idle_threads:
             sabnzbd.Downloader.remove_socket(nw)
             nw.hard_reset(send_quit=True)
         self.idle_threads = []
+        self.reset_article_queue()
 
     def request_info(self):
         """Launch async request to resolve server address.
@@ -191,6 +302,7 @@ class Downloader(Thread):
         # Used for reducing speed
         self.bandwidth_limit: int = 0
         self.bandwidth_perc: int = 0
+        self.bandwidth_bucket = TokenBucket()
         cfg.bandwidth_perc.callback(self.speed_set)
         cfg.bandwidth_max.callback(self.speed_set)
         self.speed_set()
@@ -211,7 +323,15 @@ class Downloader(Thread):
 
         self.force_disconnect: bool = False
 
-        self.read_fds: Dict[int, NewsWrapper] = {}
+        # Set by the decoder and assembler when they take work from their queues
+        self.capacity_event = Event()
+        self.stall_start: Optional[float] = None
+        self.stall_count: int = 0
+        self.stall_time: float = 0.0
+
+        # Sockets are registered and unregistered incrementally, so each wakeup
+        # only costs in the number of ready sockets (epoll/kqueue when available)
+        self.selector: selectors.BaseSelector = selectors.DefaultSelector()
 
         self.servers: List[Server] = []
         self.server_dict: Dict[str, Server] = {}  # For faster lookups, but is not updated later!
@@ -247,6 +367,7 @@ class Downloader(Thread):
             optional = srv.optional()
             retention = int(srv.retention() * 24 * 3600)  # days ==> seconds
             send_group = srv.send_group()
+            pipelining_requests = srv.pipelining_requests()
             create = True
 
         if oldserver:
@@ -276,6 +397,7 @@ class Downloader(Thread):
                 password,
                 optional,
                 retention,
+                pipelining_requests,
             )
             self.servers.append(server)
             self.server_dict[newserver] = server
@@ -283,14 +405,27 @@ class Downloader(Thread):
         # Update server-count
         self.server_nr = len(self.servers)
 
-    def add_socket(self, fileno: int, nw: NewsWrapper):
+    def add_socket(self, fileno: int, nw: NewsWrapper, events: int = selectors.EVENT_READ):
         """ Add a socket ready to be used to the list to be watched """
-        self.read_fds[fileno] = nw
+        try:
+            self.selector.register(fileno, events, nw)
+        except KeyError:
+            # Already registered, make sure it points to this connection
+            self.selector.modify(fileno, events, nw)
 
     def remove_socket(self, nw: NewsWrapper):
         """ Remove a socket to be watched """
         if nw.nntp:
-            self.read_fds.pop(nw.nntp.fileno, None)
+            try:
+                self.selector.unregister(nw.nntp.fileno)
+            except (KeyError, ValueError):
+                # Was not registered (anymore)
+                pass
+
+    @property
+    def socket_count(self) -> int:
+        """ Number of sockets currently being watched """
+        return len(self.selector.get_map())
 
     @NzbQueueLocker
     def set_paused_state(self, state: bool):
@@ -352,6 +487,7 @@ class Downloader(Thread):
                     self.bandwidth_perc = 100
         else:
             self.speed_set()
+        self.bandwidth_bucket.set_rate(self.bandwidth_limit)
         logging.info("Speed limit set to %s B/s", self.bandwidth_limit)
 
     def get_limit(self):
@@ -369,6 +505,7 @@ class Downloader(Thread):
         else:
             self.bandwidth_perc = 0
             self.bandwidth_limit = 0
+        self.bandwidth_bucket.set_rate(self.bandwidth_limit)
 
     def sleep_time_set(self):
         self.sleep_time = cfg.downloader_sleep_time() * 0.0001
@@ -408,6 +545,7 @@ class Downloader(Thread):
             # Not fully the same as the code below for optional servers
             server.bad_cons = 0
             server.active = False
+            server.reset_article_queue()
             self.plan_server(server, _PENALTY_TIMEOUT)
 
         # Optional and active server had too many problems.
@@ -415,6 +553,7 @@ class Downloader(Thread):
         if server.optional and server.active and (server.bad_cons / server.threads) > 3:
             server.bad_cons = 0
             server.active = False
+            server.reset_article_queue()
             logging.warning(T("Server %s will be ignored for %s minutes"), server.host, _PENALTY_TIMEOUT)
             self.plan_server(server, _PENALTY_TIMEOUT)
 
@@ -443,18 +582,52 @@ class Downloader(Thread):
         # Send to decoder-queue
         sabnzbd.Decoder.process(article, raw_data)
 
-        # See if we need to delay because the queues are full
-        logged = False
-        while not self.shutdown and (sabnzbd.Decoder.queue_full() or sabnzbd.Assembler.queue_full()):
-            if not logged:
-                # Only log once, to not waste any CPU-cycles
-                logging.debug(
-                    "Delaying - Decoder queue: %s - Assembler queue: %s",
-                    sabnzbd.Decoder.decoder_queue.qsize(),
-                    sabnzbd.Assembler.queue.qsize(),
-                )
-                logged = True
-            time.sleep(0.01)
+    @staticmethod
+    def downstream_full() -> bool:
+        """ Can the decoder and assembler keep up with the downloaded articles? """
+        return sabnzbd.Decoder.queue_full() or sabnzbd.Assembler.queue_full()
+
+    def capacity_available(self):
+        """ Called by the decoder and assembler to resume reading when the downloader is waiting for them """
+        if self.stall_start and not self.capacity_event.is_set():
+            self.capacity_event.set()
+
+    def start_stall(self, now: float):
+        """Stop reading the articles until the decoder and assembler have room for more.
+        The data waits in the socket buffers in the meantime.
+        """
+        if not self.stall_start:
+            self.stall_start = now
+            self.stall_count += 1
+            logging.debug(
+                "Delaying - Decoder queue: %s - Assembler queue: %s",
+                sabnzbd.Decoder.decoder_queue.qsize(),
+                sabnzbd.Assembler.queue_size(),
+            )
+
+    def wait_for_capacity(self, timeout: float):
+        """ Wait at most timeout seconds until the decoder and assembler have room for more articles """
+        self.capacity_event.clear()
+        # Check again, room could have become available before the event was cleared
+        if self.downstream_full():
+            self.capacity_event.wait(timeout)
+
+    def end_stall(self, now: float):
+        """ Resume reading, the time spent waiting doesn't count for the timeouts """
+        stalled = now - self.stall_start
+        self.stall_time += stalled
+        self.stall_start = None
+        for server in self.servers:
+            for nw in server.busy_threads:
+                if nw.timeout:
+                    nw.timeout += stalled
+
+    def stall_info(self) -> Tuple[int, float]:
+        """ Return the number of times and the total time the downloader waited for the decoder and assembler """
+        stall_time = self.stall_time
+        if self.stall_start:
+            stall_time += time.time() - self.stall_start
+        return self.stall_count, stall_time
 
     def run(self):
         # First check IPv6 connectivity
@@ -472,7 +645,14 @@ class Downloader(Thread):
         check_server_expiration()
 
         while 1:
+            # Stop reading the articles while the decoder or assembler can't keep up,
+            # but keep handling the timeouts and connections
             now = time.time()
+            stalled = not self.shutdown and not self.force_disconnect and self.downstream_full()
+            if stalled:
+                self.start_stall(now)
+            elif self.stall_start:
+                self.end_stall(now)
 
             # Set Article to None so references from this
             # thread do not keep the parent objects alive (see #1628)
@@ -484,7 +664,9 @@ class Downloader(Thread):
                     continue
 
                 for nw in server.busy_threads[:]:
-                    if (nw.nntp and nw.nntp.error_msg) or (nw.timeout and now > nw.timeout):
+                    # Connections that are not read because of the stall can't time out
+                    timed_out = nw.timeout and now > nw.timeout and not (stalled and nw.connected)
+                    if (nw.nntp and nw.nntp.error_msg) or timed_out:
                         if nw.nntp and nw.nntp.error_msg:
                             # Already showed error
                             self.__reset_nw(nw)
@@ -507,16 +689,17 @@ class Downloader(Thread):
                         # Restart pending, don't add new articles
                         continue
 
-                if (
-                    not server.idle_threads
-                    or server.restart
-                    or self.is_paused()
-                    or self.shutdown
-                    or self.paused_for_postproc
-                    or not server.active
-                ):
+                # Keep connections ready, so articles can be requested without waiting for the login
+                if cfg.warm_connections() and not server.restart and server.active and not self.shutdown:
+                    self.__warm_connections(server, now)
+
+                if server.restart or self.is_paused() or self.shutdown or self.paused_for_postproc or not server.active:
                     continue
 
+                # Only start a limited number of new connections at the same time
+                max_connecting = cfg.max_connecting()
+                connecting = server.connecting
+
                 for nw in server.idle_threads[:]:
                     if nw.timeout:
                         if now < nw.timeout:
@@ -531,19 +714,11 @@ class Downloader(Thread):
                             server.request_info()
                         break
 
-                    article = sabnzbd.NzbQueue.get_article(server, self.servers)
+                    if not nw.connected and max_connecting and connecting >= max_connecting:
+                        continue
 
+                    article = self.__get_article(server, now)
                     if not article:
-                        # Skip this server for 1 second
-                        server.next_article_search = now + 1
-                        break
-
-                    if server.retention and article.nzf.nzo.avg_stamp < now - server.retention:
-                        # Let's get rid of all the articles for this server at once
-                        logging.info("Job %s too old for %s, moving on", article.nzf.nzo.final_name, server.host)
-                        while article:
-                            self.decode(article, None)
-                            article = article.nzf.nzo.get_article(server, self.servers)
                         break
 
                     server.idle_threads.remove(nw)
@@ -554,17 +729,19 @@ class Downloader(Thread):
                     if nw.connected:
                         self.__request_article(nw)
                     else:
-                        try:
-                            logging.info("%s@%s: Initiating connection", nw.thrdnum, server.host)
-                            nw.init_connect()
-                        except:
-                            logging.error(
-                                T("Failed to initialize %s@%s with reason: %s"),
-                                nw.thrdnum,
-                                server.host,
-                                sys.exc_info()[1],
-                            )
-                            self.__reset_nw(nw, "failed to initialize", warn=True)
+                        connecting += 1
+                        self.__init_connect(nw)
+
+                # Request more articles on the busy connections, without waiting for the responses
+                if server.pipelining_requests > 1 and server.next_article_search <= now:
+                    for nw in server.busy_threads[:]:
+                        while nw.can_pipeline:
+                            article = self.__get_article(server, now)
+                            if not article:
+                                break
+                            self.__request_article(nw, article)
+                        if server.next_article_search > now:
+                            break
 
             if self.force_disconnect or self.shutdown:
                 for server in self.servers:
@@ -587,13 +764,24 @@ class Downloader(Thread):
                     logging.info("Shutting down")
                     break
 
-            # Use select to find sockets ready for reading/writing
-            readkeys = self.read_fds.keys()
-            if readkeys:
-                read, _, _ = select.select(readkeys, (), (), 1.0)
+            # Use the selector to find sockets ready for reading
+            socket_count = self.socket_count
+            if socket_count:
+                # When over the speed limit, wait for the bucket to refill (but keep handling timeouts)
+                delay = self.bandwidth_bucket.delay() if self.bandwidth_limit else 0
+                if stalled:
+                    # Only the connections that are still being set up are handled
+                    read = [key.data for key, _ in self.selector.select(0) if not key.data.connected]
+                    if not read:
+                        self.wait_for_capacity(0.1)
+                elif delay:
+                    time.sleep(min(delay, 0.1))
+                    read = []
+                else:
+                    read = [key.data for key, _ in self.selector.select(1.0)]
 
                 # Add a sleep if there are too few results compared to the number of active connections
-                if self.can_be_slowed and len(read) < 1 + len(readkeys) / 10:
+                if self.can_be_slowed and len(read) < 1 + socket_count / 10:
                     time.sleep(self.sleep_time)
 
                 # Need to initialize the check during first 20 seconds
@@ -629,13 +817,25 @@ class Downloader(Thread):
                 sabnzbd.BPSMeter.update()
                 continue
 
-            for selected in read:
-                nw = self.read_fds[selected]
+            for nw in read:
+                # Connect or SSL handshake still in progress
+                if nw.nntp and nw.nntp.connecting:
+                    nw.nntp.continue_connect()
+                    continue
+
                 article = nw.article
                 server = nw.server
 
+                # Out of bandwidth, the socket will be selected again when the bucket has refilled
+                # Data that was already received together with a pipelined response is always processed
+                if self.bandwidth_limit and not nw.pipeline_buffer and not self.bandwidth_bucket.available():
+                    continue
+
                 try:
-                    bytes_received, done, skip = nw.recv_chunk()
+                    if self.bandwidth_limit:
+                        bytes_received, done, skip = nw.recv_chunk(max_size=self.bandwidth_bucket.read_size())
+                    else:
+                        bytes_received, done, skip = nw.recv_chunk()
                 except:
                     bytes_received, done, skip = (0, False, False)
 
@@ -655,12 +855,8 @@ class Downloader(Thread):
                         pass
 
                     if self.bandwidth_limit:
-                        limit = self.bandwidth_limit
-                        if bytes_received + sabnzbd.BPSMeter.bps > limit:
-                            while sabnzbd.BPSMeter.bps > limit:
-                                time.sleep(0.01)
-                                sabnzbd.BPSMeter.update()
-                    sabnzbd.BPSMeter.update(server.id, bytes_received)
+                        self.bandwidth_bucket.consume(bytes_received)
+                    sabnzbd.BPSMeter.add_bytes(server.id, bytes_received)
 
                 if not done and nw.status_code != 222:
                     if not nw.connected or nw.status_code == 480:
@@ -741,6 +937,7 @@ class Downloader(Thread):
                             if block or (penalty and server.optional):
                                 if server.active:
                                     server.active = False
+                                    server.reset_article_queue()
                                     if penalty and (block or server.optional):
                                         self.plan_server(server, penalty)
                                 # Note that this will count towards the tries (max_art_tries) on this server!
@@ -758,7 +955,20 @@ class Downloader(Thread):
 
                         if nw.connected:
                             logging.info("Connecting %s@%s finished", nw.thrdnum, nw.server.host)
-                            self.__request_article(nw)
+                            server.login_latency = average_latency(
+                                server.login_latency, time.time() - nw.nntp.connect_start
+                            )
+                            if server.ssl and sabnzbd.CERTIFICATE_VALIDATION:
+                                nw.nntp.store_ssl_session()
+                            if nw.article:
+                                self.__request_article(nw)
+                            else:
+                                # Connection was opened in advance, wait for articles
+                                # The timeout of the login would otherwise keep it from being used
+                                nw.timeout = None
+                                server.busy_threads.remove(nw)
+                                server.idle_threads.append(nw)
+                                self.remove_socket(nw)
 
                     elif nw.status_code == 223:
                         done = True
@@ -804,9 +1014,17 @@ class Downloader(Thread):
 
                     # Reset connection for new activity
                     nw.soft_reset()
-                    server.busy_threads.remove(nw)
-                    server.idle_threads.append(nw)
-                    self.remove_socket(nw)
+                    if not nw.article:
+                        server.busy_threads.remove(nw)
+                        server.idle_threads.append(nw)
+                        self.remove_socket(nw)
+
+                # The response to the next pipelined request might already be received
+                if nw.pipeline_buffer and nw.article:
+                    read.append(nw)
+
+            # Add the received data to the totals and speed, only done periodically
+            sabnzbd.BPSMeter.update()
 
     def __reset_nw(
         self,
@@ -846,14 +1064,92 @@ class Downloader(Thread):
                 # Allow all servers to iterate over this nzo/nzf again
                 sabnzbd.NzbQueue.reset_try_lists(nw.article)
 
+        # Articles that were requested after the current one were never tried
+        for article in nw.pipeline:
+            sabnzbd.NzbQueue.reset_try_lists(article)
+
         # Reset connection object
         nw.hard_reset(wait, send_quit=send_quit)
 
         # Empty SSL info, it might change on next connect
         nw.server.ssl_info = ""
 
-    def __request_article(self, nw: NewsWrapper):
+    def __init_connect(self, nw: NewsWrapper):
         try:
+            logging.info("%s@%s: Initiating connection", nw.thrdnum, nw.server.host)
+            nw.init_connect()
+        except:
+            logging.error(
+                T("Failed to initialize %s@%s with reason: %s"),
+                nw.thrdnum,
+                nw.server.host,
+                sys.exc_info()[1],
+            )
+            self.__reset_nw(nw, "failed to initialize", warn=True)
+
+    def __warm_connections(self, server: Server, now: float):
+        """ Connect and login idle connections in advance while there are jobs in the queue """
+        if not server.info or sabnzbd.NzbQueue.is_empty():
+            return
+
+        ready = len(server.busy_threads) + len([nw for nw in server.idle_threads if nw.connected])
+        max_connecting = cfg.max_connecting()
+        connecting = server.connecting
+        for nw in server.idle_threads[:]:
+            if ready >= cfg.warm_connections() or (max_connecting and connecting >= max_connecting):
+                break
+            if nw.connected or (nw.timeout and now < nw.timeout):
+                continue
+
+            server.idle_threads.remove(nw)
+            server.busy_threads.append(nw)
+            ready += 1
+            connecting += 1
+            self.__init_connect(nw)
+
+    def __get_article(self, server: Server, now: float):
+        """ Get the next article for this server, or None if there's nothing to do """
+        while 1:
+            if not server.article_queue:
+                # Select a batch, so the queue is only searched once for multiple requests
+                server.article_queue.extend(sabnzbd.NzbQueue.get_articles(server, self.servers, server.fetch_limit))
+                if not server.article_queue:
+                    # Skip this server for 1 second
+                    server.next_article_search = now + 1
+                    return None
+
+            article = server.article_queue.popleft()
+            nzo = article.nzf.nzo
+
+            # The article could have been reset or its job removed or paused since it was selected
+            if article.fetcher is not server or article.nzf.deleted or nzo.is_gone():
+                continue
+            if nzo.status in (Status.PAUSED, Status.GRABBING) and nzo.priority != FORCE_PRIORITY:
+                article.fetcher = None
+                article.tries -= 1
+                continue
+
+            if server.retention and nzo.avg_stamp < now - server.retention:
+                # Let's get rid of all the articles for this server at once
+                logging.info("Job %s too old for %s, moving on", nzo.final_name, server.host)
+                articles = [article]
+                while articles:
+                    for article in articles:
+                        self.decode(article, None)
+                    articles = nzo.get_articles(server, self.servers, server.fetch_limit)
+                return None
+
+            return article
+
+    def __request_article(self, nw: NewsWrapper, article: Optional["sabnzbd.nzbstuff.Article"] = None):
+        try:
+            if article:
+                # Pipelined request, the socket is already being watched
+                if sabnzbd.LOG_ALL:
+                    logging.debug("Thread %s@%s: BODY %s (pipelined)", nw.thrdnum, nw.server.host, article.article)
+                nw.body(article)
+                return
+
             nzo = nw.article.nzf.nzo
             if nw.server.send_group and nzo.group != nw.group:
                 group = nzo.group
@@ -865,7 +1161,7 @@ class Downloader(Thread):
                     logging.debug("Thread %s@%s: BODY %s", nw.thrdnum, nw.server.host, nw.article.article)
                 nw.body()
             # Mark as ready to be read
-            self.read_fds[nw.nntp.fileno] = nw
+            self.add_socket(nw.nntp.fileno, nw)
         except socket.error as err:
             logging.info("Looks like server closed connection: %s", err)
             self.__reset_nw(nw, "server broke off connection", warn=True, send_quit=False)
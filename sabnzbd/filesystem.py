@@ -771,7 +771,7 @@ def cleanup_empty_directories(path: str):
 @synchronized(DIR_LOCK)
 def get_filepath(path: str, nzo, filename: str):
     """ Create unique filepath """
-    # This procedure is only used by the Assembler thread
+    # This procedure is only used by the assembler workers
     # It does no umask setting
     # It uses the dir_lock for the (rare) case that the
     # download_dir is equal to the complete_dir.
@@ -802,6 +802,8 @@ def get_filepath(path: str, nzo, filename: str):
         else:
             break
 
+    # Claim the name, another assembler worker could be looking for one too
+    open(fullpath, "ab").close()
     return fullpath
 
 
@@ -1338,6 +1338,8 @@ SPECIAL_BOOL_LIST = (
 )
 SPECIAL_VALUE_LIST = (
     "downloader_sleep_time",
+    "max_connecting",
+    "warm_connections",
     "size_limit",
     "movie_rename_limit",
     "nomedia_marker",
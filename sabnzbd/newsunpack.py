@@ -58,6 +58,7 @@ from sabnzbd.filesystem import (
 )
 from sabnzbd.nzbstuff import NzbObject, NzbFile
 from sabnzbd.sorting import SeriesSorter
+from sabnzbd.par2file import damaged_slices, verify_par2_set
 import sabnzbd.cfg as cfg
 from sabnzbd.constants import Status
 
@@ -75,6 +76,9 @@ SEVENZIP_RE = re.compile(r"\.7z$", re.I)
 SEVENMULTI_RE = re.compile(r"\.7z\.\d+$", re.I)
 TS_RE = re.compile(r"\.(\d+)\.(ts$)", re.I)
 
+# Size of the blocks that are read to calculate a CRC32
+CRC_READ_SIZE = 1024 * 1024
+
 PAR2_COMMAND = None
 MULTIPAR_COMMAND = None
 RAR_COMMAND = None
@@ -1112,6 +1116,10 @@ def par2_repair(parfile_nzf: NzbFile, nzo: NzbObject, workdir, setname, single):
         nzo.set_unpack_info("Repair", T("[%s] Quick Check OK") % setname)
         result = True
 
+    if not result and cfg.native_par2_verify():
+        # Verify without the external program, it's only needed when something has to be repaired
+        result = native_verify_set(parfile, nzo, setname, workdir)
+
     if not result and cfg.enable_all_par():
         # Download all par2 files that haven't been downloaded yet
         readd = False
@@ -1199,6 +1207,40 @@ def par2_repair(parfile_nzf: NzbFile, nzo: NzbObject, workdir, setname, single):
     return readd, result
 
 
+def native_verify_set(parfile, nzo: NzbObject, setname, workdir):
+    """ Verify the set in-process and rename the files that were found under another name """
+    nzo.status = Status.VERIFYING
+    nzo.set_action_line(T("Verifying"), "...")
+    start = time.time()
+    try:
+        verified, renames, damaged = verify_par2_set(parfile, workdir)
+    except:
+        logging.info("Native verification of %s failed", setname, exc_info=True)
+        return False
+
+    # Save renames
+    for name, old_name in renames.items():
+        try:
+            logging.debug("Par2-verification will rename %s to %s", old_name, name)
+            renamer(os.path.join(workdir, old_name), os.path.join(workdir, name))
+            for nzf in nzo.finished_files:
+                if nzf.filename == old_name:
+                    nzf.filename = name
+        except IOError:
+            # Renamed failed for some reason, let par2 handle it
+            verified = False
+    if renames:
+        nzo.renamed_file(renames)
+
+    if verified:
+        msg = T("[%s] Verified in %s, all files correct") % (setname, format_time_string(time.time() - start))
+        nzo.set_unpack_info("Repair", msg)
+        logging.info("Verified in %s, all files correct", format_time_string(time.time() - start))
+    else:
+        logging.info("Native verification of %s found %s blocks that need repair", setname, damaged)
+    return verified
+
+
 _RE_BLOCK_FOUND = re.compile(r'File: "([^"]+)" - found \d+ of \d+ data blocks from "([^"]+)"')
 _RE_IS_MATCH_FOR = re.compile(r'File: "([^"]+)" - is a match for "([^"]+)"')
 _RE_LOADING_PAR2 = re.compile(r'Loading "([^"]+)"\.')
@@ -2070,6 +2112,10 @@ def quick_check_set(set, nzo):
                     result &= True
                 else:
                     logging.info("Quick-check of file %s failed!", file)
+                    # The slices that were calculated during the download tell what needs to be repaired
+                    if nzf.slice_checksums is not None and file in nzo.par2slices:
+                        damaged = damaged_slices(nzo.par2slices[file][1], nzf.slice_checksums)
+                        logging.info("Damaged slices of %s: %s", file, damaged)
                     result = False
                 break
 
@@ -2201,8 +2247,13 @@ def sfv_check(sfvs, nzo: NzbObject, workdir):
     verifynum = 0
     for nzf in nzf_list:
         verifynum += 1
+        path = os.path.join(workdir, nzf.filename)
+        # Most were already calculated while the files were written, unless the file changed since
+        if nzf.crc32 is not None and nzf.hashes_valid(path):
+            calculated_crc32[nzf.filename] = b"%08x" % nzf.crc32
+            continue
         nzo.set_action_line(T("Verifying"), "%02d/%02d" % (verifynum, verifytotal))
-        calculated_crc32[nzf.filename] = crc_calculate(os.path.join(workdir, nzf.filename))
+        calculated_crc32[nzf.filename] = crc_calculate(path)
 
     sfv_parse_results = {}
     nzo.set_action_line(T("Trying SFV verification"), "...")
@@ -2284,7 +2335,7 @@ def crc_calculate(path):
     crc = 0
     with open(path, "rb") as fp:
         while 1:
-            data = fp.read(4096)
+            data = fp.read(CRC_READ_SIZE)
             if not data:
                 break
             crc = zlib.crc32(data, crc)
@@ -19,14 +19,16 @@
 sabnzbd.newswrapper
 """
 
+import os
 import errno
 import socket
-from threading import Thread
+import selectors
 from nntplib import NNTPPermanentError
 import time
 import logging
 import ssl
-from typing import List, Optional, Tuple, AnyStr
+from collections import deque
+from typing import List, Optional, Tuple, AnyStr, Deque
 
 import sabnzbd
 import sabnzbd.cfg
@@ -38,6 +40,13 @@ from sabnzbd.misc import nntp_to_msg, probablyipv4, probablyipv6, get_server_add
 socket.setdefaulttimeout(DEF_TIMEOUT)
 
 
+def average_latency(average: float, latency: float) -> float:
+    """ Moving average of connection latencies, recent connections count the most """
+    if not average:
+        return latency
+    return 0.8 * average + 0.2 * latency
+
+
 class NewsWrapper:
     # Pre-define attributes to save memory
     __slots__ = (
@@ -46,7 +55,9 @@ class NewsWrapper:
         "blocking",
         "timeout",
         "article",
-        "data",
+        "buffer",
+        "buffer_view",
+        "data_size",
         "nntp",
         "connected",
         "user_sent",
@@ -55,6 +66,8 @@ class NewsWrapper:
         "user_ok",
         "pass_ok",
         "force_login",
+        "pipeline",
+        "pipeline_buffer",
     )
 
     def __init__(self, server, thrdnum, block=False):
@@ -64,7 +77,11 @@ class NewsWrapper:
 
         self.timeout: Optional[float] = None
         self.article: Optional[sabnzbd.nzbstuff.Article] = None
-        self.data: List[AnyStr] = []
+
+        # Data of the current response is received in a buffer that is re-used for every response
+        self.buffer: bytearray = bytearray()
+        self.buffer_view: memoryview = memoryview(self.buffer)
+        self.data_size: int = 0
 
         self.nntp: Optional[NNTP] = None
 
@@ -76,13 +93,39 @@ class NewsWrapper:
         self.force_login: bool = False
         self.group: Optional[str] = None
 
+        # Articles requested after the current one, in the order their responses will arrive
+        self.pipeline: Deque[sabnzbd.nzbstuff.Article] = deque()
+        # Data that was received after the end of the current response
+        self.pipeline_buffer: bytes = b""
+
+    @property
+    def data(self) -> List[bytes]:
+        """ The received response as one chunk, in the format the decoder expects """
+        if self.data_size:
+            return [bytes(self.buffer_view[: self.data_size])]
+        return []
+
     @property
     def status_code(self) -> Optional[int]:
         """ Shorthand to get the code """
-        try:
-            return int(self.data[0][:3])
-        except:
-            return None
+        if self.data_size >= 3:
+            try:
+                return int(self.buffer[:3])
+            except ValueError:
+                pass
+        return None
+
+    def prepare_buffer(self, size: int):
+        """ Make sure the buffer can hold "size" bytes, keeping the data that was already received """
+        if len(self.buffer) < size:
+            buffer = bytearray(max(size, 2 * len(self.buffer)))
+            buffer[: self.data_size] = self.buffer_view[: self.data_size]
+            self.buffer = buffer
+            self.buffer_view = memoryview(buffer)
+
+    def prepare_buffer_for(self, article: "sabnzbd.nzbstuff.Article"):
+        """ The raw article is a bit larger than the decoded size, due to the yEnc encoding and headers """
+        self.prepare_buffer(article.bytes + article.bytes // 16 + 2048)
 
     def init_connect(self):
         """ Setup the connection in NNTP object """
@@ -104,10 +147,11 @@ class NewsWrapper:
             self.pass_sent = True
             self.pass_ok = True
 
+        msg = nntp_to_msg(self.data)
         if code == 501 and self.user_sent:
             # Change to a sensible text
             code = 481
-            self.data[0] = "%d %s" % (code, T("Authentication failed, check username/password."))
+            msg = "%d %s" % (code, T("Authentication failed, check username/password."))
             self.user_ok = True
             self.pass_sent = True
 
@@ -120,11 +164,11 @@ class NewsWrapper:
             self.pass_ok = False
 
         if code in (400, 502):
-            raise NNTPPermanentError(nntp_to_msg(self.data))
+            raise NNTPPermanentError(msg)
         elif not self.user_sent:
             command = utob("authinfo user %s\r\n" % self.server.username)
             self.nntp.sock.sendall(command)
-            self.data = []
+            self.clear_data()
             self.user_sent = True
         elif not self.user_ok:
             if code == 381:
@@ -139,88 +183,146 @@ class NewsWrapper:
         if self.user_ok and not self.pass_sent:
             command = utob("authinfo pass %s\r\n" % self.server.password)
             self.nntp.sock.sendall(command)
-            self.data = []
+            self.clear_data()
             self.pass_sent = True
         elif self.user_ok and not self.pass_ok:
             if code != 281:
                 # Assume that login failed (code 481 or other)
-                raise NNTPPermanentError(nntp_to_msg(self.data))
+                raise NNTPPermanentError(msg)
             else:
                 self.connected = True
 
         self.timeout = time.time() + self.server.timeout
 
-    def body(self):
-        """ Request the body of the article """
+    @property
+    def can_pipeline(self) -> bool:
+        """ Can another article be requested before the responses to the earlier requests are received """
+        return (
+            self.connected and not self.server.send_group and self.server.pipelining_requests > len(self.pipeline) + 1
+        )
+
+    def body(self, article: Optional["sabnzbd.nzbstuff.Article"] = None):
+        """ Request the body of the current article, or pipeline the request of another article """
         self.timeout = time.time() + self.server.timeout
-        if self.article.nzf.nzo.precheck:
+        if article:
+            self.pipeline.append(article)
+        else:
+            article = self.article
+            if self.pipeline:
+                # Responses arrive in order, so the current article now has to wait for the others
+                self.pipeline.append(article)
+                self.soft_reset()
+            else:
+                self.clear_data()
+                self.prepare_buffer_for(article)
+
+        if article.nzf.nzo.precheck:
             if self.server.have_stat:
-                command = utob("STAT <%s>\r\n" % self.article.article)
+                command = utob("STAT <%s>\r\n" % article.article)
             else:
-                command = utob("HEAD <%s>\r\n" % self.article.article)
+                command = utob("HEAD <%s>\r\n" % article.article)
         elif self.server.have_body:
-            command = utob("BODY <%s>\r\n" % self.article.article)
+            command = utob("BODY <%s>\r\n" % article.article)
         else:
-            command = utob("ARTICLE <%s>\r\n" % self.article.article)
+            command = utob("ARTICLE <%s>\r\n" % article.article)
         self.nntp.sock.sendall(command)
-        self.data = []
 
     def send_group(self, group: str):
         """ Send the NNTP GROUP command """
         self.timeout = time.time() + self.server.timeout
         command = utob("GROUP %s\r\n" % group)
         self.nntp.sock.sendall(command)
-        self.data = []
+        self.clear_data()
 
-    def recv_chunk(self, block: bool = False) -> Tuple[int, bool, bool]:
-        """ Receive data, return #bytes, done, skip """
+    def recv_chunk(self, block: bool = False, max_size: Optional[int] = None) -> Tuple[int, bool, bool]:
+        """ Receive data (at most max_size bytes from the socket), return #bytes, done, skip """
         self.timeout = time.time() + self.server.timeout
-        while 1:
-            try:
-                if self.nntp.nw.server.ssl:
-                    # SSL chunks come in 16K frames
-                    # Setting higher limits results in slowdown
-                    chunk = self.nntp.sock.recv(16384)
-                else:
-                    # Get as many bytes as possible
-                    chunk = self.nntp.sock.recv(262144)
-                break
-            except ssl.SSLWantReadError:
-                # SSL connections will block until they are ready.
-                # Either ignore the connection until it responds
-                # Or wait in a loop until it responds
-                if block:
-                    # time.sleep(0.0001)
-                    continue
-                else:
-                    return 0, False, True
-
-        # Append so we can do 1 join(), much faster than multiple!
-        self.data.append(chunk)
-
-        # Official end-of-article is ".\r\n" but sometimes it can get lost between 2 chunks
-        chunk_len = len(chunk)
-        if chunk[-5:] == b"\r\n.\r\n":
-            return chunk_len, True, False
-        elif chunk_len < 5 and len(self.data) > 1:
-            # We need to make sure the end is not split over 2 chunks
-            # This is faster than join()
-            combine_chunk = self.data[-2][-5:] + chunk
-            if combine_chunk[-5:] == b"\r\n.\r\n":
-                return chunk_len, True, False
-
-        # Still in middle of data, so continue!
-        return chunk_len, False, False
+        start = self.data_size
+        if self.pipeline_buffer:
+            # Received together with the previous pipelined response
+            chunk_size = len(self.pipeline_buffer)
+            self.prepare_buffer(start + chunk_size)
+            self.buffer_view[start : start + chunk_size] = self.pipeline_buffer
+            self.pipeline_buffer = b""
+        else:
+            if self.server.ssl:
+                # SSL chunks come in 16K frames
+                # Setting higher limits results in slowdown
+                # Reading less would leave decrypted data in the SSL object, which the selector doesn't report
+                max_size = 16384
+            else:
+                # Get as many bytes as possible
+                max_size = min(max_size or 262144, 262144)
+
+            # Only grow the buffer when the article was larger than expected
+            free = len(self.buffer) - start
+            if free < 16384:
+                self.prepare_buffer(start + max_size)
+                free = len(self.buffer) - start
+
+            while 1:
+                try:
+                    # Receive directly into the buffer, without creating a new object for every chunk
+                    chunk_size = self.nntp.sock.recv_into(self.buffer_view[start:], min(free, max_size))
+                    break
+                except ssl.SSLWantReadError:
+                    # SSL connections will block until they are ready.
+                    # Either ignore the connection until it responds
+                    # Or wait in a loop until it responds
+                    if block:
+                        # time.sleep(0.0001)
+                        continue
+                    else:
+                        return 0, False, True
+
+        self.data_size += chunk_size
+
+        # The chunk could also contain the start of the next response
+        if self.pipeline:
+            return self.split_pipelined_response(start)
+
+        # Official end-of-article is ".\r\n", checked on the whole buffer because it can be split over 2 chunks
+        return chunk_size, self.buffer.endswith(b"\r\n.\r\n", 0, self.data_size), False
+
+    def split_pipelined_response(self, start: int) -> Tuple[int, bool, bool]:
+        """Move any data after the end of the current response to the pipeline buffer.
+        Only multi-line (article) responses are reported as done, single-line
+        responses (like 223 or 430) are handled based on their status code.
+        """
+        # Make sure we know the status code before looking for the end
+        line_end = self.buffer.find(b"\r\n", 0, self.data_size)
+        if line_end < 0:
+            return 0, False, True
+
+        if self.status_code in (220, 221, 222):
+            # The terminator can be split over 2 chunks
+            end = self.buffer.find(b"\r\n.\r\n", max(0, start - 4), self.data_size)
+            if end < 0:
+                return self.data_size - start, False, False
+            end += 5
+            done = True
+        else:
+            end = line_end + 2
+            done = False
+
+        self.pipeline_buffer = bytes(self.buffer_view[end : self.data_size])
+        self.data_size = end
+        return end - start, done, False
 
     def soft_reset(self):
-        """ Reset for the next article """
-        self.timeout = None
-        self.article = None
+        """ Reset for the next article, which might already be requested """
+        if self.pipeline:
+            self.timeout = time.time() + self.server.timeout
+            self.article = self.pipeline.popleft()
+            self.prepare_buffer_for(self.article)
+        else:
+            self.timeout = None
+            self.article = None
         self.clear_data()
 
     def clear_data(self):
         """ Clear the stored raw data """
-        self.data = []
+        self.data_size = 0
 
     def hard_reset(self, wait: bool = True, send_quit: bool = True):
         """ Destroy and restart """
@@ -256,12 +358,14 @@ class NewsWrapper:
 
 class NNTP:
     # Pre-define attributes to save memory
-    __slots__ = ("nw", "host", "error_msg", "sock", "fileno")
+    __slots__ = ("nw", "host", "error_msg", "sock", "fileno", "connecting", "connect_start")
 
     def __init__(self, nw: NewsWrapper, host):
         self.nw: NewsWrapper = nw
         self.host: str = host  # Store the fastest ip
         self.error_msg: Optional[str] = None
+        self.connecting: bool = False  # Non-blocking connect or SSL handshake in progress
+        self.connect_start: float = time.time()
 
         if not self.nw.server.info:
             raise socket.error(errno.EADDRNOTAVAIL, "Address not available - Check for internet or DNS problems")
@@ -274,75 +378,124 @@ class NNTP:
         if probablyipv6(self.host):
             af = socket.AF_INET6
 
-        # Secured or unsecured?
-        if not self.nw.server.ssl:
-            # Basic connection
-            self.sock = socket.socket(af, socktype, proto)
-        else:
-            # Use context or just wrapper
-            if sabnzbd.CERTIFICATE_VALIDATION:
-                # Setup the SSL socket
-                ctx = ssl.create_default_context()
-
-                if sabnzbd.cfg.require_modern_tls():
-                    # We want a modern TLS (1.2 or higher), so we disallow older protocol versions (<= TLS 1.1)
-                    ctx.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1
-
-                # Only verify hostname when we're strict
-                if self.nw.server.ssl_verify < 2:
-                    ctx.check_hostname = False
-                # Certificates optional
-                if self.nw.server.ssl_verify == 0:
-                    ctx.verify_mode = ssl.CERT_NONE
-
-                # Did the user set a custom cipher-string?
-                if self.nw.server.ssl_ciphers:
-                    # At their own risk, socket will error out in case it was invalid
-                    ctx.set_ciphers(self.nw.server.ssl_ciphers)
-
-                self.sock = ctx.wrap_socket(socket.socket(af, socktype, proto), server_hostname=self.nw.server.host)
-            else:
-                # Use a regular wrapper, no certificate validation
-                self.sock = ssl.wrap_socket(socket.socket(af, socktype, proto))
+        self.sock = socket.socket(af, socktype, proto)
 
         # Store fileno of the socket
         self.fileno: int = self.sock.fileno()
 
-        # Open the connection in a separate thread due to avoid blocking
+        # Open the connection without blocking, the Downloader will call
+        # continue_connect when the socket is ready for the next step
         # For server-testing we do want blocking
         if not self.nw.blocking:
-            Thread(target=self.connect).start()
+            self.start_connect()
         else:
+            # Secured or unsecured?
+            if self.nw.server.ssl:
+                self.sock = self.wrap_ssl(self.sock)
             self.connect()
 
+    def wrap_ssl(self, sock: socket.socket) -> ssl.SSLSocket:
+        """ Setup the SSL socket, the handshake is only done directly for blocking connections """
+        # Use context or just wrapper
+        if sabnzbd.CERTIFICATE_VALIDATION:
+            # Resume the session of a previous connection if possible
+            return self.nw.server.get_ssl_context().wrap_socket(
+                sock,
+                server_hostname=self.nw.server.host,
+                session=self.nw.server.ssl_session,
+                do_handshake_on_connect=self.nw.blocking,
+            )
+        else:
+            # Use a regular wrapper, no certificate validation
+            return ssl.wrap_socket(sock, do_handshake_on_connect=self.nw.blocking)
+
     def connect(self):
-        """Start of connection, can be performed a-sync"""
+        """Blocking connect, used during server test"""
         try:
             # Wait only 15 seconds during server test
-            if self.nw.blocking:
-                self.sock.settimeout(15)
+            self.sock.settimeout(15)
 
             # Connect
             self.sock.connect((self.host, self.nw.server.port))
             self.sock.setblocking(self.nw.blocking)
+            self.connection_ready()
+        except OSError as e:
+            self.error(e)
 
-            # Log SSL/TLS info
-            if self.nw.server.ssl:
-                logging.info(
-                    "%s@%s: Connected using %s (%s)",
-                    self.nw.thrdnum,
-                    self.nw.server.host,
-                    self.sock.version(),
-                    self.sock.cipher()[0],
-                )
-                self.nw.server.ssl_info = "%s (%s)" % (self.sock.version(), self.sock.cipher()[0])
+    def start_connect(self):
+        """ Start non-blocking connect, the socket will be writable when it's done """
+        self.connecting = True
+        self.sock.setblocking(False)
+        try:
+            result = self.sock.connect_ex((self.host, self.nw.server.port))
+            if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                raise OSError(result, os.strerror(result))
+            sabnzbd.Downloader.add_socket(self.fileno, self.nw, selectors.EVENT_WRITE)
+        except OSError as e:
+            self.connecting = False
+            self.error(e)
 
-            # Now it's safe to add the socket to the list of active sockets
-            # Skip this step during server test
-            if not self.nw.blocking:
-                sabnzbd.Downloader.add_socket(self.fileno, self.nw)
+    def continue_connect(self):
+        """Called by the Downloader when the socket is ready, to finish the
+        connect and SSL handshake. Registers the socket for the event that
+        is needed for the next step.
+        """
+        try:
+            if not isinstance(self.sock, ssl.SSLSocket):
+                # Check result of the connect
+                result = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if result:
+                    raise OSError(result, os.strerror(result))
+                if self.nw.server.ssl:
+                    self.sock = self.wrap_ssl(self.sock)
+            if self.nw.server.ssl:
+                self.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            sabnzbd.Downloader.add_socket(self.fileno, self.nw)
+            return
+        except ssl.SSLWantWriteError:
+            sabnzbd.Downloader.add_socket(self.fileno, self.nw, selectors.EVENT_WRITE)
+            return
         except OSError as e:
+            self.connecting = False
+            sabnzbd.Downloader.remove_socket(self.nw)
             self.error(e)
+            return
+
+        self.connecting = False
+        self.nw.server.connect_latency = average_latency(
+            self.nw.server.connect_latency, time.time() - self.connect_start
+        )
+        self.connection_ready()
+
+    def connection_ready(self):
+        """ Log connection info and wait for the welcome message """
+        # Log SSL/TLS info
+        if self.nw.server.ssl:
+            logging.info(
+                "%s@%s: Connected using %s (%s)",
+                self.nw.thrdnum,
+                self.nw.server.host,
+                self.sock.version(),
+                self.sock.cipher()[0],
+            )
+            self.nw.server.ssl_info = "%s (%s)" % (self.sock.version(), self.sock.cipher()[0])
+            if self.sock.session_reused:
+                logging.debug("%s@%s: Resumed TLS session", self.nw.thrdnum, self.nw.server.host)
+            if sabnzbd.CERTIFICATE_VALIDATION:
+                self.store_ssl_session()
+
+        # Now it's safe to watch for the welcome message
+        # Skip this step during server test
+        if not self.nw.blocking:
+            sabnzbd.Downloader.add_socket(self.fileno, self.nw)
+
+    def store_ssl_session(self):
+        """Keep the TLS session, so new connections can resume it instead
+        of a full handshake. With TLS 1.3 the session is only sent by
+        the server after the handshake, so this is also done after login."""
+        if self.sock.session and self.sock.session.has_ticket:
+            self.nw.server.ssl_session = self.sock.session
 
     def error(self, error: OSError):
         raw_error_str = str(error)
@@ -25,18 +25,32 @@ import logging
 import hashlib
 import xml.etree.ElementTree
 import datetime
+from typing import Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 import sabnzbd
 from sabnzbd import filesystem, nzbstuff
 from sabnzbd.encoding import utob, correct_unknown_encoding
 from sabnzbd.filesystem import is_archive, get_filename
-from sabnzbd.misc import name_to_cat
+from sabnzbd.misc import name_to_cat, to_units
+
+
+# Amount of NZB-data that is parsed at once
+NZB_PARSE_CHUNK = 1024 * 1024
 
 
 def nzbfile_parser(raw_data, nzo):
-    # Load data as file-object
-    raw_data = raw_data.replace("http://www.newzbin.com/DTD/2003/nzb", "", 1)
-    nzb_tree = xml.etree.ElementTree.fromstring(raw_data)
+    """Parse the NZB while reading it, so the complete XML tree never has to be in memory.
+    The elements of each segment and file are cleared as soon as they are processed.
+    """
+    parse_start = time.time()
+    peak_memory_start = peak_memory_usage()
+    parser = xml.etree.ElementTree.XMLPullParser(events=("start", "end"))
 
     # Hash for dupe-checking
     md5sum = hashlib.md5()
@@ -49,46 +63,58 @@ def nzbfile_parser(raw_data, nzo):
     skipped_files = 0
     valid_files = 0
 
-    # Parse the header
-    if nzb_tree.find("head"):
-        for meta in nzb_tree.find("head").iter("meta"):
-            meta_type = meta.attrib.get("type")
-            if meta_type and meta.text:
-                # Meta tags can occur multiple times
-                if meta_type not in nzo.meta:
-                    nzo.meta[meta_type] = []
-                nzo.meta[meta_type].append(meta.text)
-    logging.debug("NZB Meta-data = %s", nzo.meta)
-
-    # Parse the files
-    for file in nzb_tree.iter("file"):
-        # Get subject and date
-        file_name = ""
-        if file.attrib.get("subject"):
-            file_name = file.attrib.get("subject")
-
-        # Don't fail if no date present
-        try:
-            file_date = datetime.datetime.fromtimestamp(int(file.attrib.get("date")))
-            file_timestamp = int(file.attrib.get("date"))
-        except:
-            file_date = datetime.datetime.fromtimestamp(time_now)
-            file_timestamp = time_now
-
-        # Get group
-        for group in file.iter("group"):
-            if group.text not in nzo.groups:
-                nzo.groups.append(group.text)
-
-        # Get segments
-        raw_article_db = {}
-        file_bytes = 0
-        if file.find("segments"):
-            for segment in file.find("segments").iter("segment"):
+    # Size and first article of the added files, to detect duplicates (see NzbFile.__eq__)
+    added_files = set()
+
+    # State of the file that is being parsed
+    in_head = False
+    file_name = ""
+    file_date = file_timestamp = None
+    raw_article_db = {}
+    file_bytes = 0
+
+    for pos in range(0, len(raw_data), NZB_PARSE_CHUNK):
+        parser.feed(raw_data[pos : pos + NZB_PARSE_CHUNK])
+        for event, element in parser.read_events():
+            # Ignore the namespace, like "http://www.newzbin.com/DTD/2003/nzb"
+            tag = element.tag.rpartition("}")[2]
+
+            if event == "start":
+                if tag == "head":
+                    in_head = True
+                elif tag == "file":
+                    # Get subject and date
+                    file_name = element.attrib.get("subject") or ""
+
+                    # Don't fail if no date present
+                    try:
+                        file_date = datetime.datetime.fromtimestamp(int(element.attrib.get("date")))
+                        file_timestamp = int(element.attrib.get("date"))
+                    except:
+                        file_date = datetime.datetime.fromtimestamp(time_now)
+                        file_timestamp = time_now
+                    raw_article_db = {}
+                    file_bytes = 0
+                continue
+
+            if tag == "meta" and in_head:
+                meta_type = element.attrib.get("type")
+                if meta_type and element.text:
+                    # Meta tags can occur multiple times
+                    if meta_type not in nzo.meta:
+                        nzo.meta[meta_type] = []
+                    nzo.meta[meta_type].append(element.text)
+            elif tag == "head":
+                in_head = False
+                logging.debug("NZB Meta-data = %s", nzo.meta)
+            elif tag == "group":
+                if element.text not in nzo.groups:
+                    nzo.groups.append(element.text)
+            elif tag == "segment":
                 try:
-                    article_id = segment.text
-                    segment_size = int(segment.attrib.get("bytes"))
-                    partnum = int(segment.attrib.get("number"))
+                    article_id = element.text
+                    segment_size = int(element.attrib.get("bytes"))
+                    partnum = int(element.attrib.get("number"))
 
                     # Update hash
                     md5sum.update(utob(article_id))
@@ -116,31 +142,38 @@ def nzbfile_parser(raw_data, nzo):
                 except:
                     # In case of missing attributes
                     pass
-
-        # Sort the articles by part number, compatible with Python 3.5
-        raw_article_db_sorted = [raw_article_db[partnum] for partnum in sorted(raw_article_db)]
-
-        # Create NZF
-        nzf = sabnzbd.nzbstuff.NzbFile(file_date, file_name, raw_article_db_sorted, file_bytes, nzo)
-
-        # Check if we already have this exact NZF (see custom eq-checks)
-        if nzf in nzo.files:
-            logging.info("File %s occured twice in NZB, skipping", nzf.filename)
-            continue
-
-        # Add valid NZF's
-        if file_name and nzf.valid and nzf.nzf_id:
-            logging.info("File %s added to queue", nzf.filename)
-            nzo.files.append(nzf)
-            nzo.files_table[nzf.nzf_id] = nzf
-            nzo.bytes += nzf.bytes
-            valid_files += 1
-            avg_age_sum += file_timestamp
-        else:
-            logging.info("Error importing %s, skipping", file_name)
-            if nzf.nzf_id:
-                sabnzbd.remove_data(nzf.nzf_id, nzo.admin_path)
-            skipped_files += 1
+                element.clear()
+            elif tag == "file":
+                # Sort the articles by part number, compatible with Python 3.5
+                raw_article_db_sorted = [raw_article_db[partnum] for partnum in sorted(raw_article_db)]
+                element.clear()
+
+                # Check if we already have this exact NZF, before storing its articles
+                file_key = (file_bytes, raw_article_db_sorted[0][0]) if raw_article_db_sorted else None
+                if file_key in added_files:
+                    logging.info("File %s occured twice in NZB, skipping", file_name)
+                    continue
+
+                # Create NZF
+                nzf = sabnzbd.nzbstuff.NzbFile(file_date, file_name, raw_article_db_sorted, file_bytes, nzo)
+
+                # Add valid NZF's
+                if file_name and nzf.valid and nzf.nzf_id:
+                    logging.info("File %s added to queue", nzf.filename)
+                    nzo.files.append(nzf)
+                    nzo.files_table[nzf.nzf_id] = nzf
+                    nzo.bytes += nzf.bytes
+                    valid_files += 1
+                    avg_age_sum += file_timestamp
+                    added_files.add(file_key)
+                else:
+                    logging.info("Error importing %s, skipping", file_name)
+                    if nzf.nzf_id:
+                        sabnzbd.remove_data(nzf.nzf_id, nzo.admin_path)
+                    skipped_files += 1
+
+    # Raises an error for incomplete files
+    parser.close()
 
     # Final bookkeeping
     nr_files = max(1, valid_files)
@@ -151,6 +184,27 @@ def nzbfile_parser(raw_data, nzo):
     if skipped_files:
         logging.warning(T("Failed to import %s files from %s"), skipped_files, nzo.filename)
 
+    peak_memory = peak_memory_usage()
+    logging.info(
+        "Parsed %s in %.2f seconds, %d files, peak memory %s (increased by %s)",
+        nzo.filename,
+        time.time() - parse_start,
+        valid_files,
+        to_units(peak_memory) if peak_memory else "unknown",
+        to_units(peak_memory - peak_memory_start) if peak_memory else "unknown",
+    )
+
+
+def peak_memory_usage() -> Optional[int]:
+    """ Peak memory usage of the process in bytes, if available """
+    if resource:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS, in kilobytes elsewhere
+        if sabnzbd.DARWIN:
+            return peak_memory
+        return peak_memory * 1024
+    return None
+
 
 def process_nzb_archive_file(
     filename,
@@ -24,10 +24,11 @@ import logging
 import time
 import datetime
 import functools
-from typing import List, Dict, Union, Tuple, Optional
+from typing import List, Dict, Union, Tuple, Optional, Set
 
 import sabnzbd
 from sabnzbd.nzbstuff import NzbObject, Article
+from sabnzbd.database import HistoryDB
 from sabnzbd.misc import exit_sab, cat_to_opts, int_conv, caller_name, cmp, safe_lower
 from sabnzbd.filesystem import get_admin_path, remove_all, globber_full, remove_file, is_valid_script
 from sabnzbd.nzbparser import process_single_nzb
@@ -66,6 +67,13 @@ class NzbQueue:
         self.__nzo_list: List[NzbObject] = []
         self.__nzo_table: Dict[str, NzbObject] = {}
 
+        # Parts of the check for orphaned folders, they only change
+        # when the history is updated or the download folder changes
+        self.__history_folders: Set[str] = set()
+        self.__history_update: Optional[int] = None
+        self.__download_folders: List[str] = []
+        self.__download_dir_key: Optional[Tuple[str, int]] = None
+
     def read_queue(self, repair):
         """Read queue from disk, supporting repair modes
         0 = no repairs
@@ -105,6 +113,8 @@ class NzbQueue:
                 path = get_admin_path(folder, future=True)
                 nzo = sabnzbd.load_data(_id, path)
             if nzo:
+                # Apply the changes made after the job was last saved
+                nzo.replay_journal()
                 self.add(nzo, save=False, quiet=True)
                 folders.append(folder)
 
@@ -136,25 +146,19 @@ class NzbQueue:
         result = []
         # Folders from the download queue
         if all_jobs:
-            registered = []
+            registered = set()
         else:
-            registered = [nzo.work_name for nzo in self.__nzo_list]
-
-        # Retryable folders from History
-        items = sabnzbd.api.build_history()[0]
-        # Anything waiting or active or retryable is a known item
-        registered.extend(
-            [
-                os.path.basename(item["path"])
-                for item in items
-                if item["retry"] or item["loaded"] or item["status"] == Status.QUEUED
-            ]
-        )
+            registered = {nzo.work_name for nzo in self.__nzo_list}
+
+        # Anything waiting, active or retryable is a known item
+        # The checks are only repeated when something could have changed, unless action is needed
+        registered.update(nzo.work_name for nzo in sabnzbd.PostProcessor.get_queue())
+        registered.update(self.history_folders(refresh=action))
 
         # Repair unregistered folders
-        for folder in globber_full(cfg.download_dir.get_path()):
+        for folder in self.download_folders(refresh=action):
             name = os.path.basename(folder)
-            if os.path.isdir(folder) and name not in registered and name not in IGNORED_FOLDERS:
+            if name not in registered and name not in IGNORED_FOLDERS:
                 if action:
                     logging.info("Repairing job %s", folder)
                     self.repair_job(folder)
@@ -164,6 +168,34 @@ class NzbQueue:
                     logging.info("Skipping repair for job %s", folder)
         return result
 
+    def history_folders(self, refresh=False) -> Set[str]:
+        """ Return the folder names of the jobs in the history that can be retried or are queued """
+        if refresh or self.__history_update != sabnzbd.LAST_HISTORY_UPDATE:
+            self.__history_update = sabnzbd.LAST_HISTORY_UPDATE
+            try:
+                history_db = sabnzbd.get_db_connection()
+                paths = history_db.get_active_paths()
+            except:
+                # Required for repairs at startup because Cherrypy isn't active yet
+                with HistoryDB() as history_db:
+                    paths = history_db.get_active_paths()
+            self.__history_folders = {os.path.basename(path) for path in paths if path}
+        return self.__history_folders
+
+    def download_folders(self, refresh=False) -> List[str]:
+        """Return the folders in the download folder, the list is updated when the folder
+        changes or when another download folder is set
+        """
+        download_dir = cfg.download_dir.get_path()
+        try:
+            key = (download_dir, os.stat(download_dir).st_mtime_ns)
+        except OSError:
+            key = None
+        if refresh or key is None or key != self.__download_dir_key:
+            self.__download_dir_key = key
+            self.__download_folders = [folder for folder in globber_full(download_dir) if os.path.isdir(folder)]
+        return self.__download_folders
+
     def repair_job(self, repair_folder, new_nzb=None, password=None):
         """ Reconstruct admin for a single job folder, optionally with new NZB """
         # Check if folder exists
@@ -702,8 +734,8 @@ class NzbQueue:
                 return True
         return False
 
-    def get_article(self, server: Server, servers: List[Server]) -> Optional[Article]:
-        """Get next article for jobs in the queue
+    def get_articles(self, server: Server, servers: List[Server], fetch_limit: int) -> List[Article]:
+        """Get next articles for jobs in the queue, at most "fetch_limit" from the same job
         Not locked for performance, since it only reads the queue
         """
         # Pre-calculate propagation delay
@@ -718,12 +750,13 @@ class NzbQueue:
                     or (nzo.avg_stamp + propagation_delay) < time.time()
                 ):
                     if not nzo.server_in_try_list(server):
-                        article = nzo.get_article(server, servers)
-                        if article:
-                            return article
+                        articles = nzo.get_articles(server, servers, fetch_limit)
+                        if articles:
+                            return articles
                     # Stop after first job that wasn't paused/propagating/etc
                     if self.__top_only:
-                        return
+                        return []
+        return []
 
     def register_article(self, article: Article, success: bool = True):
         """Register the articles we tried
@@ -756,13 +789,9 @@ class NzbQueue:
                             logging.warning(T("%s -> Unknown encoding"), nzf.filename)
 
             # Save bookkeeping in case of crash
-            if file_done and (nzo.next_save is None or time.time() > nzo.next_save):
-                nzo.save_to_disk()
+            if file_done:
+                nzo.save_changes()
                 sabnzbd.BPSMeter.save()
-                if nzo.save_timeout is None:
-                    nzo.next_save = None
-                else:
-                    nzo.next_save = time.time() + nzo.save_timeout
 
             # Remove post from Queue
             if post_done:
@@ -26,12 +26,13 @@ import datetime
 import threading
 import functools
 import difflib
+import pickle
+from array import array
 from typing import List, Dict, Any, Tuple, Optional
 
 # SABnzbd modules
 import sabnzbd
 from sabnzbd.constants import (
-    GIGI,
     ATTRIB_FILE,
     JOB_ADMIN,
     REPAIR_PRIORITY,
@@ -44,6 +45,9 @@ from sabnzbd.constants import (
     DUP_PRIORITY,
     STOP_PRIORITY,
     RENAMES_FILE,
+    JOURNAL_FILE,
+    JOURNAL_COMPACT_SIZE,
+    ARTICLE_BATCH,
     MAX_BAD_ARTICLES,
     Status,
     PNFO,
@@ -143,7 +147,17 @@ class TryList:
 ##############################################################################
 # Article
 ##############################################################################
-ArticleSaver = ("article", "art_id", "bytes", "lowest_partnum", "decoded", "on_disk", "nzf")
+ArticleSaver = (
+    "article",
+    "art_id",
+    "bytes",
+    "lowest_partnum",
+    "decoded",
+    "on_disk",
+    "data_begin",
+    "data_size",
+    "nzf",
+)
 
 
 class Article(TryList):
@@ -162,6 +176,8 @@ class Article(TryList):
         self.tries = 0  # Try count
         self.decoded = False
         self.on_disk = False
+        self.data_begin: Optional[int] = None  # Offset of the decoded data in the file
+        self.data_size: Optional[int] = None  # Size of the decoded data, once written
         self.nzf: NzbFile = nzf
 
     def get_article(self, server: Server, servers: List[Server]):
@@ -230,12 +246,6 @@ class Article(TryList):
             logging.debug("Article %s | Server: %s | Returning None", self.article, server.host)
         return None
 
-    def get_art_id(self):
-        """ Return unique article storage name, create if needed """
-        if not self.art_id:
-            self.art_id = sabnzbd.get_new_id("article", self.nzf.nzo.admin_path)
-        return self.art_id
-
     def search_new_server(self):
         """Search for a new server for this article"""
         # Since we need a new server, this one can be listed as failed
@@ -289,6 +299,48 @@ class Article(TryList):
         return "<Article: article=%s, bytes=%s, art_id=%s>" % (self.article, self.bytes, self.art_id)
 
 
+##############################################################################
+# ArticleTable
+##############################################################################
+class ArticleTable:
+    """Compact storage of the articles of a file that are not needed as Article objects yet.
+    The message-ids are packed in one buffer and the sizes in an array, the articles
+    are turned into Article objects in batches, in the order they are downloaded.
+    """
+
+    __slots__ = ("ids", "offsets", "sizes", "position")
+
+    def __init__(self, raw_article_db: List[Tuple[str, int]]):
+        ids = bytearray()
+        self.offsets = array("I", [0])
+        self.sizes = array("I")
+        for article_id, article_bytes in raw_article_db:
+            ids += article_id.encode("utf-8", "surrogatepass")
+            self.offsets.append(len(ids))
+            self.sizes.append(article_bytes)
+        self.ids = bytes(ids)
+        self.position = 0  # Next article to be taken
+
+    def take(self, count: int) -> List[Tuple[str, int]]:
+        """ Return the next articles in the same format as the article database """
+        end = min(self.position + count, len(self.sizes))
+        raw_articles = [
+            (self.ids[self.offsets[i] : self.offsets[i + 1]].decode("utf-8", "surrogatepass"), self.sizes[i])
+            for i in range(self.position, end)
+        ]
+        self.position = end
+        return raw_articles
+
+    def __len__(self):
+        return len(self.sizes) - self.position
+
+    def __getstate__(self):
+        return self.ids, self.offsets, self.sizes, self.position
+
+    def __setstate__(self, state):
+        self.ids, self.offsets, self.sizes, self.position = state
+
+
 ##############################################################################
 # NzbFile
 ##############################################################################
@@ -305,6 +357,7 @@ NzbFileSaver = (
     "setname",
     "articles",
     "decodetable",
+    "table",
     "bytes",
     "bytes_left",
     "nzo",
@@ -314,6 +367,9 @@ NzbFileSaver = (
     "import_finished",
     "md5sum",
     "md5of16k",
+    "crc32",
+    "slice_checksums",
+    "hashed_stat",
 )
 
 
@@ -321,7 +377,7 @@ class NzbFile(TryList):
     """ Representation of one file consisting of multiple articles """
 
     # Pre-define attributes to save memory
-    __slots__ = NzbFileSaver + ("md5",)
+    __slots__ = NzbFileSaver + ("hasher", "assembler_worker")
 
     def __init__(self, date, subject, raw_article_db, file_bytes, nzo):
         """ Setup object """
@@ -341,8 +397,10 @@ class NzbFile(TryList):
         self.setname: Optional[str] = None
 
         # Articles are removed from "articles" after being fetched
-        self.articles: List[Article] = []
+        # Stored as keys of a dict, to have fast removal but keep the order
+        self.articles: Dict[Article, None] = {}
         self.decodetable: List[Article] = []
+        self.table: Optional[ArticleTable] = None  # Articles that are not in "articles" yet
 
         self.bytes: int = file_bytes
         self.bytes_left: int = file_bytes
@@ -353,9 +411,13 @@ class NzbFile(TryList):
         self.valid = False
         self.import_finished = False
 
-        self.md5 = None
+        self.hasher = None
+        self.assembler_worker: Optional[int] = None  # Index of the assembler worker that writes the file
         self.md5sum: Optional[bytes] = None
         self.md5of16k: Optional[bytes] = None
+        self.crc32: Optional[int] = None
+        self.slice_checksums: Optional[List[Tuple[bytes, int]]] = None
+        self.hashed_stat: Optional[Tuple[int, int]] = None  # Size and modification time when hashed
         self.valid = bool(raw_article_db)
 
         if self.valid and self.nzf_id:
@@ -363,7 +425,7 @@ class NzbFile(TryList):
             # duplicate file detection and deobfuscate-during-download
             first_article = self.add_article(raw_article_db.pop(0))
             first_article.lowest_partnum = True
-            self.nzo.first_articles.append(first_article)
+            self.nzo.first_articles[first_article] = None
             self.nzo.first_articles_count += 1
 
             # Count how many bytes are available for repair
@@ -387,8 +449,9 @@ class NzbFile(TryList):
             if isinstance(raw_article_db, dict):
                 raw_article_db = [raw_article_db[partnum] for partnum in sorted(raw_article_db)]
 
-            for raw_article in raw_article_db:
-                self.add_article(raw_article)
+            # Only create the article objects when they are needed
+            self.table = ArticleTable(raw_article_db)
+            self.take_articles()
 
             # Make sure we have labeled the lowest part number
             # Also when DirectUnpack is disabled we need to know
@@ -400,16 +463,28 @@ class NzbFile(TryList):
     def add_article(self, article_info):
         """ Add article to object database and return article object """
         article = Article(article_info[0], article_info[1], self)
-        self.articles.append(article)
+        self.articles[article] = None
         self.decodetable.append(article)
         return article
 
+    def take_articles(self, count: int = ARTICLE_BATCH) -> List[Article]:
+        """ Create the article objects of the next batch in the table """
+        articles = []
+        if self.table:
+            for raw_article in self.table.take(count):
+                articles.append(self.add_article(raw_article))
+        if not self.table:
+            self.table = None
+        return articles
+
     def remove_article(self, article: Article, success: bool) -> int:
         """ Handle completed article, possibly end of file """
         if article in self.articles:
-            self.articles.remove(article)
+            del self.articles[article]
             if success:
                 self.bytes_left -= article.bytes
+        if self.table:
+            return len(self.articles) + len(self.table)
         return len(self.articles)
 
     def set_par2(self, setname, vol, blocks):
@@ -419,18 +494,41 @@ class NzbFile(TryList):
         self.vol = vol
         self.blocks = int_conv(blocks)
 
-    def get_article(self, server: Server, servers: List[Server]) -> Optional[Article]:
-        """ Get next article to be downloaded """
-        for article in self.articles:
-            article = article.get_article(server, servers)
-            if article:
-                return article
-        self.add_to_try_list(server)
+    def get_articles(self, server: Server, servers: List[Server], fetch_limit: int) -> List[Article]:
+        """ Get next articles to be downloaded """
+        articles = []
+        # Articles can be removed by the decoder while we look
+        with NZO_LOCK:
+            for article in self.articles:
+                # Quick check, most articles of a file are already being downloaded
+                if article.fetcher:
+                    continue
+                article = article.get_article(server, servers)
+                if article:
+                    articles.append(article)
+                    if len(articles) >= fetch_limit:
+                        return articles
+
+            # All current articles are busy or tried, continue with the next batch
+            # New articles are all the same for a server, so one batch is enough to know
+            if self.table:
+                for article in self.take_articles(max(ARTICLE_BATCH, fetch_limit)):
+                    article = article.get_article(server, servers)
+                    if not article:
+                        break
+                    articles.append(article)
+                    if len(articles) >= fetch_limit:
+                        return articles
+
+        if not articles:
+            self.add_to_try_list(server)
+        return articles
 
     def reset_all_try_lists(self):
         """ Clear all lists of visited servers """
-        for art in self.articles:
-            art.reset_try_list()
+        with NZO_LOCK:
+            for art in self.articles:
+                art.reset_try_list()
         self.reset_try_list()
 
     def prepare_filepath(self):
@@ -440,12 +538,13 @@ class NzbFile(TryList):
             filename = sanitize_filename(self.filename)
             self.filepath = get_filepath(long_path(cfg.download_dir.get_path()), self.nzo, filename)
             self.filename = get_filename(self.filepath)
+            self.nzo.journal.add_file(self)
         return self.filepath
 
     @property
     def completed(self):
         """ Is this file completed? """
-        return self.import_finished and not bool(self.articles)
+        return self.import_finished and not self.articles and not self.table
 
     def remove_admin(self):
         """ Remove article database from disk (sabnzbd_nzf_<id>)"""
@@ -477,8 +576,23 @@ class NzbFile(TryList):
         if isinstance(self.decodetable, dict):
             self.decodetable = [self.decodetable[partnum] for partnum in sorted(self.decodetable)]
 
+        # Convert jobs from older versions, that used lists
+        if isinstance(self.articles, list):
+            self.articles = dict.fromkeys(self.articles)
+
         # Set non-transferable values
-        self.md5 = None
+        self.hasher = None
+        self.assembler_worker = None
+
+    def hashes_valid(self, path: str) -> bool:
+        """ The hashes calculated while assembling only apply if the file was not changed since """
+        if not self.hashed_stat:
+            return False
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return False
+        return (stat_result.st_size, stat_result.st_mtime_ns) == self.hashed_stat
 
     def __eq__(self, other):
         """Assume it's the same file if the numer bytes and first article
@@ -502,6 +616,92 @@ class NzbFile(TryList):
         return "<NzbFile: filename=%s, bytes=%s, nzf_id=%s>" % (self.filename, self.bytes, self.nzf_id)
 
 
+##############################################################################
+# JobJournal
+##############################################################################
+class JobJournal:
+    """Append-only log of the changes to a job since it was last saved completely.
+    Appending a few records is much cheaper than pickling the job with all its
+    files and articles, which is only done when the journal gets too long.
+    Records are numbered, so the changes that are already part of the complete
+    save can be skipped when replaying.
+    """
+
+    ARTICLE = "article"  # Article done or failed
+    FILE = "file"  # Filename or path of a file changed
+    SPILL = "spill"  # Article data stored on disk
+    UNSPILL = "unspill"  # Article data loaded from disk
+    COUNTER = "counter"  # Bad article counter increased
+
+    def __init__(self, seq: int = 0):
+        self.records: List[Tuple] = []  # Not written yet
+        self.size = 0  # Number of records in the journal file
+        self.seq = seq  # Sequence number of the last record
+        self.flushed_seq = seq  # Sequence number of the last record in the journal file
+        self.lock = threading.Lock()
+
+    def add(self, *record):
+        with self.lock:
+            self.seq += 1
+            self.records.append((self.seq,) + record)
+
+    def add_file(self, nzf: NzbFile):
+        self.add(self.FILE, nzf.nzf_id, nzf.filename, nzf.filename_checked, nzf.filepath)
+
+    def flush(self, folder: str):
+        """ Append the new records to the journal file """
+        with self.lock:
+            if not self.records:
+                return
+            try:
+                with open(os.path.join(folder, JOURNAL_FILE), "ab") as journal_file:
+                    pickle.dump(self.records, journal_file, protocol=pickle.HIGHEST_PROTOCOL)
+                self.size += len(self.records)
+                self.flushed_seq = self.records[-1][0]
+                self.records = []
+            except OSError:
+                # Keep the records for the next try, the folder could also be removed
+                logging.debug("Failed to write journal in %s", folder)
+
+    def truncate(self, folder: str, seq: int):
+        """ Remove the records up to seq, after the complete job was saved including these """
+        with self.lock:
+            self.records = [record for record in self.records if record[0] > seq]
+            journal_path = os.path.join(folder, JOURNAL_FILE)
+            try:
+                if self.flushed_seq <= seq:
+                    self.size = 0
+                    remove_file(journal_path)
+                else:
+                    # Records were written while the job was saved, these have to be kept
+                    kept = [record for record in self.read(folder) if record[0] > seq]
+                    with open(journal_path + ".tmp", "wb") as journal_file:
+                        pickle.dump(kept, journal_file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(journal_path + ".tmp", journal_path)
+                    self.size = len(kept)
+            except OSError:
+                logging.debug("Failed to truncate journal in %s", folder)
+
+    @staticmethod
+    def read(folder: str) -> List[Tuple]:
+        """ Read all records, a crash could have left an incomplete write at the end """
+        records = []
+        try:
+            with open(os.path.join(folder, JOURNAL_FILE), "rb") as journal_file:
+                while 1:
+                    records.extend(pickle.load(journal_file))
+        except FileNotFoundError:
+            pass
+        except EOFError:
+            pass
+        except:
+            logging.info("Journal in %s is incomplete, using %d changes", folder, len(records))
+        return records
+
+    def __len__(self):
+        return self.size + len(self.records)
+
+
 ##############################################################################
 # NzbObject
 ##############################################################################
@@ -527,6 +727,7 @@ NzbObjectSaver = (
     "partable",
     "extrapars",
     "md5packs",
+    "par2slices",
     "files",
     "files_table",
     "finished_files",
@@ -535,6 +736,8 @@ NzbObjectSaver = (
     "avg_bps_total",
     "priority",
     "saved_articles",
+    "spill",
+    "journal_seq",
     "nzo_id",
     "futuretype",
     "deleted",
@@ -545,8 +748,6 @@ NzbObjectSaver = (
     "nzo_info",
     "custom_name",
     "password",
-    "next_save",
-    "save_timeout",
     "encrypted",
     "bad_articles",
     "duplicate",
@@ -651,6 +852,7 @@ class NzbObject(TryList):
         self.partable: Dict[str, NzbFile] = {}  # Holds one parfile-name for each set
         self.extrapars: Dict[str, List[NzbFile]] = {}  # Holds the extra parfile names for all sets
         self.md5packs: Dict[str, Dict[str, bytes]] = {}  # Holds the md5pack for each set (name: hash)
+        self.par2slices: Dict[str, sabnzbd.par2file.Par2Slices] = {}  # Holds the par2 slice checksums of each file
         self.md5of16k: Dict[bytes, str] = {}  # Holds the md5s of the first-16k of all files in the NZB (hash: name)
 
         self.files: List[NzbFile] = []  # List of all NZFs
@@ -665,9 +867,12 @@ class NzbObject(TryList):
         self.avg_bps_freq = 0
         self.avg_bps_total = 0
 
-        self.first_articles: List[Article] = []
+        self.first_articles: Dict[Article, None] = {}
         self.first_articles_count = 0
-        self.saved_articles: List[Article] = []
+        self.saved_articles: Dict[Article, None] = {}
+        self.journal = JobJournal()  # Changes since the last complete save (not saved)
+        self.journal_seq = 0  # Last journal record that is part of the complete save
+        self.spill = None  # Articles stored on disk, see ArticleSpill
 
         self.nzo_id = None
 
@@ -699,8 +904,6 @@ class NzbObject(TryList):
         # Temporary store for custom foldername - needs to be stored because of url fetching
         self.custom_name = nzbname
 
-        self.next_save = None
-        self.save_timeout = None
         self.encrypted = 0
         self.url_wait: Optional[float] = None
         self.url_tries = 0
@@ -746,6 +949,7 @@ class NzbObject(TryList):
         if reuse:
             remove_all(admin_dir, "SABnzbd_nz?_*", keep_folder=True)
             remove_all(admin_dir, "SABnzbd_article_*", keep_folder=True)
+            remove_all(admin_dir, "SABnzbd_spill_*", keep_folder=True)
 
         if nzb and "<nzb" in nzb:
             try:
@@ -909,9 +1113,6 @@ class NzbObject(TryList):
         if not self.password and self.meta.get("password"):
             self.password = self.meta.get("password", [None])[0]
 
-        # Set nzo save-delay to minimum 120 seconds
-        self.save_timeout = max(120, min(6.0 * self.bytes / GIGI, 300.0))
-
         # In case pre-queue script or duplicate check want to move
         # to history we first need an nzo_id by entering the NzbQueue
         if accept == 2:
@@ -1022,7 +1223,7 @@ class NzbObject(TryList):
         nzf.set_par2(setname, vol, block)
 
         # Parse the file contents for hashes
-        pack = sabnzbd.par2file.parse_par2_file(filepath, nzf.nzo.md5of16k)
+        pack = sabnzbd.par2file.parse_par2_file(filepath, nzf.nzo.md5of16k, self.par2slices)
 
         # If we couldn't parse it, we ignore it
         if pack:
@@ -1144,9 +1345,11 @@ class NzbObject(TryList):
             # Increase counter of actually finished bytes
             self.bytes_downloaded += article.bytes
 
+        self.journal.add(JobJournal.ARTICLE, nzf.nzf_id, article.article, success)
+
         # First or regular article?
-        if article.lowest_partnum and self.first_articles and article in self.first_articles:
-            self.first_articles.remove(article)
+        if article.lowest_partnum and article in self.first_articles:
+            del self.first_articles[article]
 
             # All first articles done?
             if not self.first_articles:
@@ -1187,16 +1390,13 @@ class NzbObject(TryList):
 
     @synchronized(NZO_LOCK)
     def add_saved_article(self, article: Article):
-        self.saved_articles.append(article)
+        self.saved_articles[article] = None
 
     @synchronized(NZO_LOCK)
     def remove_saved_article(self, article: Article):
-        try:
-            self.saved_articles.remove(article)
-        except ValueError:
-            # It's not there if the job is fully missing
-            # and this function is called from file_has_articles
-            pass
+        # It's not there if the job is fully missing
+        # and this function is called from file_has_articles
+        self.saved_articles.pop(article, None)
 
     def check_existing_files(self, wdir: str):
         """ Check if downloaded files already exits, for these set NZF to complete """
@@ -1541,20 +1741,24 @@ class NzbObject(TryList):
             self.nzo_info[article_type] = 0
         self.nzo_info[article_type] += 1
         self.bad_articles += 1
+        self.journal.add(JobJournal.COUNTER, article_type)
 
-    def get_article(self, server: Server, servers: List[Server]) -> Optional[Article]:
-        article = None
+    def get_articles(self, server: Server, servers: List[Server], fetch_limit: int) -> List[Article]:
+        articles = []
         nzf_remove_list = []
 
         # Did we go through all first-articles?
         if self.first_articles:
-            for article_test in self.first_articles:
-                article = article_test.get_article(server, servers)
-                if article:
-                    break
+            with NZO_LOCK:
+                for article_test in self.first_articles:
+                    article = article_test.get_article(server, servers)
+                    if article:
+                        articles.append(article)
+                        if len(articles) >= fetch_limit:
+                            break
 
         # Move on to next ones
-        if not article:
+        if len(articles) < fetch_limit:
             for nzf in self.files:
                 if nzf.deleted:
                     logging.debug("Skipping existing file %s", nzf.filename or nzf.subject)
@@ -1575,8 +1779,8 @@ class NzbObject(TryList):
                             else:
                                 continue
 
-                        article = nzf.get_article(server, servers)
-                        if article:
+                        articles.extend(nzf.get_articles(server, servers, fetch_limit - len(articles)))
+                        if len(articles) >= fetch_limit:
                             break
 
         # Remove all files for which admin could not be read
@@ -1588,10 +1792,10 @@ class NzbObject(TryList):
         if nzf_remove_list and not self.files:
             sabnzbd.NzbQueue.end_job(self)
 
-        if not article:
+        if not articles:
             # No articles for this server, block for next time
             self.add_to_try_list(server)
-        return article
+        return articles
 
     @synchronized(NZO_LOCK)
     def move_top_bulk(self, nzf_ids):
@@ -1683,7 +1887,8 @@ class NzbObject(TryList):
                     logging.info("Detected filename based on par2: %s -> %s", nzf.filename, new_filename)
                     self.renamed_file(new_filename, nzf.filename)
                     nzf.filename = new_filename
-                return
+            self.journal.add_file(nzf)
+            return
 
         # Fallback to yenc/nzb name (also when there is no partnum=1)
         # We also keep the NZB name in case it ends with ".par2" (usually correct)
@@ -1696,6 +1901,7 @@ class NzbObject(TryList):
             logging.info("Detected filename from yenc: %s -> %s", nzf.filename, yenc_filename)
             self.renamed_file(yenc_filename, nzf.filename)
             nzf.filename = yenc_filename
+            self.journal.add_file(nzf)
 
     @synchronized(NZO_LOCK)
     def verify_all_filenames_and_resort(self):
@@ -1789,7 +1995,7 @@ class NzbObject(TryList):
         self.abort_direct_unpacker()
 
         # Remove all cached files
-        sabnzbd.ArticleCache.purge_articles(self.saved_articles)
+        sabnzbd.ArticleCache.purge_articles(list(self.saved_articles))
 
         # Delete all, or just basic files
         if self.futuretype:
@@ -1801,6 +2007,7 @@ class NzbObject(TryList):
             # We remove any saved articles and save the renames file
             remove_all(self.download_path, "SABnzbd_nz?_*", keep_folder=True)
             remove_all(self.download_path, "SABnzbd_article_*", keep_folder=True)
+            remove_all(self.download_path, "SABnzbd_spill_*", keep_folder=True)
             sabnzbd.save_data(self.renames, RENAMES_FILE, self.admin_path, silent=True)
 
     def gather_info(self, full=False):
@@ -1878,7 +2085,100 @@ class NzbObject(TryList):
         """ Save job's admin to disk """
         self.save_attribs()
         if self.nzo_id and not self.is_gone():
-            sabnzbd.save_data(self, self.nzo_id, self.admin_path)
+            # The complete state replaces the journal, but only after it was written,
+            # so no changes are lost when saving fails. Records added while saving are
+            # kept, counters are only changed while holding the lock so they can't be
+            # part of the complete state and also of the remaining journal.
+            self.journal_seq = self.journal.seq
+            if sabnzbd.save_data(self, self.nzo_id, self.admin_path):
+                self.journal.truncate(self.admin_path, self.journal_seq)
+
+    def save_changes(self):
+        """Save the changes since the last complete save to the journal,
+        the complete job is only saved when the journal gets too long
+        """
+        if len(self.journal) >= JOURNAL_COMPACT_SIZE:
+            self.save_to_disk()
+        elif self.nzo_id and not self.is_gone():
+            self.journal.flush(self.admin_path)
+
+    @synchronized(NZO_LOCK)
+    def replay_journal(self):
+        """ Apply the changes that were saved after the last complete save """
+        records = JobJournal.read(self.admin_path)
+        if not records:
+            return
+        # Continue numbering after the records that are on disk
+        self.journal.seq = max(self.journal.seq, records[-1][0])
+        self.journal.flushed_seq = self.journal.seq
+        records = [record[1:] for record in records if record[0] > self.journal_seq]
+        logging.info("Applying %d saved changes to %s", len(records), self.final_name)
+
+        # Articles are identified by their message-id within the file
+        articles_table: Dict[str, Dict[str, Article]] = {}
+
+        def find_article(nzf_id: str, article_id: str) -> Optional[Article]:
+            if nzf_id not in articles_table:
+                nzf = self.files_table.get(nzf_id)
+                if not nzf:
+                    return None
+                if not nzf.import_finished:
+                    nzf.finish_import()
+                while nzf.table:
+                    nzf.take_articles()
+                articles_table[nzf_id] = {article.article: article for article in nzf.decodetable}
+            return articles_table[nzf_id].get(article_id)
+
+        for record in records:
+            try:
+                if record[0] == JobJournal.ARTICLE:
+                    _, nzf_id, article_id, success = record
+                    article = find_article(nzf_id, article_id)
+                    # Could already be part of the complete save
+                    if article and article in article.nzf.articles:
+                        nzf = article.nzf
+                        if nzf in self.files:
+                            self.bytes_tried += article.bytes
+                        if success:
+                            self.bytes_downloaded += article.bytes
+                        else:
+                            self.bytes_missing += article.bytes
+                        self.first_articles.pop(article, None)
+                        if not nzf.remove_article(article, success) and nzf.import_finished:
+                            self.remove_nzf(nzf)
+                elif record[0] == JobJournal.FILE:
+                    _, nzf_id, filename, filename_checked, filepath = record
+                    nzf = self.files_table.get(nzf_id)
+                    if nzf:
+                        nzf.filename = filename
+                        nzf.filename_checked = filename_checked
+                        nzf.filepath = filepath
+                elif record[0] == JobJournal.SPILL:
+                    _, nzf_id, article_id, location, data_begin = record
+                    article = find_article(nzf_id, article_id)
+                    if article:
+                        article.decoded = True
+                        article.data_begin = data_begin
+                        if not self.spill:
+                            self.spill = sabnzbd.articlecache.ArticleSpill()
+                        self.spill.restore(article, location)
+                        self.saved_articles[article] = None
+                elif record[0] == JobJournal.UNSPILL:
+                    _, nzf_id, article_id = record
+                    article = find_article(nzf_id, article_id)
+                    if article and self.spill:
+                        self.spill.purge([article], self.admin_path)
+                        self.saved_articles.pop(article, None)
+                elif record[0] == JobJournal.COUNTER:
+                    if record[1] not in self.nzo_info:
+                        self.nzo_info[record[1]] = 0
+                    self.nzo_info[record[1]] += 1
+                    self.bad_articles += 1
+            except:
+                logging.info("Failed to apply change %s to %s", record, self.final_name, exc_info=True)
+
+        # Start with a fresh journal
+        self.save_to_disk()
 
     def save_attribs(self):
         """ Save specific attributes for Retry """
@@ -2000,17 +2300,27 @@ class NzbObject(TryList):
         self.url_tries = 0
         self.to_be_removed = False
         self.direct_unpacker = None
+        if self.journal_seq is None:
+            self.journal_seq = 0
+        self.journal = JobJournal(self.journal_seq)
         if self.meta is None:
             self.meta = {}
         if self.servercount is None:
             self.servercount = {}
         if self.md5of16k is None:
             self.md5of16k = {}
+        if self.par2slices is None:
+            self.par2slices = {}
         if self.renames is None:
             self.renames = {}
         if self.bad_articles is None:
             self.bad_articles = 0
             self.first_articles_count = 0
+        # Convert jobs from older versions, that used lists
+        if not isinstance(self.first_articles, dict):
+            self.first_articles = dict.fromkeys(self.first_articles or [])
+        if not isinstance(self.saved_articles, dict):
+            self.saved_articles = dict.fromkeys(self.saved_articles or [])
         if self.bytes_missing is None:
             self.bytes_missing = 0
         if self.bytes_tried is None:
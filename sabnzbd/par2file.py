@@ -18,21 +18,35 @@
 """
 sabnzbd.par2file - All par2-related functionality
 """
+import functools
 import hashlib
 import logging
+import mmap
 import os
 import re
 import struct
-from typing import Dict, Optional, Tuple
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from typing import Dict, Optional, Tuple, List
 
 from sabnzbd.encoding import correct_unknown_encoding
 
 PROBABLY_PAR2_RE = re.compile(r"(.*)\.vol(\d*)[+\-](\d*)\.par2", re.I)
 PAR_PKT_ID = b"PAR2\x00PKT"
 PAR_FILE_ID = b"PAR 2.0\x00FileDesc"
-PAR_CREATOR_ID = b"PAR 2.0\x00Creator"
+PAR_CREATOR_ID = b"PAR 2.0\x00Creator\x00"
+PAR_MAIN_ID = b"PAR 2.0\x00Main\x00\x00\x00\x00"
+PAR_SLICE_ID = b"PAR 2.0\x00IFSC\x00\x00\x00\x00"
 PAR_RECOVERY_ID = b"RecvSlic"
 
+# Size of the slices and the MD5 and CRC32 of each slice of a file
+Par2Slices = Tuple[int, List[Tuple[bytes, int]]]
+
+# The files are read in blocks, by multiple threads at the same time
+VERIFY_BLOCK_SIZE = 1024 * 1024
+VERIFY_THREADS = min(4, os.cpu_count() or 1)
+
 
 def is_parfile(filename: str) -> bool:
     """Check quickly whether file has par2 signature
@@ -83,23 +97,39 @@ def analyse_par2(name: str, filepath: Optional[str] = None) -> Tuple[str, int, i
     return setname, vol, block
 
 
-def parse_par2_file(fname: str, md5of16k: Dict[bytes, str]) -> Dict[str, bytes]:
+def parse_par2_file(
+    fname: str, md5of16k: Dict[bytes, str], slices: Optional[Dict[str, Par2Slices]] = None
+) -> Dict[str, bytes]:
     """Get the hash table and the first-16k hash table from a PAR2 file
     Return as dictionary, indexed on names or hashes for the first-16 table
     The input md5of16k is modified in place and thus not returned!
+    When slices is given, the size and checksums of the slices of each file are added to it
 
     For a full description of the par2 specification, visit:
     http://parchive.sourceforge.net/docs/specifications/parity-volume-spec/article-spec.html
     """
     table = {}
     duplicates16k = []
+    slice_size = 0
+    file_ids = {}
+    checksums = {}
 
     try:
         with open(fname, "rb") as f:
             header = f.read(8)
             while header:
-                name, filehash, hash16k = parse_par2_file_packet(f, header)
-                if name:
+                packet_type, body = parse_par2_file_packet(f, header)
+                if packet_type == PAR_FILE_ID:
+                    # The FileDesc packet looks like:
+                    # 16 : FileId
+                    # 16 : Hash for full file **
+                    # 16 : Hash for first 16K
+                    #  8 : File length
+                    # xx : Name (multiple of 4, padded with \0 if needed) **
+                    name = correct_unknown_encoding(body[56:].strip(b"\0"))
+                    filehash = body[16:32]
+                    hash16k = body[32:48]
+                    file_ids[body[:16]] = name
                     table[name] = filehash
                     if hash16k not in md5of16k:
                         md5of16k[hash16k] = name
@@ -107,6 +137,22 @@ def parse_par2_file(fname: str, md5of16k: Dict[bytes, str]) -> Dict[str, bytes]:
                         # Not unique and not already linked to this file
                         # Remove to avoid false-renames
                         duplicates16k.append(hash16k)
+                elif packet_type == PAR_MAIN_ID:
+                    # The Main packet starts with the slice size
+                    slice_size = struct.unpack("<Q", body[:8])[0]
+                elif packet_type == PAR_SLICE_ID:
+                    # The IFSC packet has the FileId, followed by the MD5 and CRC32 of each slice
+                    checksums[body[:16]] = [
+                        (body[offset : offset + 16], struct.unpack("<I", body[offset + 16 : offset + 20])[0])
+                        for offset in range(16, len(body) - 19, 20)
+                    ]
+                elif packet_type == PAR_CREATOR_ID:
+                    # From here until the end is the creator-text
+                    # Useful in case of bugs in the par2-creating software
+                    par2creator = body.strip(b"\0")  # Remove any trailing \0
+                    logging.debug(
+                        "Par2-creator of %s is: %s", os.path.basename(fname), correct_unknown_encoding(par2creator)
+                    )
 
                 header = f.read(8)
 
@@ -126,13 +172,19 @@ def parse_par2_file(fname: str, md5of16k: Dict[bytes, str]) -> Dict[str, bytes]:
             old_name = md5of16k.pop(hash16k)
             logging.debug("Par2-16k signature of %s not unique, discarding", old_name)
 
+    # The packets can be in any order, so they are only combined at the end
+    if table and slices is not None and slice_size:
+        for file_id, name in file_ids.items():
+            if file_id in checksums:
+                slices[name] = (slice_size, checksums[file_id])
+
     return table
 
 
-def parse_par2_file_packet(f, header) -> Tuple[Optional[str], Optional[bytes], Optional[bytes]]:
-    """ Look up and analyze a FileDesc package """
+def parse_par2_file_packet(f, header) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """ Read a packet and return its type and body, if the packet is valid """
 
-    nothing = None, None, None
+    nothing = None, None
 
     if header != PAR_PKT_ID:
         return nothing
@@ -152,25 +204,145 @@ def parse_par2_file_packet(f, header) -> Tuple[Optional[str], Optional[bytes], O
     if md5sum != md5.digest():
         return nothing
 
-    # The FileDesc packet looks like:
-    # 16 : "PAR 2.0\0FileDesc"
-    # 16 : FileId
-    # 16 : Hash for full file **
-    # 16 : Hash for first 16K
-    #  8 : File length
-    # xx : Name (multiple of 4, padded with \0 if needed) **
-
-    # See if it's the right packet and get name + hash
-    for offset in range(0, pack_len, 8):
-        if data[offset : offset + 16] == PAR_FILE_ID:
-            filehash = data[offset + 32 : offset + 48]
-            hash16k = data[offset + 48 : offset + 64]
-            filename = correct_unknown_encoding(data[offset + 72 :].strip(b"\0"))
-            return filename, filehash, hash16k
-        elif data[offset : offset + 15] == PAR_CREATOR_ID:
-            # From here until the end is the creator-text
-            # Useful in case of bugs in the par2-creating software
-            par2creator = data[offset + 16 :].strip(b"\0")  # Remove any trailing \0
-            logging.debug("Par2-creator of %s is: %s", os.path.basename(f.name), correct_unknown_encoding(par2creator))
-
-    return nothing
+    # The data starts with the Recovery Set ID and the packet type
+    return data[16:32], data[32:]
+
+
+def damaged_slices(expected: List[Tuple[bytes, int]], calculated: List[Tuple[bytes, int]]) -> List[int]:
+    """ Return the numbers of the slices of which the checksums don't match those in the par2 file """
+    return [num for num, checksums in enumerate(zip_longest(calculated, expected)) if checksums[0] != checksums[1]]
+
+
+class FileHasher:
+    """Calculates the MD5 and CRC32 of a file while it is written, together
+    with the MD5 and CRC32 of each par2 slice when the slice size is known.
+    The data has to be fed in order.
+    """
+
+    __slots__ = ("md5", "crc32", "offset", "slice_size", "slice_md5", "slice_crc32", "slices")
+
+    def __init__(self, slice_size: int = 0):
+        self.md5 = hashlib.md5()
+        self.crc32 = 0
+        self.offset = 0
+        self.slice_size = slice_size
+        self.slice_md5 = hashlib.md5()
+        self.slice_crc32 = 0
+        self.slices: Optional[List[Tuple[bytes, int]]] = [] if slice_size else None
+
+    def update(self, data: bytes):
+        self.md5.update(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        if not self.slice_size:
+            self.offset += len(data)
+            return
+
+        view = memoryview(data)
+        while view:
+            part = view[: self.slice_size - self.offset % self.slice_size]
+            self.slice_md5.update(part)
+            self.slice_crc32 = zlib.crc32(part, self.slice_crc32)
+            self.offset += len(part)
+            view = view[len(part) :]
+            if not self.offset % self.slice_size:
+                self.end_slice()
+
+    def end_slice(self):
+        self.slices.append((self.slice_md5.digest(), self.slice_crc32 & 0xFFFFFFFF))
+        self.slice_md5 = hashlib.md5()
+        self.slice_crc32 = 0
+
+    def finish(self):
+        """ The checksums of the last slice are calculated as if it was padded with zeros """
+        if self.slice_size and self.offset % self.slice_size:
+            padding = bytes(self.slice_size - self.offset % self.slice_size)
+            self.slice_md5.update(padding)
+            self.slice_crc32 = zlib.crc32(padding, self.slice_crc32)
+            self.end_slice()
+
+
+def hash_file(path: str, hasher):
+    """ Feed the data of the file to the hasher, using a memory-map when possible """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OverflowError, OSError):
+            # Empty files or files that don't fit in the address space
+            for block in iter(functools.partial(f.read, VERIFY_BLOCK_SIZE), b""):
+                hasher.update(block)
+            return
+
+        with data, memoryview(data) as view:
+            for offset in range(0, len(view), VERIFY_BLOCK_SIZE):
+                hasher.update(view[offset : offset + VERIFY_BLOCK_SIZE])
+
+
+def verify_par2_file(path: str, filehash: bytes, slices: Optional[Par2Slices]) -> int:
+    """ Return the number of slices of the file that have to be repaired """
+    md5 = hashlib.md5()
+    hash_file(path, md5)
+    if md5.digest() == filehash:
+        return 0
+
+    # Only damaged files are checked per slice
+    if not slices:
+        return 1
+    slice_size, checksums = slices
+    hasher = FileHasher(slice_size)
+    hash_file(path, hasher)
+    hasher.finish()
+    return len(damaged_slices(checksums, hasher.slices))
+
+
+def verify_par2_set(parfile: str, workdir: str) -> Tuple[bool, Dict[str, str], int]:
+    """Verify the files of a par2 set in-process, the files are checked in parallel.
+    Files that were renamed are found using the hash of their first 16k.
+    Return whether all files are correct, the renames that are needed (name: current name)
+    and the number of slices that have to be repaired.
+    """
+    md5of16k = {}
+    slices = {}
+    table = parse_par2_file(parfile, md5of16k, slices)
+    if not table:
+        return False, {}, 0
+
+    files = {}
+    candidates = []
+    for filename in os.listdir(workdir):
+        path = os.path.join(workdir, filename)
+        if not os.path.isfile(path):
+            continue
+        if filename in table:
+            files[filename] = path
+        elif not is_parfile(path):
+            candidates.append(path)
+
+    # Files with another name can only be one of the missing files
+    renames = {}
+    for path in candidates:
+        with open(path, "rb") as f:
+            name = md5of16k.get(hashlib.md5(f.read(16384)).digest())
+        if name in table and name not in files and name not in renames:
+            renames[name] = os.path.basename(path)
+            files[name] = path
+
+    with ThreadPoolExecutor(max_workers=VERIFY_THREADS) as executor:
+        futures = {
+            name: executor.submit(verify_par2_file, path, table[name], slices.get(name)) for name, path in files.items()
+        }
+    damaged = {name: future.result() for name, future in futures.items()}
+
+    # Only keep the renames of files that are correct
+    for name in list(renames):
+        if damaged[name]:
+            del renames[name]
+            del files[name]
+
+    # Everything of the files that were not found needs to be repaired
+    damaged_total = sum(damaged[name] for name in files)
+    for name in table:
+        if name not in files:
+            damaged_total += len(slices[name][1]) if name in slices else 1
+
+    logging.debug("Par2 verification of %s: %s slices damaged, renames: %s", parfile, damaged_total, renames)
+    return not damaged_total, renames, damaged_total
@@ -26,7 +26,7 @@ import time
 import re
 import gc
 import queue
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Callable
 
 import sabnzbd
 from sabnzbd.newsunpack import (
@@ -38,7 +38,7 @@ from sabnzbd.newsunpack import (
     rar_sort,
     is_sfv_file,
 )
-from threading import Thread
+from threading import Thread, Semaphore, Lock, current_thread
 from sabnzbd.misc import on_cleanup_list
 from sabnzbd.filesystem import (
     real_path,
@@ -98,7 +98,10 @@ RE_SAMPLE = re.compile(sample_match, re.I)
 
 
 class PostProcessor(Thread):
-    """ PostProcessor thread, designed as Singleton """
+    """PostProcessor thread, designed as Singleton
+    The thread itself only decides which job is next, the steps of the
+    post-processing are done by the workers of each stage.
+    """
 
     def __init__(self):
         """ Initialize PostProcessor thread """
@@ -118,15 +121,28 @@ class PostProcessor(Thread):
         for nzo in self.history_queue:
             self.process(nzo)
 
-        # So we can always cancel external processes
-        self.external_process: Optional[subprocess.Popen] = None
+        # Each step has its own workers, so a long repair doesn't hold up the other steps
+        self.stages: List[PostProcessingStage] = [
+            PostProcessingStage(self, "verify", PostProcessingJob.verify, cfg.pp_verify_workers()),
+            PostProcessingStage(self, "unpack", PostProcessingJob.unpack, cfg.pp_unpack_workers()),
+            PostProcessingStage(self, "move", PostProcessingJob.move, cfg.pp_move_workers()),
+            PostProcessingStage(self, "script", PostProcessingJob.script, cfg.pp_script_workers()),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+        # Jobs are only taken from the queues when they can be verified right away,
+        # otherwise the order of the fast and slow jobs would be lost
+        self.verify_slots = Semaphore(len(self.stages[0].workers))
 
         # Counter to not only process fast-jobs
         self.__fast_job_count = 0
 
         # State variables
         self.__stop = False
-        self.__busy = False
+        self.__check_eoq = False
+        self.active_jobs = 0
+        self.active_lock = Lock()
         self.paused = False
 
     def save(self):
@@ -187,12 +203,47 @@ class PostProcessor(Thread):
         self.save()
         sabnzbd.history_updated()
 
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        super().start()
+
+    def is_alive(self) -> bool:
+        # Check all workers
+        for stage in self.stages:
+            if not stage.is_alive():
+                return False
+        return super().is_alive()
+
     def stop(self):
-        """ Stop thread after finishing running job """
+        """ Stop thread after finishing running jobs """
         self.__stop = True
         self.slow_queue.put(None)
         self.fast_queue.put(None)
 
+    def join(self, timeout=None):
+        # The jobs that were started have to pass all stages, so
+        # the stages are stopped in order after the next job is picked
+        super().join(timeout)
+        for stage in self.stages:
+            stage.stop()
+            stage.join()
+
+    @property
+    def external_process(self) -> Optional[subprocess.Popen]:
+        """ The external process that is run for the job of the calling worker """
+        worker = current_thread()
+        if isinstance(worker, PostProcessingWorker):
+            return worker.external_process
+        return None
+
+    @external_process.setter
+    def external_process(self, process: Optional[subprocess.Popen]):
+        # Store it with the worker, so it can be killed when its job is canceled
+        worker = current_thread()
+        if isinstance(worker, PostProcessingWorker):
+            worker.external_process = process
+
     def cancel_pp(self, nzo_id):
         """ Change the status, so that the PP is canceled """
         for nzo in self.history_queue:
@@ -200,18 +251,21 @@ class PostProcessor(Thread):
                 nzo.abort_direct_unpacker()
                 if nzo.pp_active:
                     nzo.pp_active = False
-                    try:
-                        # Try to kill any external running process
-                        self.external_process.kill()
-                        logging.info("Killed external process %s", self.external_process.args[0])
-                    except:
-                        pass
+                    for stage in self.stages:
+                        for worker in stage.workers:
+                            if worker.nzo is nzo and worker.external_process:
+                                try:
+                                    # Try to kill any external running process
+                                    worker.external_process.kill()
+                                    logging.info("Killed external process %s", worker.external_process.args[0])
+                                except:
+                                    pass
                 return True
         return None
 
     def empty(self):
         """ Return True if pp queue is empty """
-        return self.slow_queue.empty() and self.fast_queue.empty() and not self.__busy
+        return self.slow_queue.empty() and self.fast_queue.empty() and not self.active_jobs
 
     def get_queue(self):
         """ Return list of NZOs that still need to be processed """
@@ -224,6 +278,10 @@ class PostProcessor(Thread):
                 return nzo.download_path
         return None
 
+    def stage_info(self) -> List[Dict[str, Any]]:
+        """ Return the load and the total time spent of each stage """
+        return [stage.info() for stage in self.stages]
+
     def run(self):
         """ Postprocessor loop """
         # First we do a dircheck
@@ -237,14 +295,15 @@ class PostProcessor(Thread):
             logging.info("Completed Download Folder %s is not on FAT", complete_dir)
 
         # Start looping
-        check_eoq = False
         while not self.__stop:
-            self.__busy = False
-
             if self.paused:
                 time.sleep(5)
                 continue
 
+            # Wait until a verify worker is available
+            if not self.verify_slots.acquire(timeout=2):
+                continue
+
             # Set NzbObject object to None so references from this thread do not keep the
             # object alive until the next job is added to post-processing (see #1628)
             nzo = None
@@ -265,20 +324,23 @@ class PostProcessor(Thread):
                     # Reset fast-counter
                     self.__fast_job_count = 0
                 except queue.Empty:
+                    self.verify_slots.release()
                     # Check for empty queue
-                    if check_eoq:
-                        check_eoq = False
+                    if self.__check_eoq and not self.active_jobs:
+                        self.__check_eoq = False
                         handle_empty_queue()
                     # No fast or slow jobs, better luck next loop!
                     continue
 
             # Stop job
             if not nzo:
+                self.verify_slots.release()
                 continue
 
             # Job was already deleted.
             if not nzo.work_name:
-                check_eoq = True
+                self.verify_slots.release()
+                self.__check_eoq = True
                 continue
 
             # Flag NZO as being processed
@@ -288,106 +350,231 @@ class PostProcessor(Thread):
             if cfg.pause_on_post_processing():
                 sabnzbd.Downloader.wait_for_postproc()
 
-            self.__busy = True
+            with self.active_lock:
+                self.active_jobs += 1
+            self.stages[0].queue.put(PostProcessingJob(nzo))
 
-            process_job(nzo)
+    def job_done(self, nzo: NzbObject):
+        """ Called by the worker that finished the last step of a job """
+        if nzo.to_be_removed:
+            with database.HistoryDB() as history_db:
+                history_db.remove_history(nzo.nzo_id)
+            nzo.purge_data()
 
-            if nzo.to_be_removed:
-                with database.HistoryDB() as history_db:
-                    history_db.remove_history(nzo.nzo_id)
-                nzo.purge_data()
+        # Processing done
+        nzo.pp_active = False
+        self.remove(nzo)
 
-            # Processing done
-            nzo.pp_active = False
+        with self.active_lock:
+            self.active_jobs -= 1
+            all_done = not self.active_jobs
+        self.__check_eoq = True
 
-            self.remove(nzo)
-            self.external_process = None
-            check_eoq = True
-
-            # Allow download to proceed
+        # Allow download to proceed
+        if all_done:
             sabnzbd.Downloader.resume_from_postproc()
 
 
-def process_job(nzo: NzbObject):
-    """ Process one job """
-    start = time.time()
+class PostProcessingStage:
+    """ Queue and workers for one step of the post-processing """
+
+    def __init__(self, postprocessor: PostProcessor, name: str, step: Callable, num_workers: int):
+        self.postprocessor = postprocessor
+        self.name = name
+        self.step = step
+        self.next_stage: Optional[PostProcessingStage] = None
+        self.queue: queue.Queue[Optional[PostProcessingJob]] = queue.Queue()
+        self.workers: List[PostProcessingWorker] = []
+        for _ in range(max(1, num_workers)):
+            self.workers.append(PostProcessingWorker(self))
+
+        # Statistics
+        self.busy = 0
+        self.jobs = 0
+        self.time = 0.0
+        self.stats_lock = Lock()
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def is_alive(self) -> bool:
+        for worker in self.workers:
+            if not worker.is_alive():
+                return False
+        return True
 
-    # keep track of whether we can continue
-    all_ok = True
-    # keep track of par problems
-    par_error = False
-    # keep track of any unpacking errors
-    unpack_error = False
-    # Signal empty download, for when 'empty_postproc' is enabled
-    empty = False
-    nzb_list = []
-    # These need to be initialized in case of a crash
-    workdir_complete = ""
-    script_log = ""
-    script_line = ""
-
-    # Get the job flags
-    nzo.save_attribs()
-    flag_repair, flag_unpack, flag_delete = nzo.repair_opts
-    # Normalize PP
-    if flag_delete:
-        flag_unpack = True
-    if flag_unpack:
-        flag_repair = True
-
-    # Get the NZB name
-    filename = nzo.final_name
-
-    # Download-processes can mark job as failed, skip all steps
-    if nzo.fail_msg:
-        all_ok = False
-        par_error = True
-        unpack_error = 1
+    def stop(self):
+        for _ in self.workers:
+            self.queue.put(None)
 
-    try:
-        # Get the folder containing the download result
-        workdir = nzo.download_path
-        tmp_workdir_complete = None
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "workers": len(self.workers),
+            "busy": self.busy,
+            "queue": self.queue.qsize(),
+            "jobs": self.jobs,
+            "time": round(self.time, 1),
+        }
+
+
+class PostProcessingWorker(Thread):
+    """ Worker that runs one step of the post-processing """
+
+    def __init__(self, stage: PostProcessingStage):
+        super().__init__()
+        self.stage = stage
+        self.postprocessor = stage.postprocessor
+
+        # The job that is worked on, and its external process so it can be aborted
+        self.nzo: Optional[NzbObject] = None
+        self.external_process: Optional[subprocess.Popen] = None
+
+    def run(self):
+        while 1:
+            job = self.stage.queue.get()
+            if not job:
+                logging.debug("Shutting down post-processing %s worker", self.stage.name)
+                break
+
+            self.nzo = job.nzo
+            with self.stage.stats_lock:
+                self.stage.busy += 1
+            start = time.time()
+
+            try:
+                # A step returns False when the job left post-processing
+                next_step = self.stage.step(job)
+            except:
+                job.abort()
+                next_step = None
+
+            try:
+                if next_step and self.stage.next_stage:
+                    self.stage.next_stage.queue.put(job)
+                else:
+                    if next_step is not False:
+                        job.finish()
+                    self.postprocessor.job_done(job.nzo)
+            except:
+                logging.error(T("Post Processing Failed for %s (%s)"), job.filename, T("see logfile"))
+                logging.info("Traceback: ", exc_info=True)
+            finally:
+                # The next job can be verified
+                if self.stage is self.postprocessor.stages[0]:
+                    self.postprocessor.verify_slots.release()
+
+            duration = time.time() - start
+            logging.debug("Post-processing %s of %s took %.1f seconds", self.stage.name, job.filename, duration)
+            with self.stage.stats_lock:
+                self.stage.busy -= 1
+                self.stage.jobs += 1
+                self.stage.time += duration
+
+            # Don't keep the job alive until the next one arrives (see #1628)
+            self.nzo = None
+            self.external_process = None
+            job = None
+
+
+class PostProcessingJob:
+    """The state of a job that is passed from stage to stage
+    Steps return False when the job has to be downloaded further
+    """
+
+    def __init__(self, nzo: NzbObject):
+        self.nzo = nzo
+        self.start = time.time()
+
+        # keep track of whether we can continue
+        self.all_ok = True
+        # keep track of par problems
+        self.par_error = False
+        # keep track of any unpacking errors
+        self.unpack_error = False
+        # Signal empty download, for when 'empty_postproc' is enabled
+        self.empty = False
+        self.nzb_list = []
+        # These need to be initialized in case of a crash
+        self.workdir = nzo.download_path
+        self.workdir_complete = ""
+        self.tmp_workdir_complete = None
+        self.file_sorter: Optional[Sorter] = None
+        self.one_folder = False
+        self.marker_file = None
+        self.newfiles = []
+        self.job_result = 0
+        self.script_name = nzo.script
+        self.script_log = ""
+        self.script_line = ""
+
+        # Get the NZB name
+        self.filename = nzo.final_name
+
+        self.flag_repair = self.flag_unpack = self.flag_delete = False
+
+    def verify(self) -> bool:
+        """ Check that there is a result and run the par2 verification and repair """
+        nzo = self.nzo
+
+        # Get the job flags
+        nzo.save_attribs()
+        self.flag_repair, self.flag_unpack, self.flag_delete = nzo.repair_opts
+        # Normalize PP
+        if self.flag_delete:
+            self.flag_unpack = True
+        if self.flag_unpack:
+            self.flag_repair = True
+
+        # Download-processes can mark job as failed, skip all steps
+        if nzo.fail_msg:
+            self.all_ok = False
+            self.par_error = True
+            self.unpack_error = 1
 
         # if no files are present (except __admin__), fail the job
-        if all_ok and len(globber(workdir)) < 2:
+        if self.all_ok and len(globber(self.workdir)) < 2:
             if nzo.precheck:
                 _, ratio = nzo.check_availability_ratio()
                 emsg = T("Download might fail, only %s of required %s available") % (ratio, cfg.req_completion_rate())
             else:
                 emsg = T("Download failed - Not on your server(s)")
-                empty = True
+                self.empty = True
             emsg += " - https://sabnzbd.org/not-complete"
             nzo.fail_msg = emsg
             nzo.set_unpack_info("Download", emsg)
             nzo.status = Status.FAILED
             # do not run unpacking or parity verification
-            flag_repair = flag_unpack = False
-            all_ok = cfg.empty_postproc() and empty
-            if not all_ok:
-                par_error = True
-                unpack_error = 1
+            self.flag_repair = self.flag_unpack = False
+            self.all_ok = cfg.empty_postproc() and self.empty
+            if not self.all_ok:
+                self.par_error = True
+                self.unpack_error = 1
 
-        script = nzo.script
         logging.info(
             "Starting Post-Processing on %s => Repair:%s, Unpack:%s, Delete:%s, Script:%s, Cat:%s",
-            filename,
-            flag_repair,
-            flag_unpack,
-            flag_delete,
-            script,
+            self.filename,
+            self.flag_repair,
+            self.flag_unpack,
+            self.flag_delete,
+            self.script_name,
             nzo.cat,
         )
 
         # Set complete dir to workdir in case we need to abort
-        workdir_complete = workdir
+        self.workdir_complete = self.workdir
 
         # Send post-processing notification
         notifier.send_notification(T("Post-processing"), nzo.final_name, "pp", nzo.cat)
 
         # Par processing, if enabled
-        if all_ok and flag_repair:
-            par_error, re_add = parring(nzo, workdir)
+        if self.all_ok and self.flag_repair:
+            self.par_error, re_add = parring(nzo, self.workdir)
             if re_add:
                 # Try to get more par files
                 return False
@@ -396,183 +583,209 @@ def process_job(nzo: NzbObject):
         if sabnzbd.NzbQueue.actives(grabs=False) == 0 and cfg.autodisconnect():
             # This was the last job, close server connections
             sabnzbd.Downloader.disconnect()
+        return True
+
+    def unpack(self) -> bool:
+        """ Prepare the destination and extract the archives """
+        nzo = self.nzo
 
         # Sanitize the resulting files
         if sabnzbd.WIN32:
-            sanitize_files_in_folder(workdir)
+            sanitize_files_in_folder(self.workdir)
 
         # Check if user allows unsafe post-processing
-        if flag_repair and cfg.safe_postproc():
-            all_ok = all_ok and not par_error
+        if self.flag_repair and cfg.safe_postproc():
+            self.all_ok = self.all_ok and not self.par_error
 
-        if all_ok:
+        if self.all_ok:
             # Fix encodings
-            fix_unix_encoding(workdir)
+            fix_unix_encoding(self.workdir)
 
             # Use dirs generated by direct-unpacker
             if nzo.direct_unpacker and nzo.direct_unpacker.unpack_dir_info:
                 (
-                    tmp_workdir_complete,
-                    workdir_complete,
-                    file_sorter,
-                    one_folder,
-                    marker_file,
+                    self.tmp_workdir_complete,
+                    self.workdir_complete,
+                    self.file_sorter,
+                    self.one_folder,
+                    self.marker_file,
                 ) = nzo.direct_unpacker.unpack_dir_info
             else:
                 # Generate extraction path
-                tmp_workdir_complete, workdir_complete, file_sorter, one_folder, marker_file = prepare_extraction_path(
-                    nzo
-                )
+                (
+                    self.tmp_workdir_complete,
+                    self.workdir_complete,
+                    self.file_sorter,
+                    self.one_folder,
+                    self.marker_file,
+                ) = prepare_extraction_path(nzo)
 
-            newfiles = []
             # Run Stage 2: Unpack
-            if flag_unpack:
+            if self.flag_unpack:
                 # Set the current nzo status to "Extracting...". Used in History
                 nzo.status = Status.EXTRACTING
-                logging.info("Running unpack_magic on %s", filename)
-                unpack_error, newfiles = unpack_magic(
-                    nzo, workdir, tmp_workdir_complete, flag_delete, one_folder, (), (), (), (), ()
+                logging.info("Running unpack_magic on %s", self.filename)
+                self.unpack_error, self.newfiles = unpack_magic(
+                    nzo, self.workdir, self.tmp_workdir_complete, self.flag_delete, self.one_folder, (), (), (), (), ()
                 )
-                logging.info("Unpacked files %s", newfiles)
+                logging.info("Unpacked files %s", self.newfiles)
 
                 if sabnzbd.WIN32:
                     # Sanitize the resulting files
-                    newfiles = sanitize_files_in_folder(tmp_workdir_complete)
-                logging.info("Finished unpack_magic on %s", filename)
+                    self.newfiles = sanitize_files_in_folder(self.tmp_workdir_complete)
+                logging.info("Finished unpack_magic on %s", self.filename)
 
             if cfg.safe_postproc():
-                all_ok = all_ok and not unpack_error
+                self.all_ok = self.all_ok and not self.unpack_error
+        return True
+
+    def move(self) -> bool:
+        """ Move the files to the destination, then rename and sort them """
+        nzo = self.nzo
 
-            if all_ok:
+        # Only when the destination was prepared
+        if self.tmp_workdir_complete:
+            if self.all_ok:
                 # Move any (left-over) files to destination
                 nzo.status = Status.MOVING
                 nzo.set_action_line(T("Moving"), "...")
-                for root, _dirs, files in os.walk(workdir):
+                for root, _dirs, files in os.walk(self.workdir):
                     if not root.endswith(JOB_ADMIN):
                         for file_ in files:
                             path = os.path.join(root, file_)
-                            new_path = path.replace(workdir, tmp_workdir_complete)
+                            new_path = path.replace(self.workdir, self.tmp_workdir_complete)
                             ok, new_path = move_to_path(path, new_path)
                             if new_path:
-                                newfiles.append(new_path)
+                                self.newfiles.append(new_path)
                             if not ok:
                                 nzo.set_unpack_info("Unpack", T("Failed moving %s to %s") % (path, new_path))
-                                all_ok = False
+                                self.all_ok = False
                                 break
 
             # Set permissions right
-            set_permissions(tmp_workdir_complete)
+            set_permissions(self.tmp_workdir_complete)
 
-            if all_ok and marker_file:
-                del_marker(os.path.join(tmp_workdir_complete, marker_file))
-                remove_from_list(marker_file, newfiles)
+            if self.all_ok and self.marker_file:
+                del_marker(os.path.join(self.tmp_workdir_complete, self.marker_file))
+                remove_from_list(self.marker_file, self.newfiles)
 
-            if all_ok:
+            if self.all_ok:
                 # Remove files matching the cleanup list
-                cleanup_list(tmp_workdir_complete, skip_nzb=True)
+                cleanup_list(self.tmp_workdir_complete, skip_nzb=True)
 
                 # Check if this is an NZB-only download, if so redirect to queue
                 # except when PP was Download-only
-                if flag_repair:
-                    nzb_list = nzb_redirect(tmp_workdir_complete, nzo.final_name, nzo.pp, script, nzo.cat, nzo.priority)
+                if self.flag_repair:
+                    self.nzb_list = nzb_redirect(
+                        self.tmp_workdir_complete, nzo.final_name, nzo.pp, self.script_name, nzo.cat, nzo.priority
+                    )
                 else:
-                    nzb_list = None
-                if nzb_list:
-                    nzo.set_unpack_info("Download", T("Sent %s to queue") % nzb_list)
-                    cleanup_empty_directories(tmp_workdir_complete)
+                    self.nzb_list = None
+                if self.nzb_list:
+                    nzo.set_unpack_info("Download", T("Sent %s to queue") % self.nzb_list)
+                    cleanup_empty_directories(self.tmp_workdir_complete)
                 else:
                     # Full cleanup including nzb's
-                    cleanup_list(tmp_workdir_complete, skip_nzb=False)
+                    cleanup_list(self.tmp_workdir_complete, skip_nzb=False)
 
-        script_output = ""
-        script_ret = 0
-        if not nzb_list:
+        if not self.nzb_list:
             # Give destination its final name
-            if cfg.folder_rename() and tmp_workdir_complete and not one_folder:
-                if not all_ok:
+            if cfg.folder_rename() and self.tmp_workdir_complete and not self.one_folder:
+                if not self.all_ok:
                     # Rename failed folders so they are easy to recognize
-                    workdir_complete = tmp_workdir_complete.replace("_UNPACK_", "_FAILED_")
-                    workdir_complete = get_unique_path(workdir_complete, create_dir=False)
+                    self.workdir_complete = self.tmp_workdir_complete.replace("_UNPACK_", "_FAILED_")
+                    self.workdir_complete = get_unique_path(self.workdir_complete, create_dir=False)
 
                 try:
-                    newfiles = rename_and_collapse_folder(tmp_workdir_complete, workdir_complete, newfiles)
+                    self.newfiles = rename_and_collapse_folder(
+                        self.tmp_workdir_complete, self.workdir_complete, self.newfiles
+                    )
                 except:
                     logging.error(
                         T('Error renaming "%s" to "%s"'),
-                        clip_path(tmp_workdir_complete),
-                        clip_path(workdir_complete),
+                        clip_path(self.tmp_workdir_complete),
+                        clip_path(self.workdir_complete),
                     )
                     logging.info("Traceback: ", exc_info=True)
                     # Better disable sorting because filenames are all off now
-                    file_sorter.sort_file = None
+                    self.file_sorter.sort_file = None
 
-            if empty:
-                job_result = -1
+            if self.empty:
+                self.job_result = -1
             else:
-                job_result = int(par_error) + int(bool(unpack_error)) * 2
+                self.job_result = int(self.par_error) + int(bool(self.unpack_error)) * 2
 
             if cfg.ignore_samples():
-                remove_samples(workdir_complete)
+                remove_samples(self.workdir_complete)
 
             # TV/Movie/Date Renaming code part 2 - rename and move files to parent folder
-            if all_ok and file_sorter.sort_file:
-                if newfiles:
-                    file_sorter.rename(newfiles, workdir_complete)
-                    workdir_complete, ok = file_sorter.move(workdir_complete)
+            if self.all_ok and self.file_sorter.sort_file:
+                if self.newfiles:
+                    self.file_sorter.rename(self.newfiles, self.workdir_complete)
+                    self.workdir_complete, ok = self.file_sorter.move(self.workdir_complete)
                 else:
-                    workdir_complete, ok = file_sorter.rename_with_ext(workdir_complete)
+                    self.workdir_complete, ok = self.file_sorter.rename_with_ext(self.workdir_complete)
                 if not ok:
                     nzo.set_unpack_info("Unpack", T("Failed to move files"))
-                    all_ok = False
+                    self.all_ok = False
 
-            if cfg.deobfuscate_final_filenames() and all_ok and not nzb_list:
+            if cfg.deobfuscate_final_filenames() and self.all_ok and not self.nzb_list:
                 # Deobfuscate the filenames
                 logging.info("Running deobfuscate")
-                deobfuscate.deobfuscate_list(newfiles, nzo.final_name)
+                deobfuscate.deobfuscate_list(self.newfiles, nzo.final_name)
+        return True
 
+    def script(self) -> bool:
+        """ Run the user script and report the result """
+        nzo = self.nzo
+        script_output = ""
+        script_ret = 0
+        if not self.nzb_list:
             # Run the user script
-            script_path = make_script_path(script)
-            if (all_ok or not cfg.safe_postproc()) and (not nzb_list) and script_path:
+            script_path = make_script_path(self.script_name)
+            if (self.all_ok or not cfg.safe_postproc()) and (not self.nzb_list) and script_path:
                 # Set the current nzo status to "Ext Script...". Used in History
                 nzo.status = Status.RUNNING
-                nzo.set_action_line(T("Running script"), script)
-                nzo.set_unpack_info("Script", T("Running user script %s") % script, unique=True)
-                script_log, script_ret = external_processing(
-                    script_path, nzo, clip_path(workdir_complete), nzo.final_name, job_result
+                nzo.set_action_line(T("Running script"), self.script_name)
+                nzo.set_unpack_info("Script", T("Running user script %s") % self.script_name, unique=True)
+                self.script_log, script_ret = external_processing(
+                    script_path, nzo, clip_path(self.workdir_complete), nzo.final_name, self.job_result
                 )
-                script_line = get_last_line(script_log)
-                if script_log:
+                self.script_line = get_last_line(self.script_log)
+                if self.script_log:
                     script_output = nzo.nzo_id
-                if script_line:
-                    nzo.set_unpack_info("Script", script_line, unique=True)
+                if self.script_line:
+                    nzo.set_unpack_info("Script", self.script_line, unique=True)
                 else:
-                    nzo.set_unpack_info("Script", T("Ran %s") % script, unique=True)
+                    nzo.set_unpack_info("Script", T("Ran %s") % self.script_name, unique=True)
             else:
-                script = ""
-                script_line = ""
+                self.script_name = ""
+                self.script_line = ""
                 script_ret = 0
 
         # Maybe bad script result should fail job
         if script_ret and cfg.script_can_fail():
             script_error = True
-            all_ok = False
+            self.all_ok = False
             nzo.fail_msg = T("Script exit code is %s") % script_ret
         else:
             script_error = False
 
         # Email the results
-        if (not nzb_list) and cfg.email_endjob():
-            if (cfg.email_endjob() == 1) or (cfg.email_endjob() == 2 and (unpack_error or par_error or script_error)):
+        if (not self.nzb_list) and cfg.email_endjob():
+            if (cfg.email_endjob() == 1) or (
+                cfg.email_endjob() == 2 and (self.unpack_error or self.par_error or script_error)
+            ):
                 emailer.endjob(
                     nzo.final_name,
                     nzo.cat,
-                    all_ok,
-                    workdir_complete,
+                    self.all_ok,
+                    self.workdir_complete,
                     nzo.bytes_downloaded,
                     nzo.fail_msg,
                     nzo.unpack_info,
-                    script,
-                    script_log,
+                    self.script_name,
+                    self.script_log,
                     script_ret,
                 )
 
@@ -582,51 +795,54 @@ def process_job(nzo: NzbObject):
                 script_ret = "Exit(%s) " % script_ret
             else:
                 script_ret = ""
-            if len(script_log.rstrip().split("\n")) > 1:
+            if len(self.script_log.rstrip().split("\n")) > 1:
                 nzo.set_unpack_info(
                     "Script",
                     '%s%s <a href="./scriptlog?name=%s">(%s)</a>'
-                    % (script_ret, script_line, encoding.xml_name(script_output), T("More")),
+                    % (script_ret, self.script_line, encoding.xml_name(script_output), T("More")),
                     unique=True,
                 )
             else:
                 # No '(more)' button needed
-                nzo.set_unpack_info("Script", "%s%s " % (script_ret, script_line), unique=True)
+                nzo.set_unpack_info("Script", "%s%s " % (script_ret, self.script_line), unique=True)
 
         # Cleanup again, including NZB files
-        if all_ok:
-            cleanup_list(workdir_complete, False)
+        if self.all_ok:
+            cleanup_list(self.workdir_complete, False)
 
         # Force error for empty result
-        all_ok = all_ok and not empty
+        self.all_ok = self.all_ok and not self.empty
 
         # Update indexer with results
         if cfg.rating_enable():
             if nzo.encrypted > 0:
                 sabnzbd.Rating.update_auto_flag(nzo.nzo_id, sabnzbd.Rating.FLAG_ENCRYPTED)
-            if empty:
+            if self.empty:
                 hosts = [s.host for s in sabnzbd.Downloader.nzo_servers(nzo)]
                 if not hosts:
                     hosts = [None]
                 for host in hosts:
                     sabnzbd.Rating.update_auto_flag(nzo.nzo_id, sabnzbd.Rating.FLAG_EXPIRED, host)
+        return True
 
-    except:
-        logging.error(T("Post Processing Failed for %s (%s)"), filename, T("see logfile"))
+    def abort(self):
+        """ Called when one of the steps crashed """
+        nzo = self.nzo
+        logging.error(T("Post Processing Failed for %s (%s)"), self.filename, T("see logfile"))
         logging.info("Traceback: ", exc_info=True)
 
         nzo.fail_msg = T("Post-processing was aborted")
-        notifier.send_notification(T("Download Failed"), filename, "failed", nzo.cat)
+        notifier.send_notification(T("Download Failed"), self.filename, "failed", nzo.cat)
         nzo.status = Status.FAILED
-        par_error = True
-        all_ok = False
+        self.par_error = True
+        self.all_ok = False
 
         if cfg.email_endjob():
             emailer.endjob(
                 nzo.final_name,
                 nzo.cat,
-                all_ok,
-                clip_path(workdir_complete),
+                self.all_ok,
+                clip_path(self.workdir_complete),
                 nzo.bytes_downloaded,
                 nzo.fail_msg,
                 nzo.unpack_info,
@@ -635,48 +851,50 @@ def process_job(nzo: NzbObject):
                 0,
             )
 
-    if all_ok:
-        # If the folder only contains one file OR folder, have that as the path
-        # Be aware that series/generic/date sorting may move a single file into a folder containing other files
-        workdir_complete = one_file_or_folder(workdir_complete)
-        workdir_complete = os.path.normpath(workdir_complete)
+    def finish(self):
+        """ Clean up and add the job to the history """
+        nzo = self.nzo
+        if self.all_ok:
+            # If the folder only contains one file OR folder, have that as the path
+            # Be aware that series/generic/date sorting may move a single file into a folder containing other files
+            self.workdir_complete = one_file_or_folder(self.workdir_complete)
+            self.workdir_complete = os.path.normpath(self.workdir_complete)
 
-    # Clean up the NZO data
-    try:
-        nzo.purge_data(delete_all_data=all_ok)
-    except:
-        logging.error(T("Cleanup of %s failed."), nzo.final_name)
-        logging.info("Traceback: ", exc_info=True)
+        # Clean up the NZO data
+        try:
+            nzo.purge_data(delete_all_data=self.all_ok)
+        except:
+            logging.error(T("Cleanup of %s failed."), nzo.final_name)
+            logging.info("Traceback: ", exc_info=True)
 
-    # Use automatic retry link on par2 errors and encrypted/bad RARs
-    if par_error or unpack_error in (2, 3):
-        try_alt_nzb(nzo)
+        # Use automatic retry link on par2 errors and encrypted/bad RARs
+        if self.par_error or self.unpack_error in (2, 3):
+            try_alt_nzb(nzo)
 
-    # Check if it was aborted
-    if not nzo.pp_active:
-        nzo.fail_msg = T("Post-processing was aborted")
-        all_ok = False
+        # Check if it was aborted
+        if not nzo.pp_active:
+            nzo.fail_msg = T("Post-processing was aborted")
+            self.all_ok = False
 
-    # Show final status in history
-    if all_ok:
-        notifier.send_notification(T("Download Completed"), filename, "complete", nzo.cat)
-        nzo.status = Status.COMPLETED
-    else:
-        notifier.send_notification(T("Download Failed"), filename, "failed", nzo.cat)
-        nzo.status = Status.FAILED
+        # Show final status in history
+        if self.all_ok:
+            notifier.send_notification(T("Download Completed"), self.filename, "complete", nzo.cat)
+            nzo.status = Status.COMPLETED
+        else:
+            notifier.send_notification(T("Download Failed"), self.filename, "failed", nzo.cat)
+            nzo.status = Status.FAILED
 
-    # Log the overall time taken for postprocessing
-    postproc_time = int(time.time() - start)
+        # Log the overall time taken for postprocessing
+        postproc_time = int(time.time() - self.start)
 
-    with database.HistoryDB() as history_db:
-        # Add the nzo to the database. Only the path, script and time taken is passed
-        # Other information is obtained from the nzo
-        history_db.add_history_db(nzo, workdir_complete, postproc_time, script_log, script_line)
-        # Purge items
-        history_db.auto_history_purge()
+        with database.HistoryDB() as history_db:
+            # Add the nzo to the database. Only the path, script and time taken is passed
+            # Other information is obtained from the nzo
+            history_db.add_history_db(nzo, self.workdir_complete, postproc_time, self.script_log, self.script_line)
+            # Purge items
+            history_db.auto_history_purge()
 
-    sabnzbd.history_updated()
-    return True
+        sabnzbd.history_updated()
 
 
 def prepare_extraction_path(nzo: NzbObject):
@@ -654,6 +654,10 @@ SKIN_TEXT = {
     "srv-bandwidth": TT("Bandwidth"),
     "srv-send_group": TT("Send Group"),
     "srv-explain-send_group": TT("Send group command before requesting articles."),
+    "srv-pipelining_requests": TT("Articles per request"),
+    "srv-explain-pipelining_requests": TT(
+        "Request multiple articles per connection without waiting for each response first. Can improve download speeds on high-latency connections. Not used when Send Group is enabled."
+    ),
     "srv-notes": TT("Personal notes"),
     "srv-article-availability": TT("Article availability"),
     "srv-articles-tried": TT(
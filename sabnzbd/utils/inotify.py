@@ -0,0 +1,169 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+sabnzbd.utils.inotify - Minimal inotify support using ctypes, only available on Linux
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from typing import Dict, List, Tuple
+
+# Event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# Flags for inotify_init1
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o0004000
+
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    """ Get the C-library, if it offers inotify """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+LIBC = _load_libc()
+
+
+def inotify_available() -> bool:
+    """ Can we use inotify on this system """
+    return LIBC is not None
+
+
+class Inotify:
+    """Watch directories for changes using the inotify API of the kernel.
+    A pipe is added to the poll, so a thread waiting for events can be woken up.
+    """
+
+    def __init__(self):
+        if not LIBC:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = LIBC.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+        self.poller.register(self.wakeup_read, select.POLLIN)
+        self.watches: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int) -> bool:
+        """ Start watching a directory, adding the same path again is allowed """
+        wd = LIBC.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            logging.debug("Cannot watch %s: %s", path, os.strerror(ctypes.get_errno()))
+            return False
+        self.watches[wd] = path
+        return True
+
+    def remove_watch(self, path: str):
+        """ Stop watching a directory """
+        for wd, watched_path in list(self.watches.items()):
+            if watched_path == path:
+                LIBC.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def watched(self) -> List[str]:
+        """ Paths currently being watched """
+        return list(self.watches.values())
+
+    def read_events(self, timeout: float = None) -> List[Tuple[str, str, int]]:
+        """Wait at most timeout seconds (None is forever) for events.
+        Returns the list of (folder, name, mask) that were received.
+        """
+        try:
+            ready = self.poller.poll(None if timeout is None else max(0, int(timeout * 1000)))
+        except InterruptedError:
+            return []
+
+        events = []
+        for fd, _ in ready:
+            if fd == self.wakeup_read:
+                try:
+                    os.read(self.wakeup_read, READ_SIZE)
+                except BlockingIOError:
+                    pass
+                continue
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                continue
+            events.extend(self.parse_events(data))
+        return events
+
+    def parse_events(self, data: bytes) -> List[Tuple[str, str, int]]:
+        """ Decode raw inotify_event structures """
+        events = []
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos : pos + name_len].rstrip(b"\0"))
+            pos += name_len
+            if mask & IN_IGNORED:
+                # Watch was removed by the kernel, for example the folder was deleted
+                self.watches.pop(wd, None)
+                continue
+            events.append((self.watches.get(wd, ""), name, mask))
+        return events
+
+    def wakeup(self):
+        """ Interrupt a thread waiting in read_events """
+        try:
+            os.write(self.wakeup_write, b"\0")
+        except OSError:
+            pass
+
+    def close(self):
+        """ Release the inotify instance """
+        for fd in (self.fd, self.wakeup_read, self.wakeup_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.watches = {}
@@ -64,3 +64,23 @@ class TestApiInternals:
     @set_config({"disable_key": True, "username": "", "password": "bar"})
     def test_auth_unavailable_password_set(self):
         assert api.api_handler({"mode": "auth"}).strip() == "None"
+
+    def test_dashboard_checks(self):
+        with mock.patch("sabnzbd.api._DASHBOARD_CHECKS_TIME", 0), mock.patch(
+            "sabnzbd.api.localipv4", return_value="192.168.1.2"
+        ) as localipv4, mock.patch("sabnzbd.api.publicipv4", return_value="1.2.3.4"), mock.patch(
+            "sabnzbd.api.ipv6", return_value=None
+        ), mock.patch(
+            "sabnzbd.api.addresslookup", side_effect=OSError
+        ):
+            checks = api.dashboard_checks()
+            assert checks == {"localipv4": "192.168.1.2", "publicipv4": "1.2.3.4", "ipv6": None, "dnslookup": None}
+
+            # Within the TTL the previous results are used
+            assert api.dashboard_checks() == checks
+            assert localipv4.call_count == 1
+
+            # After the TTL the checks are repeated
+            api._DASHBOARD_CHECKS_TIME -= api.DASHBOARD_CHECKS_TTL + 1
+            api.dashboard_checks()
+            assert localipv4.call_count == 2
@@ -0,0 +1,164 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_articlecache - Testing functions in articlecache.py
+"""
+import pickle
+from unittest import mock
+
+from sabnzbd.articlecache import ArticleSpill, ArticleCache
+from sabnzbd.constants import DIRECT_WRITE_TRIGGER
+from sabnzbd.nzbstuff import Article
+
+from tests.testhelper import *
+
+
+def spill_files(folder):
+    return sorted(name for name in os.listdir(folder) if name.startswith("SABnzbd_spill_"))
+
+
+class TestArticleSpill:
+    def test_save_load(self, tmp_path):
+        folder = str(tmp_path)
+        spill = ArticleSpill()
+        articles = [Article("%d@sabnzbd" % i, 100, None) for i in range(10)]
+        for i, article in enumerate(articles):
+            spill.save(article, b"%d" % i * 100, folder)
+
+        # All articles end up in a single file
+        assert spill_files(folder) == ["SABnzbd_spill_0"]
+        assert len(spill) == 10
+
+        # Articles can be loaded in any order, but only once
+        assert spill.load(articles[5], folder) == b"5" * 100
+        assert spill.load(articles[5], folder) is None
+        assert spill.load(articles[0], folder) == b"0" * 100
+
+        # The file is removed when all articles are used
+        spill.purge(articles[1:5], folder)
+        assert spill_files(folder)
+        spill.purge(articles, folder)
+        assert not spill_files(folder)
+        assert len(spill) == 0
+
+        # And the next article starts a new file
+        spill.save(articles[0], b"new", folder)
+        assert spill.index[articles[0]] == (0, 0, 3)
+        assert spill.load(articles[0], folder) == b"new"
+
+    @mock.patch("sabnzbd.articlecache.SPILL_SEGMENT_SIZE", 250)
+    def test_segments(self, tmp_path):
+        folder = str(tmp_path)
+        spill = ArticleSpill()
+        articles = [Article("%d@sabnzbd" % i, 100, None) for i in range(6)]
+        for i, article in enumerate(articles):
+            spill.save(article, b"%d" % i * 100, folder)
+        assert spill_files(folder) == ["SABnzbd_spill_0", "SABnzbd_spill_1"]
+
+        # Segments that are no longer used are removed, even if others are still in use
+        for article in articles[:3]:
+            assert spill.load(article, folder)
+        assert spill_files(folder) == ["SABnzbd_spill_1"]
+
+        # The index should survive a restart
+        spill = pickle.loads(pickle.dumps(spill))
+        assert len(spill) == 3
+        article = list(spill.index)[0]
+        assert spill.load(article, folder) == b"3" * 100
+
+
+class TestArticleCache:
+    def create_nzf(self, nzo, articles_left):
+        nzf = mock.Mock(nzo=nzo, table=None, import_finished=True)
+        nzf.articles = {"%d@left" % i: None for i in range(articles_left)}
+        return nzf
+
+    def test_eviction(self, tmp_path):
+        cache = ArticleCache()
+        cache.new_limit(1000)
+        nzo = mock.Mock(spill=None, admin_path=str(tmp_path))
+        nzo.is_gone.return_value = False
+
+        # The near file is almost done, the far file needs many more articles
+        near_nzf = self.create_nzf(nzo, 1)
+        far_nzf = self.create_nzf(nzo, DIRECT_WRITE_TRIGGER + 1)
+        far_articles = [Article("%d@far" % i, 300, far_nzf) for i in range(4)]
+        near_article = Article("0@near", 300, near_nzf)
+
+        for article in far_articles[:3]:
+            cache.save_article(article, b"f" * 300)
+        assert cache.cache_info().article_sum == 3
+        assert not nzo.spill
+
+        # Without offsets, the last received article of the far file is saved to disk to make room
+        cache.save_article(near_article, b"n" * 300)
+        assert cache.cache_info().article_sum == 3
+        assert cache.cache_info().spills == 1
+        assert far_articles[2] in nzo.spill.index
+
+        # Articles of the same file don't replace each other
+        cache.save_article(far_articles[3], b"f" * 300)
+        assert cache.cache_info().spills == 2
+        assert far_articles[3] in nzo.spill.index
+
+        assert cache.load_article(near_article) == b"n" * 300
+        assert cache.load_article(far_articles[2]) == b"f" * 300
+        info = cache.cache_info()
+        assert (info.article_sum, info.hits, info.misses, info.spills) == (2, 1, 1, 2)
+
+        # Nothing is left behind after loading everything
+        for article in far_articles[:2] + far_articles[3:]:
+            assert cache.load_article(article) == b"f" * 300
+        assert cache.cache_info().article_sum == 0
+        assert cache.cache_info().cache_size == 0
+        assert not cache._ArticleCache__file_table
+
+    def test_eviction_highest_offset(self, tmp_path):
+        cache = ArticleCache()
+        cache.new_limit(1000)
+        nzo = mock.Mock(spill=None, admin_path=str(tmp_path))
+        nzo.is_gone.return_value = False
+        near_nzf = self.create_nzf(nzo, 1)
+        far_nzf = self.create_nzf(nzo, 100)
+        far_articles = [Article("%d@far" % i, 300, far_nzf) for i in range(3)]
+        for i, article in enumerate(far_articles):
+            article.data_begin = i * 300
+
+        # The last part of the file arrived first, but it is still written last
+        for article in (far_articles[2], far_articles[0], far_articles[1]):
+            cache.save_article(article, b"f" * 300)
+        cache.save_article(Article("0@near", 300, near_nzf), b"n" * 300)
+        assert list(nzo.spill.index) == [far_articles[2]]
+
+    def test_eviction_frees_enough(self, tmp_path):
+        cache = ArticleCache()
+        cache.new_limit(1000)
+        nzo = mock.Mock(spill=None, admin_path=str(tmp_path))
+        nzo.is_gone.return_value = False
+        near_nzf = self.create_nzf(nzo, 1)
+        far_nzf = self.create_nzf(nzo, 100)
+
+        for i in range(3):
+            cache.save_article(Article("%d@far" % i, 300, far_nzf), b"f" * 300)
+
+        # Swapping a smaller article would let the cache grow past the limit
+        large_article = Article("0@near", 500, near_nzf)
+        cache.save_article(large_article, b"n" * 500)
+        assert large_article in nzo.spill.index
+        assert cache.cache_info().article_sum == 3
+        assert cache.cache_info().cache_size == 900
@@ -0,0 +1,237 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_assembler - Testing functions in assembler.py
+"""
+import hashlib
+import zlib
+from types import SimpleNamespace
+
+from sabnzbd.assembler import Assembler, FileInspector
+from sabnzbd.constants import Status
+from sabnzbd.nzbstuff import Article
+
+from tests.testhelper import *
+
+
+class FakeCache:
+    """ Keeps the decoded data of the articles, like the ArticleCache """
+
+    def __init__(self):
+        self.data = {}
+
+    def save_article(self, article, data, data_begin):
+        article.decoded = True
+        article.data_begin = data_begin
+        self.data[article] = data
+
+    def load_article(self, article):
+        return self.data.pop(article, None)
+
+
+PARTS = [bytes([i]) * (100 + i) for i in range(10)]
+OFFSETS = [sum(len(part) for part in PARTS[:i]) for i in range(10)]
+
+
+def create_nzf(tmp_path, parts, par2slices=None):
+    nzf = SimpleNamespace(
+        filename="file.bin",
+        filepath=str(tmp_path / "file.bin"),
+        bytes=sum(len(part) for part in parts) + 1000,
+        nzo=SimpleNamespace(status=Status.DOWNLOADING, par2slices=par2slices or {}),
+        hasher=None,
+        md5sum=None,
+        crc32=None,
+        slice_checksums=None,
+    )
+    nzf.decodetable = [Article("%d@sabnzbd" % i, len(part), nzf) for i, part in enumerate(parts)]
+    return nzf
+
+
+@mock.patch("sabnzbd.assembler.set_permissions", mock.Mock())
+class TestAssemble:
+    def test_out_of_order(self, tmp_path):
+        nzf = create_nzf(tmp_path, PARTS)
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            # Later articles are written while the first is not there yet
+            for i in (9, 5, 3):
+                cache.save_article(nzf.decodetable[i], PARTS[i], OFFSETS[i])
+            Assembler.assemble(nzf, file_done=False)
+            assert not cache.data
+            assert [article.on_disk for article in nzf.decodetable].count(True) == 3
+
+            # The file was preallocated, where possible
+            if hasattr(os, "posix_fallocate"):
+                assert os.path.getsize(nzf.filepath) == nzf.bytes
+
+            for i in range(10):
+                if not nzf.decodetable[i].on_disk:
+                    cache.save_article(nzf.decodetable[i], PARTS[i], OFFSETS[i])
+            Assembler.assemble(nzf, file_done=True)
+
+        data = b"".join(PARTS)
+        with open(nzf.filepath, "rb") as result:
+            assert result.read() == data
+        assert nzf.md5sum == hashlib.md5(data).digest()
+        assert nzf.crc32 == zlib.crc32(data)
+        assert nzf.slice_checksums is None
+        assert nzf.hashed_stat == (len(data), os.stat(nzf.filepath).st_mtime_ns)
+        assert len(nzf.decodetable) == 1
+
+    def test_slice_checksums(self, tmp_path):
+        # The par2 file of the job was already parsed
+        nzf = create_nzf(tmp_path, PARTS, par2slices={"file.bin": (256, [])})
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            for i in (0, 1, 6, 2, 8, 3, 4, 5, 7, 9):
+                cache.save_article(nzf.decodetable[i], PARTS[i], OFFSETS[i])
+                Assembler.assemble(nzf, file_done=i == 9)
+
+        # The last slice is padded with zeros
+        data = b"".join(PARTS)
+        data += bytes(-len(data) % 256)
+        slices = [data[offset : offset + 256] for offset in range(0, len(data), 256)]
+        assert nzf.slice_checksums == [(hashlib.md5(part).digest(), zlib.crc32(part)) for part in slices]
+
+    def test_missing_article(self, tmp_path):
+        nzf = create_nzf(tmp_path, PARTS)
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            for i in range(10):
+                if i != 4:
+                    cache.save_article(nzf.decodetable[i], PARTS[i], OFFSETS[i])
+            Assembler.assemble(nzf, file_done=True)
+
+        # The missing data stays empty, so the other data is still at the right place for the repair
+        data = b"".join(PARTS[:4]) + bytes(len(PARTS[4])) + b"".join(PARTS[5:])
+        with open(nzf.filepath, "rb") as result:
+            assert result.read() == data
+        assert nzf.md5sum == hashlib.md5(data).digest()
+
+    def test_without_data_begin(self, tmp_path):
+        nzf = create_nzf(tmp_path, PARTS[:3])
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            # Without yEnc part headers, the articles can only follow the previous one
+            cache.save_article(nzf.decodetable[1], PARTS[1], None)
+            Assembler.assemble(nzf, file_done=False)
+            assert not nzf.decodetable[1].on_disk
+
+            cache.save_article(nzf.decodetable[0], PARTS[0], None)
+            cache.save_article(nzf.decodetable[2], PARTS[2], None)
+            Assembler.assemble(nzf, file_done=True)
+
+        with open(nzf.filepath, "rb") as result:
+            assert result.read() == b"".join(PARTS[:3])
+
+    def test_without_data_begin_after_missing(self, tmp_path):
+        nzf = create_nzf(tmp_path, PARTS[:3])
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            last_article = nzf.decodetable[2]
+            cache.save_article(nzf.decodetable[0], PARTS[0], None)
+            cache.save_article(last_article, PARTS[2], None)
+            Assembler.assemble(nzf, file_done=False)
+            assert not last_article.on_disk
+
+            # The size of the missing article is unknown, so the data is appended when the file is done
+            Assembler.assemble(nzf, file_done=True)
+            assert last_article.on_disk
+
+        with open(nzf.filepath, "rb") as result:
+            assert result.read() == PARTS[0] + PARTS[2]
+
+    def test_append_older_file(self, tmp_path):
+        nzf = create_nzf(tmp_path, PARTS[:3])
+        # Written by an older version, without the offsets
+        with open(nzf.filepath, "wb") as older_file:
+            older_file.write(PARTS[0])
+        nzf.decodetable[0].on_disk = True
+
+        cache = FakeCache()
+        with mock.patch("sabnzbd.ArticleCache", cache, create=True):
+            cache.save_article(nzf.decodetable[1], PARTS[1], 1000)
+            cache.save_article(nzf.decodetable[2], PARTS[2], 2000)
+            Assembler.assemble(nzf, file_done=True)
+
+        with open(nzf.filepath, "rb") as result:
+            assert result.read() == b"".join(PARTS[:3])
+
+
+class TestAssemblerWorkers:
+    @set_config({"num_assemblers": 2})
+    def test_files_divided_over_workers(self):
+        nzo = SimpleNamespace(nzo_id="SABnzbd_nzo_1")
+        nzf1 = SimpleNamespace(assembler_worker=None)
+        nzf2 = SimpleNamespace(assembler_worker=None)
+        assembler = Assembler()
+        assembler.process(nzo, nzf1, file_done=False)
+        assembler.process(nzo, nzf2, file_done=False)
+        assembler.process(nzo, nzf1, file_done=True)
+
+        # All writes of a file are done by the same worker
+        worker1, worker2 = assembler.assembler_workers
+        assert nzf1.assembler_worker != nzf2.assembler_worker
+        assert list(worker1.queue.queue) == [(nzo, nzf1, False), (nzo, nzf1, True)]
+        assert list(worker2.queue.queue) == [(nzo, nzf2, False)]
+
+    @set_config({"num_assemblers": 3})
+    def test_job_end_after_files(self):
+        events = []
+
+        def assemble(nzf, file_done):
+            # Make sure the last file is finished last
+            time.sleep(0.1 if nzf.name == "9" else 0.01)
+            events.append(("assemble", nzf.name))
+
+        def inspect(nzo, nzf):
+            events.append(("inspect", nzf.name))
+
+        def post_process(nzo):
+            events.append(("end", nzo.nzo_id))
+
+        nzo = SimpleNamespace(nzo_id="SABnzbd_nzo_1")
+        nzfs = [mock.Mock() for _ in range(10)]
+        for i, nzf in enumerate(nzfs):
+            nzf.name = str(i)
+            nzf.assembler_worker = None
+
+        with mock.patch.multiple(
+            "sabnzbd",
+            Downloader=mock.Mock(paused=True),
+            NzbQueue=mock.Mock(),
+            PostProcessor=SimpleNamespace(process=post_process),
+            create=True,
+        ), mock.patch.object(Assembler, "assemble", staticmethod(assemble)), mock.patch.object(
+            FileInspector, "inspect", staticmethod(inspect)
+        ):
+            assembler = Assembler()
+            assert len(assembler.assembler_workers) == 3
+            assembler.start()
+            for nzf in nzfs:
+                assembler.process(nzo, nzf, file_done=True)
+            assembler.process(nzo)
+            assembler.stop()
+            assembler.join()
+
+        # Every file is written and inspected before the job is sent to post-processing
+        assert len(events) == 21
+        assert events[-1] == ("end", "SABnzbd_nzo_1")
+        assert sorted(name for event, name in events if event == "inspect") == sorted(nzf.name for nzf in nzfs)
+        assert not assembler.ending_jobs
@@ -0,0 +1,61 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_bpsmeter - Testing functions in bpsmeter.py
+"""
+from sabnzbd.bpsmeter import BPSMeter, BPS_UPDATE_INTERVAL
+
+from tests.testhelper import *
+
+
+class TestBPSMeter:
+    def test_batched_update(self):
+        meter = BPSMeter()
+        meter.add_bytes("server1", 1000)
+        meter.add_bytes("server1", 1000)
+        meter.add_bytes("server2", 500)
+
+        # Not added yet, directly after the previous update
+        meter.update()
+        assert meter.bytes_pending == {"server1": 2000, "server2": 500}
+        assert not meter.grand_total
+
+        time.sleep(BPS_UPDATE_INTERVAL)
+        meter.update()
+        assert not meter.bytes_pending
+        assert meter.amounts("server1")[:4] == (2000, 2000, 2000, 2000)
+        assert meter.amounts("server2")[:4] == (500, 500, 500, 500)
+        assert meter.timeline_total["server1"] == {meter.day_label: 2000}
+        assert meter.bps > 0
+        assert meter.server_bps["server1"] == pytest.approx(4 * meter.server_bps["server2"])
+
+        # Specific server update is always done directly
+        meter.update("server2", 500)
+        assert meter.get_sums() == (3000, 3000, 3000, 3000)
+
+    def test_quota_checked_directly(self):
+        meter = BPSMeter()
+        meter.have_quota = True
+        meter.quota = meter.left = 1500
+        with mock.patch("sabnzbd.Downloader", create=True) as downloader:
+            downloader.paused = False
+            meter.add_bytes("server1", 1000)
+            downloader.pause.assert_not_called()
+            meter.add_bytes("server1", 1000)
+            downloader.pause.assert_called_once()
+        assert meter.left == -500
@@ -0,0 +1,144 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_database - Testing functions in database.py
+"""
+import sqlite3
+
+from tests.testhelper import *
+
+
+@pytest.fixture
+def history_db_path(tmp_path):
+    """ Use a separate database for each test """
+    org_db_path = db.HistoryDB.db_path
+    yield str(tmp_path / "history1.db")
+    db.HistoryDB.db_path = org_db_path
+
+
+def get_indexes(history_db):
+    history_db.execute("""SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'history'""")
+    return sorted(row["name"] for row in history_db.c.fetchall())
+
+
+class TestHistoryDB:
+    def test_new_database(self, history_db_path):
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.execute("PRAGMA user_version;")
+            assert history_db.c.fetchone()["user_version"] == 3
+            history_db.execute("PRAGMA journal_mode;")
+            assert history_db.c.fetchone()["journal_mode"] == "wal"
+            assert get_indexes(history_db) == sorted("history_%s" % column for column in db.HISTORY_INDEXES)
+
+    def test_upgrade(self, history_db_path):
+        # Database of an older version, without the new column and indexes
+        con = sqlite3.connect(history_db_path)
+        con.execute(
+            """CREATE TABLE "history" ("id" INTEGER PRIMARY KEY, "completed" INTEGER NOT NULL, "name" TEXT NOT NULL,
+            "nzb_name" TEXT NOT NULL, "category" TEXT, "pp" TEXT, "script" TEXT, "report" TEXT, "url" TEXT,
+            "status" TEXT, "nzo_id" TEXT, "storage" TEXT, "path" TEXT, "script_log" BLOB, "script_line" TEXT,
+            "download_time" INTEGER, "postproc_time" INTEGER, "stage_log" TEXT, "downloaded" INTEGER,
+            "completeness" INTEGER, "fail_message" TEXT, "url_info" TEXT, "bytes" INTEGER, "meta" TEXT,
+            "series" TEXT, "md5sum" TEXT, "password" TEXT)"""
+        )
+        con.execute(
+            """INSERT INTO history (completed, name, nzb_name, status, nzo_id) VALUES (?, ?, ?, ?, ?)""",
+            (1, "Old.Job.NAME", "old.nzb", Status.COMPLETED, "SABnzbd_nzo_old"),
+        )
+        con.execute("PRAGMA user_version = 2;")
+        con.commit()
+        con.close()
+
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.execute("PRAGMA user_version;")
+            assert history_db.c.fetchone()["user_version"] == 3
+            history_db.execute("PRAGMA journal_mode;")
+            assert history_db.c.fetchone()["journal_mode"] == "wal"
+            assert len(get_indexes(history_db)) == len(db.HISTORY_INDEXES)
+            assert history_db.have_name_or_md5sum("old.job.name", "")
+            assert not history_db.have_name_or_md5sum("new.job.name", "")
+
+    def test_wal_not_supported(self, history_db_path):
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.execute("PRAGMA journal_mode = DELETE;")
+
+            # Like on a network share, the mode is not changed but the migration continues
+            cursor = history_db.c
+            history_db.c = mock.Mock()
+            history_db.c.fetchone.return_value = {"journal_mode": "delete"}
+            assert history_db.enable_wal()
+            history_db.c.execute.side_effect = sqlite3.OperationalError
+            assert history_db.enable_wal()
+            history_db.c = cursor
+
+        # Only set when creating or upgrading the database
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.execute("PRAGMA journal_mode;")
+            assert history_db.c.fetchone()["journal_mode"] == "delete"
+
+    def test_have_name_or_md5sum(self, history_db_path):
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.add_fake_history_jobs(5)
+            history_db.execute("""SELECT name, md5sum, status FROM history WHERE status != ?""", (Status.FAILED,))
+            for item in history_db.c.fetchall():
+                # Like before, only the case of ASCII characters is ignored
+                name = item["name"]
+                assert history_db.have_name_or_md5sum(name, "")
+                assert history_db.have_name_or_md5sum(
+                    "".join(char.upper() if char in ascii_lowercase else char for char in name), ""
+                )
+            assert not history_db.have_name_or_md5sum("Not.In.History", "")
+
+    def test_fetch_history(self, history_db_path):
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.add_fake_history_jobs(25)
+            all_items, fetched_items, total_items = history_db.fetch_history()
+            assert fetched_items == total_items == 25
+            completed = [item["completed"] for item in all_items]
+            assert completed == sorted(completed, reverse=True)
+
+            # The script log is not part of the list
+            assert all(item["script_log"] == "" for item in all_items)
+
+            # Offset and keyset pagination give the same pages
+            page, _, total_items = history_db.fetch_history(10, 10)
+            assert total_items == 25
+            assert [item["nzo_id"] for item in page] == [item["nzo_id"] for item in all_items[10:20]]
+            page, _, total_items = history_db.fetch_history(0, 10, last_nzo_id=all_items[9]["nzo_id"])
+            assert total_items == 25
+            assert [item["nzo_id"] for item in page] == [item["nzo_id"] for item in all_items[10:20]]
+
+            # Filters are combined with the keyset
+            category = all_items[0]["category"]
+            in_category = [item["nzo_id"] for item in all_items if item["category"] == category]
+            page, fetched_items, total_items = history_db.fetch_history(
+                0, 100, categories=[category], last_nzo_id=in_category[0]
+            )
+            assert total_items == len(in_category)
+            assert [item["nzo_id"] for item in page] == in_category[1:]
+
+    def test_duplicate_check_uses_index(self, history_db_path):
+        with FakeHistoryDB(history_db_path) as history_db:
+            history_db.execute(
+                """EXPLAIN QUERY PLAN SELECT COUNT(*) FROM History
+                WHERE ( lower_name = LOWER(?) OR md5sum = ? ) AND STATUS != ?""",
+                ("job.name", "", Status.FAILED),
+            )
+            plan = " ".join(row["detail"] for row in history_db.c.fetchall())
+            assert "history_lower_name" in plan
+            assert "history_md5sum" in plan
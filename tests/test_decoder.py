@@ -0,0 +1,46 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_decoder - Testing functions in decoder.py
+"""
+import sabnzbd.decoder as decoder
+
+from tests.testhelper import *
+
+
+class TestDataBegin:
+    @pytest.mark.parametrize(
+        "raw_data, file_size, data_begin",
+        [
+            (
+                [b"222 0 <a@b>\r\n=ybegin part=2 line=128 size=2000 name=f\r\n=ypart begin=1001 end=2000\r\ndata"],
+                5000,
+                1000,
+            ),
+            ([b"=ybegin part=1 line=128 size=2000 name=f\r\n=ypart begin=1 end=1000\r\ndata"], 5000, 0),
+            ([b"222 0 <a@b>\r\n=ybegin line=128 size=1000 name=f\r\ndata"], 5000, None),
+            ([b"222 0 <a@b>\r\ndata =ypart begin=1001"], 5000, None),
+            ([], 5000, None),
+            # Past the end of the file according to the yEnc header
+            ([b"=ybegin part=2 line=128 size=1500 name=f\r\n=ypart begin=1001 end=2000\r\ndata"], 5000, None),
+            # Past the end of the file according to the NZB, without a size in the yEnc header
+            ([b"=ybegin part=2 line=128 name=f\r\n=ypart begin=4501 end=5500\r\ndata"], 5000, None),
+        ],
+    )
+    def test_get_data_begin(self, raw_data, file_size, data_begin):
+        assert decoder.get_data_begin(raw_data, 1000, file_size) == data_begin
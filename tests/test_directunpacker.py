@@ -0,0 +1,84 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_directunpacker - Testing functions in directunpacker.py
+"""
+import subprocess
+import sys
+
+from sabnzbd.directunpacker import DirectUnpacker, ACTIVE_UNPACKERS
+
+from tests.testhelper import *
+
+# Acts like unrar, including the prompt for the next volume that has no newline
+FAKE_UNRAR = r"""
+import sys
+out = sys.stdout.buffer
+out.write(b"\nUNRAR 6.00 freeware\n\nExtracting from test.part1.rar\n\nExtracting  test/file.bin  ")
+out.flush()
+out.write(b"\nInsert disk with test.part2.rar\n[C]ontinue, [Q]uit ")
+out.flush()
+if sys.stdin.readline().strip() != "C":
+    sys.exit(1)
+out.write(b"\n\nExtracting from test.part2.rar\n...         file.bin  OK \nAll OK\n")
+out.flush()
+"""
+
+
+class TestDirectUnpacker:
+    def start_fake_unrar(self, direct_unpacker, script):
+        direct_unpacker.active_instance = subprocess.Popen(
+            [sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0
+        )
+        ACTIVE_UNPACKERS.append(direct_unpacker)
+
+    @mock.patch("sabnzbd.directunpacker.rar_volumelist", return_value=["test.part1.rar", "test.part2.rar"])
+    def test_run(self, rar_volumelist, tmp_path):
+        nzo = mock.Mock(files=[], download_path=str(tmp_path), password=None)
+        nzo.finished_files = [mock.Mock(filename="test.part2.rar", setname="test", vol=2, md5sum=b"md5")]
+        direct_unpacker = DirectUnpacker(nzo)
+        direct_unpacker.cur_setname = "test"
+        direct_unpacker.cur_volume = 1
+        direct_unpacker.rarfile_nzf = mock.Mock(filename="test.part1.rar")
+        direct_unpacker.unpack_dir_info = (str(tmp_path), None, None, False, None)
+        self.start_fake_unrar(direct_unpacker, FAKE_UNRAR)
+
+        direct_unpacker.run()
+
+        assert direct_unpacker.cur_volume == 0
+        assert direct_unpacker.killed
+        assert direct_unpacker not in ACTIVE_UNPACKERS
+        assert direct_unpacker.success_sets["test"] == (
+            ["test.part1.rar", "test.part2.rar"],
+            [os.path.join(str(tmp_path), "file.bin")],
+        )
+        assert rar_volumelist.call_args[0][2] == ["test.part1.rar", "test.part2.rar"]
+        nzo.set_action_line.assert_any_call(T("Direct Unpack"), 2)
+
+    def test_run_error(self, tmp_path):
+        nzo = mock.Mock(files=[], download_path=str(tmp_path))
+        direct_unpacker = DirectUnpacker(nzo)
+        direct_unpacker.cur_setname = "test"
+        self.start_fake_unrar(
+            direct_unpacker, "import sys; sys.stdout.write('Extracting from test.rar\\nCRC failed in test.rar\\n')"
+        )
+
+        with mock.patch.object(DirectUnpacker, "abort") as abort:
+            direct_unpacker.run()
+        assert abort.called
+        assert not direct_unpacker.success_sets
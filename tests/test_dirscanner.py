@@ -0,0 +1,181 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_dirscanner - Testing functions in dirscanner.py
+"""
+
+import threading
+
+from tests.testhelper import *
+
+from sabnzbd.dirscanner import DirScanner, DIRSCAN_STABLE_TIME
+from sabnzbd.utils.inotify import Inotify, inotify_available, IN_CLOSE_WRITE
+
+
+class TestDirScanner:
+    @pytest.fixture
+    def scanner(self, tmp_path):
+        with mock.patch.object(sabnzbd.cfg.dirscan_dir, "get_path", return_value=str(tmp_path)), mock.patch(
+            "sabnzbd.load_admin", side_effect=FileNotFoundError
+        ), mock.patch("sabnzbd.config.get_categories", return_value={"*": None, "tv": None}), mock.patch(
+            "sabnzbd.add_nzbfile", return_value=(0, [])
+        ) as add_nzbfile:
+            scanner = DirScanner()
+            scanner.add_nzbfile = add_nzbfile
+            yield scanner
+            scanner.import_pool.shutdown(wait=True)
+
+    @staticmethod
+    def scan_later(scanner, delay=DIRSCAN_STABLE_TIME + 0.1):
+        """ Run a scan as if the stability timers expired """
+        now = time.time()
+        with mock.patch("sabnzbd.dirscanner.time.time", return_value=now + delay):
+            scanner.scan()
+        scanner.import_pool.shutdown(wait=True)
+
+    def test_many_files_no_blocking(self, scanner, tmp_path):
+        for n in range(25):
+            (tmp_path / ("job%d.nzb" % n)).write_bytes(b"<nzb></nzb>")
+        (tmp_path / "readme.txt").write_bytes(b"text")
+
+        start = time.time()
+        scanner.scan()
+        assert time.time() - start < DIRSCAN_STABLE_TIME
+        assert len(scanner.pending) == 25
+        assert str(tmp_path / "readme.txt") in scanner.ignored
+        scanner.add_nzbfile.assert_not_called()
+
+        # The next check is scheduled instead of waiting
+        assert 0 < scanner.next_timeout() <= DIRSCAN_STABLE_TIME
+
+        self.scan_later(scanner)
+        assert not scanner.pending
+        assert not scanner.importing
+        assert scanner.add_nzbfile.call_count == 25
+
+    def test_category_folder(self, scanner, tmp_path):
+        (tmp_path / "tv").mkdir()
+        (tmp_path / "tv" / "show.nzb").write_bytes(b"<nzb></nzb>")
+        (tmp_path / "other").mkdir()
+        (tmp_path / "other" / "skipped.nzb").write_bytes(b"<nzb></nzb>")
+        scanner.scan()
+        self.scan_later(scanner)
+        scanner.add_nzbfile.assert_called_once_with(str(tmp_path / "tv" / "show.nzb"), catdir="tv", keep=False)
+
+    def test_unstable_file_rescheduled(self, scanner, tmp_path):
+        nzb = tmp_path / "growing.nzb"
+        nzb.write_bytes(b"<nzb>")
+        scanner.scan()
+        with open(nzb, "ab") as fp:
+            fp.write(b"</nzb>")
+
+        now = time.time()
+        with mock.patch("sabnzbd.dirscanner.time.time", return_value=now + DIRSCAN_STABLE_TIME + 0.1):
+            scanner.scan()
+        assert str(nzb) in scanner.pending
+        scanner.add_nzbfile.assert_not_called()
+
+        self.scan_later(scanner, 2 * DIRSCAN_STABLE_TIME + 0.2)
+        scanner.add_nzbfile.assert_called_once_with(str(nzb), catdir=None, keep=False)
+
+    def test_removed_file_forgotten(self, scanner, tmp_path):
+        nzb = tmp_path / "removed.nzb"
+        nzb.write_bytes(b"<nzb></nzb>")
+        scanner.scan()
+        nzb.unlink()
+        scanner.scan()
+        assert not scanner.pending
+        assert scanner.next_timeout() == scanner.dirscan_speed
+
+    @pytest.mark.parametrize("result, suspected, ignored", [(-1, True, False), (0, False, False), (1, False, True)])
+    def test_import_result(self, scanner, tmp_path, result, suspected, ignored):
+        nzb = tmp_path / "result.nzb"
+        nzb.write_bytes(b"<nzb></nzb>")
+        scanner.add_nzbfile.return_value = (result, [])
+        scanner.scan()
+        self.scan_later(scanner)
+        assert (str(nzb) in scanner.suspected) is suspected
+        assert (str(nzb) in scanner.ignored) is ignored
+
+        # Suspected files are skipped until they change
+        scanner.scan()
+        assert (str(nzb) in scanner.pending) is (not suspected and not ignored)
+
+    @pytest.mark.parametrize("use_inotify", [False, True])
+    def test_scan_request_from_other_thread(self, scanner, tmp_path, use_inotify):
+        if use_inotify and not inotify_available():
+            pytest.skip("Requires inotify")
+
+        # Only scans when requested, like when the scan speed is 0
+        scanner.dirscan_speed = None
+        with mock.patch("sabnzbd.dirscanner.inotify_available", return_value=use_inotify):
+            scanner.start()
+        try:
+            (tmp_path / "requested.nzb").write_bytes(b"<nzb></nzb>")
+            scan_threads = []
+            scan_folders = scanner.scan_folders
+
+            def record_scan_thread():
+                scan_threads.append(threading.current_thread())
+                scan_folders()
+
+            with mock.patch.object(scanner, "scan_folders", record_scan_thread):
+                scanner.scan()
+                start = time.time()
+                while not scanner.add_nzbfile.called and time.time() - start < 10:
+                    time.sleep(0.05)
+
+            # Only the scanner thread changes the bookkeeping
+            assert scan_threads
+            assert all(thread is scanner for thread in scan_threads)
+            scanner.add_nzbfile.assert_called_once_with(str(tmp_path / "requested.nzb"), catdir=None, keep=False)
+        finally:
+            scanner.stop()
+            scanner.join(10)
+        assert not scanner.is_alive()
+        assert not scanner.pending
+
+
+@pytest.mark.skipif(not inotify_available(), reason="Requires inotify")
+class TestInotify:
+    def test_events(self, tmp_path):
+        inotify = Inotify()
+        try:
+            assert inotify.add_watch(str(tmp_path), IN_CLOSE_WRITE)
+            assert not inotify.add_watch(str(tmp_path / "missing"), IN_CLOSE_WRITE)
+            assert inotify.watched() == [str(tmp_path)]
+
+            (tmp_path / "new.nzb").write_bytes(b"<nzb></nzb>")
+            events = inotify.read_events(5)
+            assert (str(tmp_path), "new.nzb", IN_CLOSE_WRITE) in events
+
+            inotify.remove_watch(str(tmp_path))
+            assert not inotify.watched()
+        finally:
+            inotify.close()
+
+    def test_wakeup(self, tmp_path):
+        inotify = Inotify()
+        try:
+            start = time.time()
+            inotify.wakeup()
+            assert inotify.read_events(10) == []
+            assert time.time() - start < 5
+            assert inotify.read_events(0) == []
+        finally:
+            inotify.close()
@@ -0,0 +1,455 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_downloader - Testing functions in downloader.py
+"""
+import selectors
+import socket
+import ssl
+import threading
+from types import SimpleNamespace
+
+from sabnzbd.constants import Status
+from sabnzbd.downloader import Downloader, Server, TokenBucket
+from sabnzbd.newswrapper import NewsWrapper
+
+from tests.testhelper import *
+
+
+def create_connections(downloader: Downloader, count: int):
+    """ Create simulated connections that are watched by the downloader """
+    connections = []
+    for thrdnum in range(count):
+        sock_local, sock_remote = socket.socketpair()
+        nw = NewsWrapper(None, thrdnum)
+        nw.nntp = SimpleNamespace(fileno=sock_local.fileno(), sock=sock_local)
+        downloader.add_socket(nw.nntp.fileno, nw)
+        connections.append((nw, sock_local, sock_remote))
+    return connections
+
+
+def close_connections(downloader: Downloader, connections):
+    for nw, sock_local, sock_remote in connections:
+        downloader.remove_socket(nw)
+        sock_local.close()
+        sock_remote.close()
+
+
+class TestDownloaderSockets:
+    def test_add_remove_socket(self):
+        downloader = Downloader()
+        connections = create_connections(downloader, 3)
+        try:
+            assert downloader.socket_count == 3
+
+            # Only the connection with data should be returned
+            nw, _, sock_remote = connections[1]
+            sock_remote.sendall(b"222 0 <test@sabnzbd>\r\n")
+            assert [key.data for key, _ in downloader.selector.select(1.0)] == [nw]
+
+            # Registering again should not fail, but also not add a socket
+            downloader.add_socket(nw.nntp.fileno, nw)
+            assert downloader.socket_count == 3
+
+            # Removing twice should also not fail
+            downloader.remove_socket(nw)
+            downloader.remove_socket(nw)
+            assert downloader.socket_count == 2
+            assert not downloader.selector.select(0)
+        finally:
+            close_connections(downloader, connections)
+        assert downloader.socket_count == 0
+
+
+class TestServerSSLContext:
+    @set_config({"require_modern_tls": False})
+    def test_cached_context(self):
+        server = Server("test", "test", "news.example.com", 563, 60, 0, 0, True, 2, "", False)
+        ctx = server.get_ssl_context()
+        assert ctx.check_hostname
+        assert not ctx.options & ssl.OP_NO_TLSv1_1
+        assert server.get_ssl_context() is ctx
+
+        # Changed settings should create a new context and forget the session
+        server.ssl_session = "session"
+        server.ssl_verify = 0
+        assert server.get_ssl_context() is not ctx
+        ctx = server.get_ssl_context()
+        assert ctx.verify_mode == ssl.CERT_NONE
+        assert server.ssl_session is None
+
+        server.ssl_session = "session"
+        cfg.require_modern_tls.set(True)
+        assert server.get_ssl_context() is not ctx
+        assert server.get_ssl_context().options & ssl.OP_NO_TLSv1_1
+        assert server.ssl_session is None
+
+
+class TestNonBlockingConnect:
+    def test_connect(self):
+        downloader = Downloader()
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        server = Server("test", "test", "127.0.0.1", port, 60, 1, 0, False, 2, "", False)
+        server.info = socket.getaddrinfo("127.0.0.1", port, socket.AF_INET, socket.SOCK_STREAM)
+        nw = server.idle_threads[0]
+
+        with mock.patch("sabnzbd.Downloader", downloader, create=True):
+            try:
+                nw.init_connect()
+                assert nw.nntp.connecting
+                server.busy_threads.append(nw)
+                assert server.connecting == 1
+
+                # Connect is finished when the socket is writable
+                ((key, events),) = downloader.selector.select(5)
+                assert key.data is nw
+                assert events == selectors.EVENT_WRITE
+                nw.nntp.continue_connect()
+                assert not nw.nntp.connecting
+                assert not nw.nntp.error_msg
+                assert server.connect_latency > 0
+
+                # And then it waits for the welcome message
+                remote, _ = listener.accept()
+                remote.sendall(b"200 Welcome\r\n")
+                ((key, events),) = downloader.selector.select(5)
+                assert events == selectors.EVENT_READ
+                assert nw.recv_chunk() == (13, False, False)
+                nw.finish_connect(nw.status_code)
+                assert nw.connected
+                assert server.connecting == 0
+                remote.close()
+            finally:
+                downloader.remove_socket(nw)
+                nw.hard_reset(wait=False, send_quit=False)
+                listener.close()
+
+    def test_connect_refused(self):
+        downloader = Downloader()
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        server = Server("test", "test", "127.0.0.1", port, 60, 1, 0, False, 2, "", False)
+        server.info = socket.getaddrinfo("127.0.0.1", port, socket.AF_INET, socket.SOCK_STREAM)
+        nw = server.idle_threads[0]
+
+        with mock.patch("sabnzbd.Downloader", downloader, create=True):
+            try:
+                nw.init_connect()
+                if nw.nntp.connecting:
+                    assert downloader.selector.select(5)
+                    nw.nntp.continue_connect()
+                assert not nw.nntp.connecting
+                assert nw.nntp.error_msg
+                assert not downloader.socket_count
+            finally:
+                nw.hard_reset(wait=False, send_quit=False)
+
+
+class TestWarmConnections:
+    @set_config({"warm_connections": 1})
+    def test_warmed_connection_used(self):
+        self.warm_and_use_connection(downstream_full=False)
+
+    @set_config({"warm_connections": 1})
+    def test_connections_set_up_during_stall(self):
+        # Connections are still set up while the articles are not read
+        self.warm_and_use_connection(downstream_full=True)
+
+    def warm_and_use_connection(self, downstream_full: bool):
+        downloader = Downloader()
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        listener.settimeout(5)
+        port = listener.getsockname()[1]
+        server = Server("test", "test", "127.0.0.1", port, 60, 1, 0, False, 2, "", False)
+        server.info = socket.getaddrinfo("127.0.0.1", port, socket.AF_INET, socket.SOCK_STREAM)
+        downloader.servers.append(server)
+        nw = server.idle_threads[0]
+
+        article = mock.Mock()
+        requested = threading.Event()
+        available = []
+
+        def get_article(server, now):
+            return available.pop() if available else None
+
+        def request_article(nw, article=None):
+            requested.set()
+
+        nzbqueue = mock.Mock()
+        nzbqueue.is_empty.return_value = False
+        with mock.patch.multiple(
+            "sabnzbd",
+            Downloader=downloader,
+            NzbQueue=nzbqueue,
+            Decoder=mock.Mock(**{"queue_full.return_value": downstream_full}),
+            Assembler=mock.Mock(**{"queue_full.return_value": False}),
+            BPSMeter=mock.Mock(),
+            test_ipv6=mock.Mock(return_value=False),
+            test_cert_checking=mock.Mock(return_value=False),
+            create=True,
+        ), mock.patch("sabnzbd.downloader.check_server_expiration"), mock.patch.object(
+            downloader, "_Downloader__get_article", get_article
+        ), mock.patch.object(
+            downloader, "_Downloader__request_article", request_article
+        ):
+            downloader_thread = threading.Thread(target=downloader.run)
+            downloader_thread.start()
+            try:
+                # The connection is opened and logged in before there is an article for it
+                remote, _ = listener.accept()
+                remote.sendall(b"200 Welcome\r\n")
+                for _ in range(50):
+                    if nw.connected and nw in server.idle_threads:
+                        break
+                    time.sleep(0.1)
+                assert nw.connected
+                assert nw in server.idle_threads
+                assert not requested.is_set()
+
+                # And used as soon as there is an article
+                available.append(article)
+                assert requested.wait(5)
+                assert nw.article is article
+                assert nw in server.busy_threads
+            finally:
+                downloader.shutdown = True
+                downloader_thread.join()
+                remote.close()
+                listener.close()
+
+
+class TestArticleQueue:
+    def create_article(self, server, status=Status.QUEUED):
+        nzo = SimpleNamespace(status=status, priority=0, avg_stamp=time.time(), is_gone=lambda: False)
+        return SimpleNamespace(fetcher=server, tries=1, nzf=SimpleNamespace(deleted=False, nzo=nzo))
+
+    def test_get_article(self):
+        downloader = Downloader()
+        server = Server("test", "test", "127.0.0.1", 119, 60, 8, 0, False, 2, "", False)
+        assert server.fetch_limit == 2
+
+        reset = self.create_article(server)
+        reset.fetcher = None
+        paused = self.create_article(server, status=Status.PAUSED)
+        article = self.create_article(server)
+        nzbqueue = mock.Mock()
+        nzbqueue.get_articles.return_value = [reset, paused, article]
+
+        with mock.patch("sabnzbd.NzbQueue", nzbqueue, create=True):
+            # Articles that were reset or paused since they were selected are skipped
+            assert downloader._Downloader__get_article(server, time.time()) is article
+            assert paused.fetcher is None
+            assert not paused.tries
+            nzbqueue.get_articles.assert_called_once_with(server, downloader.servers, 2)
+
+            nzbqueue.get_articles.return_value = []
+            assert downloader._Downloader__get_article(server, time.time()) is None
+            assert server.next_article_search
+
+    def test_reset_article_queue(self):
+        server = Server("test", "test", "127.0.0.1", 119, 60, 8, 0, False, 2, "", False)
+        other_server = Server("other", "other", "127.0.0.1", 119, 60, 8, 0, False, 2, "", False)
+        article = self.create_article(server)
+        taken = self.create_article(other_server)
+        server.article_queue.extend([article, taken])
+        server.reset_article_queue()
+        assert not server.article_queue
+        assert article.fetcher is None
+        assert not article.tries
+        assert taken.fetcher is other_server
+
+
+class TestBackpressure:
+    def test_wait_for_capacity(self):
+        downloader = Downloader()
+        server = Server("test", "test", "127.0.0.1", 119, 60, 8, 0, False, 2, "", False)
+        nw = SimpleNamespace(timeout=time.time() + 60)
+        server.busy_threads.append(nw)
+        downloader.servers.append(server)
+        timeout = nw.timeout
+
+        decoder = mock.Mock()
+        decoder.queue_full.return_value = True
+        assembler = mock.Mock()
+        assembler.queue_full.return_value = False
+
+        def free_capacity():
+            time.sleep(0.1)
+            decoder.queue_full.return_value = False
+            downloader.capacity_available()
+
+        with mock.patch.multiple("sabnzbd", Decoder=decoder, Assembler=assembler, create=True):
+            assert downloader.downstream_full()
+            downloader.start_stall(time.time())
+            freeing_thread = threading.Thread(target=free_capacity)
+            freeing_thread.start()
+            start = time.time()
+            downloader.wait_for_capacity(1.0)
+            freeing_thread.join()
+
+            # Resumed as soon as there was room, not after the wait timeout
+            assert time.time() - start < 0.9
+            assert not downloader.downstream_full()
+            assert downloader.stall_info()[0] == 1
+
+            # The time spent waiting is not counted for the timeouts
+            downloader.end_stall(time.time())
+            assert not downloader.stall_start
+            stall_count, stall_time = downloader.stall_info()
+            assert stall_count == 1
+            assert stall_time >= 0.1
+            assert nw.timeout == pytest.approx(timeout + stall_time)
+
+
+class TestTokenBucket:
+    def test_no_limit(self):
+        bucket = TokenBucket()
+        bucket.consume(100)
+        assert bucket.delay() == 0
+
+    def test_rate(self):
+        bucket = TokenBucket(1000)
+        # Starts empty, so no burst directly after setting a limit
+        assert not bucket.available()
+        time.sleep(0.1)
+        assert bucket.delay() == 0
+        assert 0 < bucket.tokens <= 250
+
+        # Going into debt requires waiting for the refill
+        bucket.consume(bucket.tokens + 100)
+        assert not bucket.available()
+        assert 0.05 < bucket.delay() <= 0.1
+
+    def test_capacity(self):
+        bucket = TokenBucket(1000)
+        bucket.last_refill -= 10
+        bucket.refill()
+        assert bucket.tokens == 250
+
+        # Lowering the limit also limits the burst
+        bucket.set_rate(100)
+        assert bucket.tokens == 25
+        assert bucket.read_size() == 25
+
+    @pytest.mark.parametrize("use_ssl, expected_size", [(False, 2500), (True, 16384)])
+    def test_limited_read(self, use_ssl, expected_size):
+        """A single read can't put the bucket in debt for longer than the burst time,
+        except for SSL where at least a complete TLS record has to be read
+        """
+        server = SimpleNamespace(ssl=use_ssl, timeout=60, pipelining_requests=1, send_group=False)
+        nw = NewsWrapper(server, 0)
+        sock_local, sock_remote = socket.socketpair()
+        nw.nntp = SimpleNamespace(sock=sock_local, nw=nw)
+        try:
+            bucket = TokenBucket(10000)
+            sock_remote.sendall(b"a" * 100000)
+            bytes_received, _, _ = nw.recv_chunk(block=True, max_size=bucket.read_size())
+            assert bytes_received == expected_size
+            bucket.consume(bytes_received)
+            assert bucket.delay() <= expected_size / 10000
+        finally:
+            sock_local.close()
+            sock_remote.close()
+
+
+class TestPipelining:
+    def test_split_pipelined_responses(self):
+        """ Responses that arrive in one chunk should be split per pipelined article """
+        server = SimpleNamespace(ssl=False, timeout=60, pipelining_requests=3, send_group=False)
+        nw = NewsWrapper(server, 0)
+        sock_local, sock_remote = socket.socketpair()
+        nw.nntp = SimpleNamespace(sock=sock_local, nw=nw)
+        nw.connected = True
+        first, second, third = (SimpleNamespace(bytes=100) for _ in range(3))
+        nw.article = first
+        nw.pipeline.extend([second, third])
+        assert not nw.can_pipeline
+        try:
+            sock_remote.sendall(b"222 0 <1@sab>\r\nline\r\n.\r\n430 No such article\r\n222 0 <3@sab>\r\nda")
+            assert nw.recv_chunk() == (24, True, False)
+            assert b"".join(nw.data) == b"222 0 <1@sab>\r\nline\r\n.\r\n"
+
+            # Next response is handled based on the status code
+            nw.soft_reset()
+            assert nw.article is second
+            assert nw.recv_chunk() == (21, False, False)
+            assert nw.status_code == 430
+
+            # Last article is not pipelined anymore, so it is received as usual
+            nw.soft_reset()
+            assert nw.article is third
+            assert nw.can_pipeline
+            assert nw.recv_chunk() == (17, False, False)
+            sock_remote.sendall(b"ta\r\n.\r\n")
+            assert nw.recv_chunk() == (7, True, False)
+            assert b"".join(nw.data) == b"222 0 <3@sab>\r\ndata\r\n.\r\n"
+        finally:
+            sock_local.close()
+            sock_remote.close()
+
+    def test_split_terminator_over_chunks(self):
+        server = SimpleNamespace(ssl=False, timeout=60, pipelining_requests=2, send_group=False)
+        nw = NewsWrapper(server, 0)
+        nw.article = SimpleNamespace(bytes=100)
+        nw.pipeline.append(SimpleNamespace(bytes=100))
+        nw.pipeline_buffer = b"222 0 <1@sab>\r\ndata\r\n."
+        assert nw.recv_chunk() == (22, False, False)
+        nw.pipeline_buffer = b"\r\n223 0 <2@sab>\r\n"
+        assert nw.recv_chunk() == (2, True, False)
+        assert nw.pipeline_buffer == b"223 0 <2@sab>\r\n"
+
+
+class TestReceiveBuffer:
+    def test_buffer_reused(self):
+        server = SimpleNamespace(ssl=False, timeout=60, pipelining_requests=1, send_group=False)
+        nw = NewsWrapper(server, 0)
+        sock_local, sock_remote = socket.socketpair()
+        nw.nntp = SimpleNamespace(sock=sock_local, nw=nw)
+        try:
+            nw.prepare_buffer_for(SimpleNamespace(bytes=32000))
+            buffer = nw.buffer
+            assert len(buffer) > 32000
+
+            for article in (b"222 0 <1@sab>\r\n%s\r\n.\r\n" % (b"a" * 30000), b"430 No such article\r\n"):
+                sock_remote.sendall(article)
+                received = 0
+                done = False
+                while received < len(article):
+                    size, done, _ = nw.recv_chunk(block=True)
+                    received += size
+                assert done == article.endswith(b".\r\n")
+                assert nw.data == [article]
+                nw.clear_data()
+                assert nw.buffer is buffer
+
+            # Only grows when an article is larger than expected
+            sock_remote.sendall(b"a" * 40000)
+            while nw.data_size < 40000:
+                nw.recv_chunk(block=True)
+            assert nw.buffer is not buffer
+            assert nw.data == [b"a" * 40000]
+        finally:
+            sock_local.close()
+            sock_remote.close()
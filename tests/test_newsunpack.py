@@ -19,7 +19,11 @@
 tests.test_newsunpack - Tests of various functions in newspack
 """
 
+import functools
+import shutil
+
 import pytest
+from unittest import mock
 
 from sabnzbd.newsunpack import *
 
@@ -30,3 +34,41 @@ class TestNewsUnpack:
         assert is_sfv_file("tests/data/one_line.sfv")
         assert not is_sfv_file("tests/data/only_comments.sfv")
         assert not is_sfv_file("tests/data/random.bin")
+
+    @mock.patch("sabnzbd.newsunpack.crc_calculate", return_value=b"deadbeef")
+    def test_sfv_check_without_reading(self, crc_calculate, tmp_path):
+        sfv = tmp_path / "job.sfv"
+        sfv.write_bytes(b"; comment\nfile.bin 0a1b2c3d\nother.bin DEADBEEF\n")
+        nzo = mock.Mock(finished_files=[])
+        for filename, crc32 in (("file.bin", 0x0A1B2C3D), ("other.bin", 0xDEADBEEF)):
+            path = tmp_path / filename
+            path.write_bytes(b"data")
+            nzf = mock.Mock(filename=filename, crc32=crc32)
+            nzf.hashed_stat = (path.stat().st_size, path.stat().st_mtime_ns)
+            nzf.hashes_valid = functools.partial(NzbFile.hashes_valid, nzf)
+            nzo.finished_files.append(nzf)
+        assert sfv_check([str(sfv)], nzo, str(tmp_path))
+
+        # The CRC32 calculated during the download was used
+        assert not crc_calculate.called
+
+        nzo.finished_files[1].crc32 = 0xDEADBEEE
+        assert not sfv_check([str(sfv)], nzo, str(tmp_path))
+
+        # Unless the file was changed after it was written
+        (tmp_path / "other.bin").write_bytes(b"changed")
+        assert sfv_check([str(sfv)], nzo, str(tmp_path))
+        crc_calculate.assert_called_once_with(str(tmp_path / "other.bin"))
+
+    def test_native_verify_set_renames(self, tmp_path):
+        rar_dir = os.path.join("tests", "data", "unicode_rar")
+        for filename in os.listdir(rar_dir):
+            shutil.copy(os.path.join(rar_dir, filename), str(tmp_path))
+        (tmp_path / "我喜欢编程.part1.rar").rename(tmp_path / "obfuscated")
+
+        nzf = mock.Mock(filename="obfuscated")
+        nzo = mock.Mock(finished_files=[nzf])
+        assert native_verify_set(str(tmp_path / "我喜欢编程.par2"), nzo, "我喜欢编程", str(tmp_path))
+        assert (tmp_path / "我喜欢编程.part1.rar").exists()
+        assert nzf.filename == "我喜欢编程.part1.rar"
+        nzo.renamed_file.assert_called_with({"我喜欢编程.part1.rar": "obfuscated"})
@@ -0,0 +1,85 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_nzbparser - Testing functions in nzbparser.py
+"""
+import sabnzbd.nzbstuff as nzbstuff
+from sabnzbd.config import ConfigCat
+from sabnzbd.constants import NORMAL_PRIORITY
+
+from tests.testhelper import *
+
+
+def create_nzb_data(files: int, segments: int, duplicate_every: int = 0) -> str:
+    """ Create NZB with the specified number of files and segments per file """
+    nzb = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<nzb xmlns="http://www.newzbin.com/DTD/2003/nzb">',
+        '<head><meta type="password">secret</meta><meta type="category">tv</meta></head>',
+    ]
+    for filenum in range(files):
+        if duplicate_every and filenum % duplicate_every == 1:
+            # Same file as the previous one
+            filenum -= 1
+        nzb.append(
+            '<file poster="sab" date="1600000000" subject="&quot;file%d.rar&quot; yEnc (1/%d)">' % (filenum, segments)
+        )
+        nzb.append("<groups><group>alt.binaries.test</group></groups><segments>")
+        for segment in range(1, segments + 1):
+            nzb.append('<segment bytes="750000" number="%d">%d.%d@sabnzbd</segment>' % (segment, filenum, segment))
+        nzb.append("</segments></file>")
+    nzb.append("</nzb>")
+    return "\n".join(nzb)
+
+
+@pytest.mark.usefixtures("clean_cache_dir")
+class TestNzbParser:
+    @set_config({"download_dir": SAB_CACHE_DIR})
+    def test_parse(self):
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        nzo = nzbstuff.NzbObject("test_parse", nzb=create_nzb_data(10, 5, duplicate_every=5))
+
+        # The namespace is ignored
+        assert nzo.meta == {"password": ["secret"], "category": ["tv"]}
+        assert nzo.groups == ["alt.binaries.test"]
+
+        # Duplicate files are skipped
+        assert [nzf.filename for nzf in nzo.files] == ["file%d.rar" % filenum for filenum in (0, 2, 3, 4, 5, 7, 8, 9)]
+        assert nzo.bytes == 8 * 5 * 750000
+        nzf = nzo.files[0]
+        nzf.finish_import()
+        assert [article.article for article in nzf.decodetable] == ["0.%d@sabnzbd" % i for i in range(1, 6)]
+
+    @set_config({"download_dir": SAB_CACHE_DIR})
+    def test_parse_incomplete(self):
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        with mock.patch("sabnzbd.ArticleCache", create=True), pytest.raises(ValueError):
+            nzbstuff.NzbObject("test_incomplete", nzb=create_nzb_data(3, 5)[:-20])
+
+    @set_config({"download_dir": SAB_CACHE_DIR})
+    def test_parse_many_files(self):
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        nzo = nzbstuff.NzbObject("test_many_files", nzb=create_nzb_data(200, 50, duplicate_every=20))
+
+        # Every 20th file is a duplicate of the previous one
+        assert len(nzo.files) == 190
+        assert nzo.bytes == 190 * 50 * 750000
+        assert "file21.rar" not in [nzf.filename for nzf in nzo.files]
+        nzf = [nzf for nzf in nzo.files if nzf.filename == "file198.rar"][0]
+        nzf.finish_import()
+        assert [article.article for article in nzf.decodetable] == ["198.%d@sabnzbd" % i for i in range(1, 51)]
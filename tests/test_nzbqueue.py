@@ -0,0 +1,89 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_nzbqueue - Testing functions in nzbqueue.py
+"""
+
+from tests.testhelper import *
+
+from sabnzbd.nzbqueue import NzbQueue
+
+
+class TestScanJobs:
+    @pytest.fixture
+    def download_dir(self, tmp_path):
+        for name in ("queued_job", "history_job", "pp_job", "orphan_job", "@eaDir"):
+            (tmp_path / name).mkdir()
+        (tmp_path / "not_a_folder.txt").write_bytes(b"")
+
+        history_db = mock.Mock()
+        history_db.get_active_paths.return_value = [str(tmp_path / "history_job"), ""]
+        with mock.patch.object(sabnzbd.cfg.download_dir, "get_path", return_value=str(tmp_path)), mock.patch(
+            "sabnzbd.PostProcessor", mock.Mock(get_queue=lambda: [mock.Mock(work_name="pp_job")]), create=True
+        ), mock.patch("sabnzbd.get_db_connection", return_value=history_db), mock.patch(
+            "sabnzbd.LAST_HISTORY_UPDATE", 1
+        ):
+            yield tmp_path, history_db
+
+    def test_scan_jobs(self, download_dir):
+        tmp_path, history_db = download_dir
+        queue = NzbQueue()
+        queue.__dict__["_NzbQueue__nzo_list"] = [mock.Mock(work_name="queued_job")]
+
+        assert queue.scan_jobs(all_jobs=False, action=False) == ["orphan_job"]
+        assert history_db.get_active_paths.call_count == 1
+
+        # Nothing changed, so the history is not queried again
+        assert queue.scan_jobs(all_jobs=False, action=False) == ["orphan_job"]
+        assert history_db.get_active_paths.call_count == 1
+
+        # A new history entry refreshes the folders from the history
+        with mock.patch("sabnzbd.LAST_HISTORY_UPDATE", 2):
+            queue.scan_jobs(all_jobs=False, action=False)
+        assert history_db.get_active_paths.call_count == 2
+
+        assert sorted(queue.scan_jobs(all_jobs=True, action=False)) == ["orphan_job", "queued_job"]
+
+    def test_download_folders(self, download_dir):
+        tmp_path, _ = download_dir
+        queue = NzbQueue()
+        folders = queue.download_folders()
+        assert len(folders) == 5
+        assert queue.download_folders() is folders
+
+        # Adding a folder changes the modification time of the download folder
+        new_folder = tmp_path / "new_job"
+        new_folder.mkdir()
+        os.utime(str(tmp_path), ns=(0, os.stat(str(tmp_path)).st_mtime_ns + 1000))
+        assert str(new_folder) in queue.download_folders()
+
+        # Repairs always look at the current state
+        assert queue.download_folders(refresh=True) is not folders
+
+    def test_download_folders_new_path(self, download_dir, tmp_path_factory):
+        tmp_path, _ = download_dir
+        queue = NzbQueue()
+        assert len(queue.download_folders()) == 5
+
+        # Another download folder with the same modification time
+        other_dir = tmp_path_factory.mktemp("other_download_dir")
+        (other_dir / "other_job").mkdir()
+        mtime = os.stat(str(tmp_path)).st_mtime_ns
+        os.utime(str(other_dir), ns=(mtime, mtime))
+        with mock.patch.object(sabnzbd.cfg.download_dir, "get_path", return_value=str(other_dir)):
+            assert queue.download_folders() == [str(other_dir / "other_job")]
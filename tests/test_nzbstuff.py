@@ -1,9 +1,15 @@
 """
 tests.test_nzbstuff - Testing functions in nzbstuff.py
 """
+import logging
+import pickle
+import random
+import tracemalloc
+from types import SimpleNamespace
+
 import sabnzbd.nzbstuff as nzbstuff
 from sabnzbd.config import ConfigCat
-from sabnzbd.constants import NORMAL_PRIORITY
+from sabnzbd.constants import NORMAL_PRIORITY, JOURNAL_FILE, ARTICLE_BATCH, Status
 from sabnzbd.filesystem import globber
 
 from tests.testhelper import *
@@ -51,6 +57,106 @@ class TestNZO:
         # TODO: More checks!
 
 
+@pytest.mark.usefixtures("clean_cache_dir")
+class TestJobJournal:
+    @set_config({"download_dir": SAB_CACHE_DIR})
+    def test_replay_journal(self):
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        nzo = nzbstuff.NzbObject("test_journal", nzb=create_and_read_nzb("basic_rar5"))
+        nzo.nzo_id = "SABnzbd_nzo_journal"
+        nzo.save_to_disk()
+        nzf = nzo.files[0]
+        article = nzf.decodetable[0]
+
+        # Changes are only written to the journal
+        nzo.increase_bad_articles_counter("missing_articles")
+        nzo.verify_nzf_filename(nzf, "Some.Show.S01E02.720p.rar")
+        nzo.remove_article(article, success=True)
+        assert not nzo.files
+        nzo.save_changes()
+        assert os.path.exists(os.path.join(nzo.admin_path, JOURNAL_FILE))
+
+        nzo_loaded = sabnzbd.load_data(nzo.nzo_id, nzo.admin_path, remove=False)
+        assert nzo_loaded.files[0].filename == "testfile.rar"
+        assert nzo_loaded.files[0].articles
+        nzo_loaded.replay_journal()
+
+        assert not nzo_loaded.files
+        nzf_loaded = nzo_loaded.finished_files[0]
+        assert nzf_loaded.filename == "Some.Show.S01E02.720p.rar"
+        assert not nzf_loaded.articles
+        assert nzo_loaded.bytes_downloaded == nzo.bytes_downloaded == article.bytes
+        assert nzo_loaded.bytes_tried == nzo.bytes_tried
+        assert not nzo_loaded.first_articles
+        assert nzo_loaded.nzo_info["missing_articles"] == 1
+
+        # Replaying saved the complete job again
+        assert not os.path.exists(os.path.join(nzo.admin_path, JOURNAL_FILE))
+        nzo_loaded = sabnzbd.load_data(nzo.nzo_id, nzo.admin_path, remove=False)
+        assert nzo_loaded.finished_files[0].filename == "Some.Show.S01E02.720p.rar"
+
+    def test_compact_journal(self, tmp_path):
+        journal = nzbstuff.JobJournal()
+        journal.add(journal.COUNTER, "bad_articles")
+        journal.flush(str(tmp_path))
+        journal.add(journal.COUNTER, "missing_articles")
+        assert len(journal) == 2
+
+        # Incomplete write at the end, like after a crash
+        journal.flush(str(tmp_path))
+        journal_path = os.path.join(str(tmp_path), JOURNAL_FILE)
+        with open(journal_path, "r+b") as journal_file:
+            journal_file.truncate(os.path.getsize(journal_path) - 5)
+        assert nzbstuff.JobJournal.read(str(tmp_path)) == [(1, journal.COUNTER, "bad_articles")]
+
+        journal.truncate(str(tmp_path), journal.seq)
+        assert not len(journal)
+        assert not os.path.exists(journal_path)
+        assert nzbstuff.JobJournal.read(str(tmp_path)) == []
+
+    def test_truncate_keeps_later_records(self, tmp_path):
+        journal = nzbstuff.JobJournal()
+        journal.add(journal.COUNTER, "bad_articles")
+        journal.flush(str(tmp_path))
+        saved_seq = journal.seq
+
+        # Written while the complete job was being saved
+        journal.add(journal.COUNTER, "missing_articles")
+        journal.flush(str(tmp_path))
+        journal.add(journal.COUNTER, "killed_articles")
+
+        journal.truncate(str(tmp_path), saved_seq)
+        assert len(journal) == 2
+        assert nzbstuff.JobJournal.read(str(tmp_path)) == [(2, journal.COUNTER, "missing_articles")]
+        assert journal.records == [(3, journal.COUNTER, "killed_articles")]
+
+    @set_config({"download_dir": SAB_CACHE_DIR})
+    def test_failed_save_keeps_journal(self):
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        nzo = nzbstuff.NzbObject("test_journal", nzb=create_and_read_nzb("basic_rar5"))
+        nzo.nzo_id = "SABnzbd_nzo_journal_failed"
+        nzo.save_to_disk()
+        nzo.increase_bad_articles_counter("missing_articles")
+        nzo.save_changes()
+
+        # The journal is only removed after the complete job was written
+        with mock.patch("sabnzbd.save_data", return_value=False):
+            nzo.save_to_disk()
+        assert os.path.exists(os.path.join(nzo.admin_path, JOURNAL_FILE))
+
+        # Counters that are part of the complete save are not counted again
+        nzo.save_to_disk()
+        nzo.increase_bad_articles_counter("missing_articles")
+        nzo.save_changes()
+        with open(os.path.join(nzo.admin_path, JOURNAL_FILE), "ab") as journal_file:
+            pickle.dump([(1, nzbstuff.JobJournal.COUNTER, "missing_articles")], journal_file)
+        nzo_loaded = sabnzbd.load_data(nzo.nzo_id, nzo.admin_path, remove=False)
+        nzo_loaded.replay_journal()
+        assert nzo_loaded.nzo_info["missing_articles"] == 2
+        assert nzo_loaded.bad_articles == 2
+        assert not os.path.exists(os.path.join(nzo.admin_path, JOURNAL_FILE))
+
+
 class TestNZBStuffHelpers:
     @pytest.mark.parametrize(
         "argument, name, password",
@@ -137,3 +243,159 @@ class TestNZBStuffHelpers:
     )
     def test_name_extractor(self, subject, filename):
         assert nzbstuff.name_extractor(subject) == filename
+
+
+class TestNzbFileArticles:
+    def create_nzf(self, folder: str, count: int) -> nzbstuff.NzbFile:
+        nzo = SimpleNamespace(admin_path=folder, first_articles={}, first_articles_count=0, bytes_par2=0)
+        nzf = nzbstuff.NzbFile(None, '"test.rar" yEnc (1/%d)' % count, [("0@sab", 100)], count * 100, nzo)
+        for partnum in range(1, count):
+            nzf.add_article(("%d@sab" % partnum, 100))
+        return nzf
+
+    def test_remove_article(self, tmp_path):
+        nzf = self.create_nzf(str(tmp_path), 5)
+        assert nzf.import_finished
+        assert list(nzf.nzo.first_articles) == [nzf.decodetable[0]]
+
+        # Removing keeps the order of the remaining articles
+        assert nzf.remove_article(nzf.decodetable[2], success=True) == 4
+        assert nzf.remove_article(nzf.decodetable[2], success=True) == 4
+        assert list(nzf.articles) == [nzf.decodetable[i] for i in (0, 1, 3, 4)]
+        assert nzf.bytes_left == 400
+
+        # Only the identical article is removed, not one with the same message-id
+        assert nzf.remove_article(nzbstuff.Article("1@sab", 100, nzf), success=False) == 4
+        assert nzf.bytes_left == 400
+        assert not nzf.completed
+
+        for article in nzf.decodetable:
+            nzf.remove_article(article, success=False)
+        assert nzf.completed
+
+    def test_old_job_articles_list(self, tmp_path):
+        nzf = self.create_nzf(str(tmp_path), 3)
+        state = nzf.__getstate__()
+        state["articles"] = list(state["articles"])
+        nzf_loaded = nzbstuff.NzbFile.__new__(nzbstuff.NzbFile)
+        nzf_loaded.__setstate__(state)
+        assert list(nzf_loaded.articles) == nzf.decodetable
+
+    def test_article_table(self, tmp_path):
+        nzo = SimpleNamespace(admin_path=str(tmp_path), first_articles={}, first_articles_count=0, bytes_par2=0)
+        raw_article_db = [("%d@sab" % partnum, 100 + partnum) for partnum in range(2 * ARTICLE_BATCH + 10)]
+        nzf = nzbstuff.NzbFile(None, '"test.rar" yEnc (1/10)', raw_article_db[:], 1000, nzo)
+        assert not nzf.import_finished
+        nzf.finish_import()
+
+        # Only the first batch is turned into articles
+        assert nzf.import_finished
+        assert len(nzf.articles) == ARTICLE_BATCH + 1
+        assert len(nzf.table) == ARTICLE_BATCH + 9
+        assert nzf.decodetable[0].lowest_partnum
+        assert not nzf.completed
+
+        # The table survives saving the job
+        state = pickle.loads(pickle.dumps(nzf.table))
+        assert state.take(2) == raw_article_db[ARTICLE_BATCH + 1 : ARTICLE_BATCH + 3]
+
+        # The next batch is taken when all articles are busy
+        server = SimpleNamespace(priority=0, host="test")
+        assert nzf.get_articles(server, [server], ARTICLE_BATCH + 1) == list(nzf.articles)
+        assert nzf.get_articles(server, [server], 1) == [nzf.decodetable[ARTICLE_BATCH + 1]]
+        assert len(nzf.table) == 9
+
+        # Articles left include the ones that are still in the table
+        assert nzf.remove_article(nzf.decodetable[0], success=True) == len(raw_article_db) - 1
+        taken = [(article.article, article.bytes) for article in nzf.decodetable]
+        assert taken == raw_article_db[: len(nzf.decodetable)]
+        nzf.take_articles()
+        assert nzf.table is None
+        assert [(article.article, article.bytes) for article in nzf.decodetable] == raw_article_db
+
+    def test_article_table_memory(self, tmp_path):
+        """ The table uses much less memory than the article objects, before downloading starts """
+        count = 20000
+        raw_article_db = [
+            ("part%d.%d$abcdefghijk@sabnzbd.example.com" % (partnum, partnum * 7), 768000) for partnum in range(count)
+        ]
+
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            table = nzbstuff.ArticleTable(raw_article_db)
+            table_size = tracemalloc.get_traced_memory()[0] - start
+
+            # Article objects for all segments, like when the file is imported completely
+            nzf = self.create_nzf(str(tmp_path), 1)
+            start = tracemalloc.get_traced_memory()[0]
+            for raw_article in raw_article_db:
+                nzf.add_article(raw_article)
+            articles_size = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+
+        assert len(table) == count
+        assert table_size * 3 < articles_size
+
+    def test_select_articles_batches(self, tmp_path):
+        """ Selecting in batches gives the same articles, when most files are already being downloaded """
+        nzo = nzbstuff.NzbObject.__new__(nzbstuff.NzbObject)
+        nzbstuff.TryList.__init__(nzo)
+        nzo.first_articles = {}
+        nzo.status = Status.QUEUED
+        nzo.files = []
+        for _ in range(1000):
+            nzf = self.create_nzf(str(tmp_path), 5)
+            nzf.nzo.first_articles.clear()
+            nzo.files.append(nzf)
+
+        server = SimpleNamespace(priority=0, host="test", active=True)
+        for nzf in nzo.files[:900]:
+            for article in nzf.articles:
+                article.fetcher = server
+
+        def select(fetch_limit):
+            selected = []
+            while len(selected) < 100:
+                selected.extend(nzo.get_articles(server, [server], fetch_limit))
+            # Release them again for the next selection
+            for article in selected:
+                article.fetcher = None
+                article.tries = 0
+            return selected
+
+        selected = select(1)
+        assert selected[0] is nzo.files[900].decodetable[0]
+        assert select(50) == selected
+
+    def test_benchmark_register_articles(self, tmp_path):
+        """ Register all articles of a 10k-segment file, in the slightly random order they are decoded in """
+        count = 10000
+        nzf = self.create_nzf(str(tmp_path), count)
+        articles = nzf.decodetable[:]
+        random.seed(count)
+        for pos in range(0, count, 20):
+            chunk = articles[pos : pos + 20]
+            random.shuffle(chunk)
+            articles[pos : pos + 20] = chunk
+
+        start = time.perf_counter()
+        for article in articles:
+            nzf.remove_article(article, success=True)
+        duration = time.perf_counter() - start
+        assert nzf.completed
+        assert nzf.bytes_left == 0
+
+        # Compare to the list-based bookkeeping, that had to compare message-id's
+        articles_list = nzf.decodetable[:]
+        start = time.perf_counter()
+        for article in articles:
+            if article in articles_list:
+                articles_list.remove(article)
+        list_duration = time.perf_counter() - start
+        assert not articles_list
+
+        logging.info(
+            "Registering %d articles: %.1f ms, list-based: %.1f ms", count, duration * 1000, list_duration * 1000
+        )
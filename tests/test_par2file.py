@@ -0,0 +1,99 @@
+#!/usr/bin/python3 -OO
+# Copyright 2007-2021 The SABnzbd-Team <team@sabnzbd.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+tests.test_par2file - Testing functions in par2file.py
+"""
+import hashlib
+import shutil
+import zlib
+
+from sabnzbd.par2file import *
+
+from tests.testhelper import *
+
+UNICODE_RAR_DIR = os.path.join(SAB_DATA_DIR, "unicode_rar")
+UNICODE_RAR_PAR2 = "我喜欢编程.par2"
+
+
+class TestFileHasher:
+    def test_par2_checksums(self):
+        par2slices = {}
+        md5pack = parse_par2_file(os.path.join(UNICODE_RAR_DIR, UNICODE_RAR_PAR2), {}, par2slices)
+        assert len(par2slices) == 7
+
+        for filename, (slice_size, checksums) in par2slices.items():
+            with open(os.path.join(UNICODE_RAR_DIR, filename), "rb") as rar_file:
+                data = rar_file.read()
+
+            # Blocks that don't line up with the slices, like articles
+            hasher = FileHasher(slice_size)
+            for offset in range(0, len(data), 1000):
+                hasher.update(data[offset : offset + 1000])
+            hasher.finish()
+            assert hasher.md5.digest() == md5pack[filename]
+            assert hasher.crc32 == zlib.crc32(data)
+            assert hasher.slices == checksums
+            assert not damaged_slices(checksums, hasher.slices)
+
+            # Only the slice with the damaged byte has to be repaired
+            damaged_data = bytearray(data)
+            damaged_data[slice_size + 10] ^= 0xFF
+            hasher = FileHasher(slice_size)
+            hasher.update(bytes(damaged_data))
+            hasher.finish()
+            assert damaged_slices(checksums, hasher.slices) == [1]
+
+            # Missing slices at the end are damaged too
+            assert damaged_slices(checksums, checksums[:-1]) == [len(checksums) - 1]
+
+
+class TestVerifyPar2Set:
+    @pytest.fixture
+    def workdir(self, tmp_path):
+        for filename in os.listdir(UNICODE_RAR_DIR):
+            shutil.copy(os.path.join(UNICODE_RAR_DIR, filename), str(tmp_path))
+        return tmp_path
+
+    def test_all_correct(self, workdir):
+        assert verify_par2_set(str(workdir / UNICODE_RAR_PAR2), str(workdir)) == (True, {}, 0)
+
+    def test_renamed_file(self, workdir):
+        (workdir / "我喜欢编程.part3.rar").rename(workdir / "abcdef123456")
+        assert verify_par2_set(str(workdir / UNICODE_RAR_PAR2), str(workdir)) == (
+            True,
+            {"我喜欢编程.part3.rar": "abcdef123456"},
+            0,
+        )
+
+    def test_damaged_and_missing_files(self, workdir):
+        rar_path = workdir / "我喜欢编程.part2.rar"
+        data = bytearray(rar_path.read_bytes())
+        data[5000] ^= 0xFF
+        rar_path.write_bytes(bytes(data))
+        assert verify_par2_set(str(workdir / UNICODE_RAR_PAR2), str(workdir)) == (False, {}, 1)
+
+        # The last file has 6 slices
+        (workdir / "我喜欢编程.part7.rar").unlink()
+        assert verify_par2_set(str(workdir / UNICODE_RAR_PAR2), str(workdir)) == (False, {}, 7)
+
+    def test_empty_file(self, workdir):
+        (workdir / "我喜欢编程.part1.rar").write_bytes(b"")
+        assert verify_par2_set(str(workdir / UNICODE_RAR_PAR2), str(workdir)) == (False, {}, 8)
+
+    def test_not_a_par2_file(self, workdir):
+        assert verify_par2_set(str(workdir / "我喜欢编程.part1.rar"), str(workdir)) == (False, {}, 0)
@@ -9,9 +9,12 @@ tests.test_postproc- Tests of various functions in newspack, among which rar_ren
 """
 
 import shutil
+import threading
 from distutils.dir_util import copy_tree
 from unittest import mock
 
+from sabnzbd.config import ConfigCat
+from sabnzbd.constants import NORMAL_PRIORITY
 from sabnzbd.postproc import *
 from tests.testhelper import *
 
@@ -90,3 +93,131 @@ class TestPostProc:
         expected_filename_matches = {"*.rar": 0, "*-*-*-*-*": 8}
         # 0 files should have been renamed
         assert deobfuscate_dir(sourcedir, expected_filename_matches) == 0
+
+
+class TestPostProcessingStages:
+    @staticmethod
+    def wait_for(condition, timeout=10):
+        start = time.time()
+        while not condition() and time.time() - start < timeout:
+            time.sleep(0.05)
+        return condition()
+
+    @set_config({"pp_verify_workers": 2})
+    def test_jobs_overlap(self):
+        release_big_job = threading.Event()
+        finished = []
+        big_process = mock.Mock()
+
+        def verify(job):
+            if job.nzo.final_name == "big":
+                # Like an external par2 process started by the worker
+                sabnzbd.PostProcessor.external_process = big_process
+                release_big_job.wait(10)
+            return True
+
+        def finish(job):
+            finished.append(job.nzo.final_name)
+
+        big_job = mock.Mock(final_name="big", nzo_id="SABnzbd_nzo_big", direct_unpacker=None, to_be_removed=False)
+        small_job = mock.Mock(final_name="small", nzo_id="SABnzbd_nzo_small", direct_unpacker=None, to_be_removed=False)
+
+        with mock.patch("sabnzbd.load_admin", return_value=None), mock.patch("sabnzbd.save_admin"), mock.patch(
+            "sabnzbd.history_updated"
+        ), mock.patch("sabnzbd.Downloader", create=True), mock.patch("sabnzbd.postproc.handle_empty_queue"), mock.patch(
+            "sabnzbd.utils.checkdir.isFAT", return_value=False
+        ), mock.patch.object(
+            PostProcessingJob, "verify", verify
+        ), mock.patch.object(
+            PostProcessingJob, "unpack", lambda job: True
+        ), mock.patch.object(
+            PostProcessingJob, "move", lambda job: True
+        ), mock.patch.object(
+            PostProcessingJob, "script", lambda job: True
+        ), mock.patch.object(
+            PostProcessingJob, "finish", finish
+        ):
+            postprocessor = PostProcessor()
+            with mock.patch("sabnzbd.PostProcessor", postprocessor, create=True):
+                postprocessor.start()
+                postprocessor.process(big_job)
+                postprocessor.process(small_job)
+
+                # The small job doesn't have to wait for the repair of the big job
+                assert self.wait_for(lambda: finished == ["small"])
+                assert postprocessor.stage_info()[0]["busy"] == 1
+                assert not postprocessor.empty()
+
+                # Only the process of the canceled job is killed
+                postprocessor.cancel_pp(small_job.nzo_id)
+                assert not big_process.kill.called
+                postprocessor.cancel_pp(big_job.nzo_id)
+                assert big_process.kill.called
+
+                release_big_job.set()
+                assert self.wait_for(lambda: len(finished) == 2)
+                assert self.wait_for(postprocessor.empty)
+
+                postprocessor.stop()
+                postprocessor.join()
+
+        assert not postprocessor.is_alive()
+        for stage in postprocessor.stage_info():
+            assert stage["jobs"] == 2
+            assert stage["busy"] == 0
+            assert stage["queue"] == 0
+
+    @pytest.mark.usefixtures("clean_cache_dir")
+    @set_config({"download_dir": SAB_CACHE_DIR, "complete_dir": SAB_COMPLETE_DIR})
+    def test_real_jobs(self):
+        """ Real jobs pass through the stages, with the real script step """
+        ConfigCat("*", {"pp": 3, "script": "None", "priority": NORMAL_PRIORITY})
+        complete_job = NzbObject("complete_job", nzb=create_and_read_nzb("basic_rar5"))
+        more_pars_job = NzbObject("more_pars_job", nzb=create_and_read_nzb("basic_rar5"))
+        crashed_job = NzbObject("crashed_job", nzb=create_and_read_nzb("basic_rar5"))
+        finished = {}
+
+        def verify(job):
+            if job.nzo is crashed_job:
+                raise OSError
+            # A job that needs more par2 files leaves post-processing
+            return job.nzo is not more_pars_job
+
+        def move(job):
+            job.workdir_complete = job.workdir
+            return True
+
+        def finish(job):
+            finished[job.nzo.final_name] = (job.all_ok, job.script_name, job.nzo.status)
+
+        with mock.patch("sabnzbd.load_admin", return_value=None), mock.patch("sabnzbd.save_admin"), mock.patch(
+            "sabnzbd.history_updated"
+        ), mock.patch("sabnzbd.Downloader", create=True), mock.patch("sabnzbd.NzbQueue", create=True), mock.patch(
+            "sabnzbd.postproc.handle_empty_queue"
+        ), mock.patch(
+            "sabnzbd.postproc.notifier"
+        ), mock.patch(
+            "sabnzbd.utils.checkdir.isFAT", return_value=False
+        ), mock.patch.object(
+            PostProcessingJob, "verify", verify
+        ), mock.patch.object(
+            PostProcessingJob, "unpack", lambda job: True
+        ), mock.patch.object(
+            PostProcessingJob, "move", move
+        ), mock.patch.object(
+            PostProcessingJob, "finish", finish
+        ):
+            postprocessor = PostProcessor()
+            with mock.patch("sabnzbd.PostProcessor", postprocessor, create=True):
+                postprocessor.start()
+                for nzo in (complete_job, more_pars_job, crashed_job):
+                    postprocessor.process(nzo)
+                assert self.wait_for(lambda: len(finished) == 2 and postprocessor.empty())
+                postprocessor.stop()
+                postprocessor.join()
+
+        assert finished["complete_job"] == (True, "", Status.QUEUED)
+        # A crashing step still results in a failed job in the history
+        assert finished["crashed_job"] == (False, "None", Status.FAILED)
+        assert "more_pars_job" not in finished
+        assert not postprocessor.history_queue